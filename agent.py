@@ -1,12 +1,36 @@
-from openai import OpenAI
+from detectors.cache import ResultCache, CACHE_ENABLED
+from utils import metrics
+from typing import Any, List, Optional, Tuple
+import asyncio
+import random
+import time
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+EXPLAIN_MODEL = os.getenv("SPECTRA_EXPLAIN_MODEL", "gpt-4o")
+EXPLAIN_CONCURRENCY = int(os.getenv("SPECTRA_EXPLAIN_CONCURRENCY", "4"))
+EXPLAIN_RATE = float(os.getenv("SPECTRA_EXPLAIN_RPS", "2"))
+EXPLAIN_BURST = int(os.getenv("SPECTRA_EXPLAIN_BURST", "4"))
+EXPLAIN_RETRIES = int(os.getenv("SPECTRA_EXPLAIN_RETRIES", "4"))
+EXPLAIN_THRESHOLD = float(os.getenv("SPECTRA_EXPLAIN_THRESHOLD", "0.0"))
+SKIPPED_EXPLANATION = "Probabilidad IA baja: explicación omitida."
 
-def explain_file(code: str, prob_ai: float, attribution: str) -> str:
-    prompt = f"""
+_client = None
+
+
+def _retryable_errors() -> tuple:
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+
+def build_prompt(code: str, prob_ai: float, attribution: str) -> str:
+    return f"""
 Eres un profesor experto en programación. Analiza este código Python.
 
 Probabilidad IA: {round(prob_ai * 100, 1)}%
@@ -20,12 +44,105 @@ Explica en español, claro y educativo (máx 4 oraciones):
 Código:
 {code[:3000]}
 """
+
+
+def explain_file(code: str, prob_ai: float, attribution: str) -> str:
+    global _client
+    prompt = build_prompt(code, prob_ai, attribution)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300
-        )
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        with metrics.timed("explanation"):
+            response = _client.chat.completions.create(
+                model=EXPLAIN_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=300
+            )
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"Error con OpenAI: {str(e)}"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class ExplanationStage:
+    def __init__(self, client: Optional[Any] = None,
+                 concurrency: int = EXPLAIN_CONCURRENCY,
+                 rate: float = EXPLAIN_RATE,
+                 burst: int = EXPLAIN_BURST,
+                 retries: int = EXPLAIN_RETRIES,
+                 threshold: float = EXPLAIN_THRESHOLD,
+                 model: str = EXPLAIN_MODEL,
+                 use_cache: bool = CACHE_ENABLED):
+        self.client = client
+        self.model = model
+        self.retries = retries
+        self.threshold = threshold
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.cache = ResultCache(f"explain|{model}|prompt-v1", table="explanations") if use_cache else None
+
+    async def explain(self, code: str, prob_ai: float, attribution: str) -> str:
+        if prob_ai < self.threshold:
+            return SKIPPED_EXPLANATION
+
+        # Misma entrada y mismo tramo de probabilidad (décimas) -> misma explicación.
+        # La caché es SQLite: get/put van a un hilo para no bloquear el bucle de eventos.
+        key = self.cache.key(code, round(prob_ai, 1)) if self.cache else None
+        if key:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached["text"]
+
+        try:
+            with metrics.timed("explanation"):
+                text = await self._complete(build_prompt(code, prob_ai, attribution))
+        except Exception as e:
+            return f"Error con OpenAI: {str(e)}"
+        if key:
+            await asyncio.to_thread(self.cache.put, key, {"text": text})
+        return text
+
+    async def explain_many(self, items: List[Tuple[str, float, str]]) -> List[str]:
+        return list(await asyncio.gather(*(self.explain(*item) for item in items)))
+
+    async def _complete(self, prompt: str) -> str:
+        if self.client is None:
+            from openai import AsyncOpenAI
+            # Respeta OPENAI_BASE_URL, lo que permite probar contra un servidor local compatible.
+            self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        retryable = _retryable_errors()
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if self._bucket:
+                    await self._bucket.acquire()
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=300
+                    )
+                    return response.choices[0].message.content.strip()
+                except retryable:
+                    if attempt == self.retries:
+                        raise
+                    await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt) + random.uniform(0, 0.25))
@@ -1,21 +1,136 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import FileResponse
+import time
+
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from utils.zip_parser import extract_python_files
-from detectors.ensemble import EnsembleDetector
-from agent import explain_file
+from contextlib import asynccontextmanager
+from utils.zip_parser import iter_python_files, count_python_files, check_zip, ZipLimitError
+from utils.job_queue import JobQueue, QueueFullError
+from utils.report import (FORMATS, FILENAMES, STREAMING_FORMATS, XlsxReport, default_format,
+                          iter_file, iter_report, stream_report)
+from typing import Any, Callable, Dict, Optional
+from detectors.executor import InferenceExecutor
+from pipeline import analyze_files, empty_result, IncrementalRun
+from utils.manifest import load_manifest, Manifest
+from agent import ExplanationStage
+from utils import startup, metrics, dedup
+import asyncio
 import os
-import tempfile
-from datetime import datetime
 from dotenv import load_dotenv
 
-try:
-    import pandas as pd
-except ImportError:
-    pd = None
-
 load_dotenv()
-app = FastAPI(title="CodeGuard AI", version="1.0.0")
+JOB_WORKERS = int(os.getenv("SPECTRA_JOB_WORKERS", "2"))
+JOB_RESULT_BATCH = int(os.getenv("SPECTRA_JOB_RESULT_BATCH", "32"))
+WARMUP = os.getenv("SPECTRA_WARMUP", "0") == "1"
+
+executor = InferenceExecutor()
+explainer = ExplanationStage()
+jobs = JobQueue()
+_job_available = asyncio.Event()
+_background = set()
+
+
+def _collect_metrics():
+    metrics.QUEUE_DEPTH.set(jobs.depth())
+    metrics.observe_cache("results", executor.cache_stats())
+    if explainer.cache:
+        metrics.observe_cache("explanations", explainer.cache.stats())
+    if dedup.near_duplicates.loaded:
+        # Aciertos de dedup: en la misma subida (memory_hits) o en el corpus persistente (disk_hits).
+        stats = dedup.near_duplicates.get().stats()
+        metrics.observe_cache("dedup", {"memory_hits": stats["upload_hits"], "disk_hits": stats["corpus_hits"],
+                                        "misses": stats["scored"], "evictions": stats["evictions"],
+                                        "hit_rate": stats["hit_rate"]})
+    memory = executor.memory()
+    for model, size in memory["models"].items():
+        metrics.MODEL_MEMORY.set(size, model=model)
+    for pid, rss in memory["workers"].items():
+        metrics.PROCESS_MEMORY.set(rss, process=f"worker-{pid}")
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def _report_format(requested: Optional[str]) -> str:
+    fmt = (requested or default_format()).lower()
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato desconocido '{fmt}'. Opciones: {', '.join(FORMATS)}")
+    return fmt
+
+
+def _report_headers(fmt: str) -> dict:
+    if fmt in FILENAMES:
+        return {"Content-Disposition": f'attachment; filename="{FILENAMES[fmt]}"'}
+    # Sin buffering intermedio: cada resultado llega al cliente en cuanto se emite.
+    return {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _run_job(job_id: str):
+    # Todo el acceso a SQLite va a un hilo; las filas se insertan por lotes con un commit cada uno.
+    zip_path = str(jobs.zip_path(job_id))
+    total = await asyncio.to_thread(count_python_files, zip_path)
+    await asyncio.to_thread(jobs.set_total, job_id, total)
+    seq = 0
+    pending = []
+    async for row in analyze_files(iter_python_files(zip_path), executor, explainer):
+        pending.append(row)
+        if len(pending) >= JOB_RESULT_BATCH:
+            await asyncio.to_thread(jobs.add_results, job_id, seq, pending)
+            seq += len(pending)
+            pending = []
+    await asyncio.to_thread(jobs.add_results, job_id, seq, pending)
+    await asyncio.to_thread(jobs.finish, job_id)
+
+
+async def _job_worker():
+    while True:
+        job_id = await asyncio.to_thread(jobs.claim)
+        if job_id is None:
+            _job_available.clear()
+            try:
+                await asyncio.wait_for(_job_available.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _run_job(job_id)
+        except Exception as e:
+            await asyncio.to_thread(jobs.fail, job_id, str(e))
+
+
+async def _warmup():
+    start = time.perf_counter()
+    try:
+        await executor.warmup()
+        startup.mark("warmup_s", time.perf_counter() - start)
+    except Exception as e:
+        startup.mark("warmup_failed_s", time.perf_counter() - start)
+        print(f"[ERROR] warmup: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(jobs.recover)
+    # El arranque no espera a los modelos: el warmup (opcional) corre en segundo plano.
+    if WARMUP:
+        _spawn(_warmup())
+    workers = [asyncio.create_task(_job_worker()) for _ in range(JOB_WORKERS)]
+    yield
+    for task in workers:
+        task.cancel()
+    # Cierra el pool o, en modo hilo, los planificadores de micro-batching de GPT-2 y CodeBERT.
+    executor.shutdown()
+
+
+app = FastAPI(title="CodeGuard AI", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,60 +140,160 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-detector = EnsembleDetector()
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # Traza por petición (cabecera X-Spectra-Trace: 1 o SPECTRA_TRACE=1) devuelta en Server-Timing.
+    # Las cabeceras salen antes que el cuerpo: en los informes en streaming (CSV/NDJSON/SSE) las
+    # etapas aún no han corrido y los tiempos van en el evento final (ver _with_timings).
+    if not (metrics.TRACE_ALWAYS or request.headers.get("x-spectra-trace") == "1"):
+        return await call_next(request)
+    events = metrics.start_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    if events:
+        # Sin etapas medidas (p. ej. /health) no se añade la cabecera.
+        response.headers["Server-Timing"] = metrics.server_timing(events, time.perf_counter() - start)
+    return response
+
+
+def _with_timings(summary: Optional[Callable[[], Dict[str, Any]]]) -> Optional[Callable[[], Dict[str, Any]]]:
+    # Con traza activa, el resumen final del streaming (línea "summary" en NDJSON, evento "done" en SSE)
+    # lleva los tiempos por etapa en "server_timing" (ms).
+    events = metrics.current_trace()
+    if events is None:
+        return summary
+    start = time.perf_counter()
+
+    def with_timings() -> Dict[str, Any]:
+        timings = {**metrics.stage_timings(events), "total": round((time.perf_counter() - start) * 1000.0, 1)}
+        return {**(summary() if summary else {}), "server_timing": timings}
+    return with_timings
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    if executor.ready:
+        state = "ready"
+    elif executor.warming:
+        state = "warming"
+    else:
+        # Sin warmup los modelos se cargan con la primera petición.
+        state = "lazy"
+    body = {"status": state, **startup.status()}
+    return JSONResponse(body, status_code=503 if state == "warming" else 200)
+
+@app.post("/warmup", status_code=202)
+async def warmup():
+    if not executor.ready and not executor.warming:
+        _spawn(_warmup())
+    return {"status": "ready" if executor.ready else "warming"}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return executor.cache_stats()
+
+@app.post("/clusters")
+async def clusters(file: UploadFile = File(...), threshold: float = Query(dedup.DEDUP_THRESHOLD, gt=0.0, le=1.0)):
+    # Informe de casi duplicados (tipo plagio) sin ejecutar los modelos: solo MinHash/LSH.
+    try:
+        await asyncio.to_thread(check_zip, file.file)
+        index = await asyncio.to_thread(dedup.near_duplicates.get)
+        return await asyncio.to_thread(dedup.cluster_report, iter_python_files(file.file), index, threshold)
+    except ZipLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
 @app.post("/analyze-repo")
-async def analyze_repo(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp:
-        tmp.write(await file.read())
-        zip_path = tmp.name
-
-    python_files = extract_python_files(zip_path)
-    results = []
-
-    for py_file in python_files:
-        code = py_file["content"]
-        res = detector.predict(code)
-        prob_ai = res.get("ai_probability", 0.0)
-        attribution = detector.attribute_llm(res)
-        explanation = explain_file(code, prob_ai, attribution)
-        comps = res.get("components", {})
-
-        results.append({
-            "file": py_file["path"],
-            "ai_probability": round(prob_ai * 100, 2),
-            "perplexity_score": comps.get("perplexity", {}).get("score", 0.0),
-            "ast_score": comps.get("ast", {}).get("score", 0.0),
-            "codebert_score": comps.get("codebert", {}).get("score", 0.0),
-            "attribution": attribution,
-            "explanation": explanation,
-        })
-
-    if not results:
-        results = [{
-            "file": "(ningún .py encontrado)",
-            "ai_probability": 0.0,
-            "attribution": "",
-            "explanation": "No se encontraron archivos .py en el ZIP o el ZIP está corrupto."
-        }]
-
-    tmpdir = tempfile.gettempdir()
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-
-    if pd:
-        output_path = os.path.join(tmpdir, f"results_{timestamp}.xlsx")
-        df = pd.DataFrame(results)
-        df.to_excel(output_path, index=False)
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        filename = "resultados.xlsx"
+async def analyze_repo(file: UploadFile = File(...), base: Optional[UploadFile] = File(None),
+                       report_format: Optional[str] = Query(None, alias="format")):
+    # Con base (manifiesto o informe NDJSON previo) solo se puntúan los archivos nuevos o modificados.
+    fmt = "manifest" if (report_format or "").lower() == "manifest" else _report_format(report_format)
+    try:
+        await asyncio.to_thread(check_zip, file.file)
+    except ZipLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    incremental = None
+    summary = None
+    if base is not None or fmt == "manifest":
+        try:
+            manifest = load_manifest(await base.read()) if base is not None else Manifest()
+        except (ValueError, KeyError, AttributeError) as e:
+            raise HTTPException(status_code=400, detail=f"Manifiesto base inválido: {e}")
+        incremental = IncrementalRun(manifest, executor.version)
+        rows = incremental.run(iter_python_files(file.file), executor, explainer)
+        summary = incremental.summary
     else:
-        output_path = os.path.join(tmpdir, f"results_{timestamp}.csv")
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write("file,ai_probability,attribution,explanation\n")
-            for r in results:
-                f.write(f"{r['file']},{r['ai_probability']},{r['attribution']},{r['explanation']}\n")
-        media_type = "text/csv"
-        filename = "resultados.csv"
-
-    os.unlink(zip_path)
-    return FileResponse(output_path, media_type=media_type, filename=filename)
\ No newline at end of file
+        rows = analyze_files(iter_python_files(file.file), executor, explainer)
+
+    if fmt in STREAMING_FORMATS:
+        body = stream_report(rows, fmt, empty_result(), (ZipLimitError,), _with_timings(summary))
+        return StreamingResponse(body, media_type=FORMATS[fmt], headers=_report_headers(fmt))
+
+    report = None if fmt == "manifest" else XlsxReport()
+    try:
+        async for row in rows:
+            if report is not None:
+                report.append(row)
+    except ZipLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if fmt == "manifest":
+        return JSONResponse(incremental.manifest())
+
+    if not report.rows:
+        report.append(empty_result())
+    if summary:
+        report.add_summary(summary())
+    # El libro se genera en un hilo y se envía por trozos desde un temporal (ver XlsxReport.finish_file).
+    body = await asyncio.to_thread(report.finish_file)
+    return StreamingResponse(iter_file(body), media_type=FORMATS[fmt], headers=_report_headers(fmt))
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    try:
+        job_id = await asyncio.to_thread(jobs.submit, file.file, file.filename or "")
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    _job_available.set()
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    job["progress"] = round(job["done"] / job["total"], 4) if job["total"] else 0.0
+    return job
+
+@app.get("/jobs/{job_id}/report")
+def job_report(job_id: str, report_format: Optional[str] = Query(None, alias="format")):
+    fmt = _report_format(report_format)
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado.")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"] or "El análisis falló.")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"El trabajo aún está en estado '{job['status']}'.")
+
+    if fmt in STREAMING_FORMATS:
+        return StreamingResponse(iter_report(jobs.iter_results(job_id), fmt, empty_result()),
+                                 media_type=FORMATS[fmt], headers=_report_headers(fmt))
+
+    report = XlsxReport()
+    for row in jobs.iter_results(job_id):
+        report.append(row)
+    if not report.rows:
+        report.append(empty_result())
+    return StreamingResponse(iter_file(report.finish_file()), media_type=FORMATS[fmt], headers=_report_headers(fmt))
+
+
+startup.mark("api_import_s", time.perf_counter() - _import_start)
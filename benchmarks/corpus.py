@@ -0,0 +1,134 @@
+import argparse
+import random
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Tamaños aproximados (número de funciones por archivo) para cubrir todos los regímenes del detector:
+# archivos diminutos, típicos, largos y mayores que la ventana de 1024 tokens de GPT-2.
+SIZE_CLASSES = {"tiny": (1, 2), "small": (3, 8), "medium": (10, 30), "large": (40, 90)}
+_SKIP_DIRS = {".git", ".venv", "venv", "__pycache__", "node_modules", "data"}
+
+_NOUNS = ["user", "order", "item", "record", "value", "path", "config", "token", "buffer", "result"]
+_VERBS = ["load", "parse", "compute", "update", "validate", "build", "render", "merge", "filter", "save"]
+
+
+def _human_function(rng: random.Random, idx: int) -> str:
+    name = f"{rng.choice(_VERBS)}_{rng.choice(_NOUNS)[:3]}{idx}"
+    var = rng.choice("xyzabn")
+    body = [f"def {name}({var}, n=10):"]
+    if rng.random() < 0.4:
+        body.append(f"    # TODO revisar {rng.choice(_NOUNS)}")
+    body.append("    acc = []")
+    body.append(f"    for i in range(n):")
+    if rng.random() < 0.5:
+        body.append(f"        if i % {rng.randint(2, 5)} == 0: continue")
+    body.append(f"        acc.append({var} * i + {rng.randint(0, 99)})")
+    if rng.random() < 0.3:
+        body.append("    print(len(acc))  # debug")
+    body.append("    return acc")
+    return "\n".join(body)
+
+
+def _ai_function(rng: random.Random, idx: int) -> str:
+    noun = rng.choice(_NOUNS)
+    verb = rng.choice(_VERBS)
+    return "\n".join([
+        f"def {verb}_{noun}_collection_{idx}(input_{noun}s: List[int], threshold: int = {rng.randint(1, 50)}) -> List[int]:",
+        '    """',
+        f"    {verb.capitalize()} the provided {noun} collection and return the processed values.",
+        "",
+        "    Args:",
+        f"        input_{noun}s: The list of {noun} values to process.",
+        "        threshold: The minimum value that will be kept.",
+        "",
+        "    Returns:",
+        "        A new list containing the processed values.",
+        '    """',
+        "    processed_values: List[int] = []",
+        f"    for current_value in input_{noun}s:",
+        "        if current_value >= threshold:",
+        "            processed_values.append(current_value * 2)",
+        "        else:",
+        "            processed_values.append(current_value)",
+        "    return processed_values",
+    ])
+
+
+def synthetic_file(rng: random.Random, size: str, ai: bool) -> str:
+    low, high = SIZE_CLASSES[size]
+    header = "from typing import List\n\n\n" if ai else "import os, sys\n\n"
+    make = _ai_function if ai else _human_function
+    return header + "\n\n\n".join(make(rng, i) for i in range(rng.randint(low, high))) + "\n"
+
+
+def synthetic_corpus(files: int = 64, seed: int = 0, sizes: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    # Determinista para una semilla dada: el mismo corpus en todas las ejecuciones y commits.
+    rng = random.Random(seed)
+    sizes = sizes or list(SIZE_CLASSES)
+    corpus = []
+    for i in range(files):
+        size = sizes[i % len(sizes)]
+        ai = i % 2 == 1
+        label = "generated" if ai else "human"
+        corpus.append({"path": f"synthetic/{size}/{label}_{i:04d}.py", "content": synthetic_file(rng, size, ai)})
+    return corpus
+
+
+def bundled_corpus(root: str = ".") -> List[Dict[str, str]]:
+    # El propio código del proyecto: archivos Python reales de tamaños variados.
+    corpus = []
+    for path in sorted(Path(root).rglob("*.py")):
+        if _SKIP_DIRS.intersection(path.parts):
+            continue
+        try:
+            corpus.append({"path": str(path.relative_to(root)), "content": path.read_text(encoding="utf-8")})
+        except (OSError, UnicodeDecodeError):
+            continue
+    return corpus
+
+
+def load_corpus(kind: str = "synthetic", files: int = 64, seed: int = 0) -> List[Dict[str, str]]:
+    if kind == "synthetic":
+        return synthetic_corpus(files, seed)
+    if kind == "bundled":
+        return bundled_corpus()
+    if kind == "mixed":
+        return synthetic_corpus(files, seed) + bundled_corpus()
+    # Cualquier otro valor se interpreta como ruta a un ZIP.
+    from utils.zip_parser import extract_python_files
+    return extract_python_files(kind)
+
+
+def describe(corpus: List[Dict[str, str]]) -> Dict[str, int]:
+    sizes = sorted(len(f["content"]) for f in corpus)
+    if not sizes:
+        return {"files": 0, "bytes": 0}
+    return {
+        "files": len(sizes),
+        "bytes": sum(sizes),
+        "min_bytes": sizes[0],
+        "median_bytes": sizes[len(sizes) // 2],
+        "max_bytes": sizes[-1],
+    }
+
+
+def write_zip(corpus: List[Dict[str, str]], out: str) -> str:
+    Path(out).parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for f in corpus:
+            zf.writestr(f["path"], f["content"])
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera el corpus de benchmark como ZIP")
+    parser.add_argument("--corpus", default="synthetic", help="synthetic | bundled | mixed")
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="data/benchmarks/corpus.zip")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.files, args.seed)
+    write_zip(corpus, args.out)
+    print(f"[OK] {len(corpus)} archivos en {args.out}: {describe(corpus)}")
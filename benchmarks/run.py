@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import describe, load_corpus
+from utils.batching import chunked
+
+RESULTS_DIR = Path(os.getenv("SPECTRA_BENCH_DIR", "data/benchmarks"))
+TOLERANCE = float(os.getenv("SPECTRA_BENCH_TOLERANCE", "0.15"))
+STUB_LATENCY = float(os.getenv("SPECTRA_BENCH_STUB_LATENCY", "0.05"))
+
+# Métricas comparadas con la línea base: (campo, True si más alto es mejor).
+_CHECKS = [("files_per_s", True), ("p95_ms", False)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def summarize(latencies: List[float], files: int) -> Dict[str, float]:
+    arr = np.asarray(latencies) * 1000.0
+    total_s = float(arr.sum()) / 1000.0
+    return {
+        "batches": len(arr),
+        "files": files,
+        "files_per_s": round(files / total_s, 2) if total_s > 0 else 0.0,
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def time_batches(fn: Callable[[List[str]], Any], codes: List[str], batch_size: int,
+                 repeat: int = 1, warmup: int = 1) -> Dict[str, float]:
+    batches = list(chunked(codes, batch_size))
+    for batch in batches[:warmup]:
+        fn(batch)
+    latencies = []
+    for _ in range(repeat):
+        for batch in batches:
+            start = time.perf_counter()
+            fn(batch)
+            latencies.append(time.perf_counter() - start)
+    return summarize(latencies, len(codes) * repeat)
+
+
+def bench_models(detector) -> Dict[str, Any]:
+    from utils import startup
+
+    detector.warmup()
+    components = startup.status()["components"]
+    return {
+        "perplexity_s": components["perplexity"]["load_seconds"],
+        "codebert_s": components["codebert"]["load_seconds"],
+        "rss_after_load_mb": peak_rss_mb(),
+    }
+
+
+def bench_explanations(codes: List[str], concurrency: int, latency: float = STUB_LATENCY) -> Dict[str, Any]:
+    # Etapa de explicaciones contra el servidor local compatible con OpenAI: mide la sobrecarga
+    # del cliente, el semáforo y la recogida asíncrona sin depender de la red ni de la cuota.
+    from openai import AsyncOpenAI
+    from agent import ExplanationStage
+    from utils.openai_stub import start_stub
+
+    server = start_stub(latency=latency)
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        async def run() -> Dict[str, Any]:
+            client = AsyncOpenAI(api_key="bench", base_url=base_url, max_retries=0)
+            stage = ExplanationStage(client=client, concurrency=concurrency, rate=0, use_cache=False)
+            latencies = []
+
+            async def timed(code: str):
+                start = time.perf_counter()
+                await stage.explain(code, 0.9, "GPT-4")
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(timed(code) for code in codes))
+            wall = time.perf_counter() - start
+            await client.close()
+            report = summarize(latencies, len(codes))
+            report["files_per_s"] = round(len(codes) / wall, 2) if wall > 0 else 0.0
+            return report
+
+        report = asyncio.run(run())
+    finally:
+        server.shutdown()
+    report.update({"concurrency": concurrency, "stub_latency_ms": round(latency * 1000.0, 1)})
+    return report
+
+
+def run_benchmark(corpus: List[Dict[str, str]], batch_sizes: List[int], threads: List[int],
+                  repeat: int = 1, explain_concurrency: int = 4, skip_explain: bool = False) -> Dict[str, Any]:
+    import torch
+
+    from detectors.ensemble import EnsembleDetector
+    from detectors.settings import FEATURE_WORKERS
+    from utils.features import extract_features_batch
+
+    codes = [f["content"] for f in corpus]
+    detector = EnsembleDetector(use_cache=False)
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "version": detector.version,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "corpus": describe(corpus),
+        "load": bench_models(detector),
+        "runs": [],
+    }
+
+    components = {
+        "perplexity": detector.perplexity.get_scores_detailed,
+        "codebert": detector.classifier.predict_proba_batch,
+        "ast": lambda batch: extract_features_batch(batch, FEATURE_WORKERS),
+        "ensemble": detector.predict_batch,
+    }
+    for n_threads in threads:
+        torch.set_num_threads(n_threads)
+        for batch_size in batch_sizes:
+            run = {"threads": n_threads, "batch_size": batch_size, "components": {}}
+            for name, fn in components.items():
+                run["components"][name] = time_batches(fn, codes, batch_size, repeat)
+            report["runs"].append(run)
+            ens = run["components"]["ensemble"]
+            print(f"[OK] threads={n_threads} batch={batch_size}: {ens['files_per_s']} archivos/s, p95 {ens['p95_ms']} ms",
+                  file=sys.stderr)
+
+    if not skip_explain:
+        report["explanation"] = bench_explanations(codes, explain_concurrency)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def _metric_pairs(report: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    pairs = {}
+    for run in report.get("runs", []):
+        for name, stats in run["components"].items():
+            pairs[f"threads={run['threads']}|batch={run['batch_size']}|{name}"] = stats
+    if "explanation" in report:
+        pairs["explanation"] = report["explanation"]
+    return pairs
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = TOLERANCE) -> List[str]:
+    regressions = []
+    current = _metric_pairs(report)
+    for key, base in _metric_pairs(baseline).items():
+        if key not in current:
+            continue
+        for field, higher_is_better in _CHECKS:
+            old, new = base.get(field), current[key].get(field)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{key} {field}: {old} -> {new} ({change:+.1%})")
+    for field in ("peak_rss_mb",):
+        old, new = baseline.get(field), report.get(field)
+        if old and new and (new - old) / old > tolerance:
+            regressions.append(f"{field}: {old} -> {new} ({(new - old) / old:+.1%})")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento de los detectores")
+    parser.add_argument("--corpus", default="synthetic", help="synthetic | bundled | mixed | ruta a un ZIP")
+    parser.add_argument("--files", type=int, default=64, help="Archivos del corpus sintético")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--threads", type=_int_list, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--explain-concurrency", type=int, default=4)
+    parser.add_argument("--skip-explain", action="store_true")
+    parser.add_argument("--output", default=None, help="Ruta del JSON de resultados")
+    parser.add_argument("--baseline", default=None, help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.files, args.seed)
+    report = run_benchmark(corpus, args.batch_sizes, sorted(set(args.threads)), args.repeat,
+                           args.explain_concurrency, args.skip_explain)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        report["baseline"] = args.baseline
+
+    output = Path(args.output or RESULTS_DIR / f"bench-{report['meta']['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"[OK] Resultados en {output}", file=sys.stderr)
+
+    if report.get("regressions"):
+        for line in report["regressions"]:
+            print(f"[REGRESIÓN] {line}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,213 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+import numpy as np
+import torch
+from transformers import GPT2LMHeadModel, AutoModelForSequenceClassification
+from transformers.pytorch_utils import Conv1D
+from .settings import BACKEND, ONNX_DIR, ONNX_THREADS
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+BACKENDS = ("torch", "int8", "onnx")
+
+MODELS = {
+    "gpt2": GPT2LMHeadModel,
+    "microsoft/codebert-base": AutoModelForSequenceClassification,
+}
+
+
+def onnx_path(name: str) -> Path:
+    return ONNX_DIR / name.replace("/", "__") / "model.onnx"
+
+
+class OnnxModel:
+    def __init__(self, path: Path):
+        if ort is None:
+            raise ImportError("El backend 'onnx' requiere onnxruntime (pip install onnxruntime).")
+        if not path.exists():
+            raise FileNotFoundError(f"No existe {path}; ejecuta: python -m detectors.backends export")
+        options = ort.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.size = path.stat().st_size
+        self.outputs = [o.name for o in self.session.get_outputs()]
+        shapes = {o.name: o.shape for o in self.session.get_outputs()}
+        dim = shapes.get("sentence_embedding", [None, None])[-1]
+        self.hidden_size = dim if isinstance(dim, int) else None
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask=None, **_):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        values = self.session.run(None, {
+            "input_ids": input_ids.cpu().numpy().astype(np.int64),
+            "attention_mask": attention_mask.cpu().numpy().astype(np.int64),
+        })
+        return SimpleNamespace(**{name: torch.from_numpy(v) for name, v in zip(self.outputs, values)})
+
+
+def model_bytes(model) -> int:
+    if isinstance(model, OnnxModel):
+        return model.size
+    # state_dict incluye los pesos empaquetados de las capas int8, que no aparecen en parameters().
+    total = 0
+    for value in model.state_dict().values():
+        tensors = value if isinstance(value, (tuple, list)) else (value,)
+        for t in tensors:
+            if isinstance(t, torch.Tensor):
+                total += t.numel() * t.element_size()
+    return total
+
+
+def _conv1d_to_linear(module: torch.nn.Module):
+    # GPT-2 usa Conv1D (pesos transpuestos), que quantize_dynamic no reconoce.
+    for child_name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            nx, nf = child.weight.shape
+            linear = torch.nn.Linear(nx, nf)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, child_name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def load_model(name: str, backend: str = BACKEND):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido '{backend}'. Opciones: {', '.join(BACKENDS)}")
+    if backend == "onnx":
+        return OnnxModel(onnx_path(name))
+    model = MODELS[name].from_pretrained(name)
+    model.eval()
+    if backend == "int8":
+        _conv1d_to_linear(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+class _LogitsAndEmbedding(torch.nn.Module):
+    # CodeBERT: los logits y el embedding medio del RAG salen de la misma pasada del grafo.
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        from .encoder import mean_pool
+
+        out = self.model(input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True)
+        return out.logits, mean_pool(out.hidden_states[-1], attention_mask)
+
+
+def export_onnx(name: str, opset: int = 18) -> Path:
+    model = MODELS[name].from_pretrained(name)
+    model.config.use_cache = False
+    model.eval()
+    dest = onnx_path(name)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    dummy = torch.ones((1, 16), dtype=torch.long)
+    if name == "gpt2":
+        wrapper, outputs = _LogitsOnly(model), {"logits": {0: "batch", 1: "sequence"}}
+    else:
+        wrapper, outputs = _LogitsAndEmbedding(model), {"logits": {0: "batch"}, "sentence_embedding": {0: "batch"}}
+    torch.onnx.export(
+        wrapper,
+        (dummy, torch.ones_like(dummy)),
+        str(dest),
+        input_names=["input_ids", "attention_mask"],
+        output_names=list(outputs),
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            **outputs,
+        },
+        opset_version=opset,
+    )
+    print(f"[OK] {name} -> {dest}")
+    return dest
+
+
+def _load_corpus(source: str, limit: int) -> List[str]:
+    from utils.zip_parser import iter_python_files
+
+    if source.endswith(".zip"):
+        codes = [f["content"] for f in iter_python_files(source)]
+    else:
+        codes = [p.read_text(encoding="utf-8", errors="ignore") for p in sorted(Path(source).rglob("*.py"))]
+    return [c for c in codes if c.strip()][:limit]
+
+
+def _score_corpus(codes: List[str], backend: str) -> Dict[str, object]:
+    from .perplexityScore import PerplexityDetector
+    from .classifier import CodeBERTClassifier
+
+    start = time.perf_counter()
+    perplexity = PerplexityDetector(backend=backend)
+    classifier = CodeBERTClassifier(backend=backend)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    perp = perplexity.get_scores(codes)
+    bert = classifier.predict_proba_batch(codes)
+    elapsed = time.perf_counter() - start
+    return {"perplexity": perp, "codebert": bert, "load_s": load_time, "files_per_s": len(codes) / max(elapsed, 1e-9)}
+
+
+def drift_report(source: str, backend: str, limit: int = 200) -> Dict[str, object]:
+    codes = _load_corpus(source, limit)
+    reference = _score_corpus(codes, "torch")
+    candidate = _score_corpus(codes, backend)
+
+    report = {"backend": backend, "files": len(codes), "components": {}}
+    for comp in ("perplexity", "codebert"):
+        ref = np.array(reference[comp])
+        cand = np.array(candidate[comp])
+        diff = np.abs(ref - cand)
+        report["components"][comp] = {
+            "mean_abs_diff": round(float(diff.mean()), 5) if len(diff) else 0.0,
+            "max_abs_diff": round(float(diff.max()), 5) if len(diff) else 0.0,
+            "decision_agreement": round(float(np.mean((ref > 0.5) == (cand > 0.5))), 4) if len(diff) else 1.0,
+        }
+    report["throughput"] = {
+        "torch_files_per_s": round(reference["files_per_s"], 2),
+        f"{backend}_files_per_s": round(candidate["files_per_s"], 2),
+        "speedup": round(candidate["files_per_s"] / max(reference["files_per_s"], 1e-9), 2),
+    }
+    report["load_s"] = {"torch": round(reference["load_s"], 2), backend: round(candidate["load_s"], 2)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backends de inferencia: exportación ONNX e informe de desviación")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("export", help="Exporta GPT-2 y CodeBERT a ONNX en SPECTRA_ONNX_DIR")
+    drift = sub.add_parser("drift", help="Compara las puntuaciones de un backend contra fp32")
+    drift.add_argument("corpus", help="ZIP o directorio con archivos .py")
+    drift.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="int8")
+    drift.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for model_name in MODELS:
+            export_onnx(model_name)
+    else:
+        print(json.dumps(drift_report(args.corpus, args.backend, args.limit), indent=2))
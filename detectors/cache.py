@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+CACHE_ENABLED = os.getenv("SPECTRA_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("SPECTRA_CACHE_PATH", "data/cache/results.sqlite")
+CACHE_MEMORY_ITEMS = int(os.getenv("SPECTRA_CACHE_MEMORY_ITEMS", "4096"))
+CACHE_DISK_BYTES = int(os.getenv("SPECTRA_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+
+def normalize_source(code: str) -> str:
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def content_hash(code: str) -> str:
+    return hashlib.sha256(normalize_source(code).encode("utf-8", errors="ignore")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, version: str, path: Optional[str] = CACHE_PATH,
+                 max_memory_items: int = CACHE_MEMORY_ITEMS, max_disk_bytes: int = CACHE_DISK_BYTES,
+                 table: str = "results"):
+        self.version = version
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.table = table
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+            self._db.commit()
+            self._disk_bytes = self._db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+    def key(self, code: str, *extra: Any) -> str:
+        h = hashlib.sha256()
+        h.update(self.version.encode("utf-8"))
+        for item in extra:
+            h.update(b"\0" + str(item).encode("utf-8"))
+        h.update(b"\0" + content_hash(code).encode("ascii"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return json.loads(self._memory[key])
+            if self._db is not None:
+                row = self._db.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, row[0])
+                    self._counters["disk_hits"] += 1
+                    return json.loads(row[0])
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, payload)
+            self._counters["writes"] += 1
+            if self._db is None:
+                return
+            old = self._db.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time()),
+            )
+            self._disk_bytes += len(payload) - (old[0] if old else 0)
+            self._evict_disk()
+            self._db.commit()
+
+    def get_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        # Igual que get() para un lote: una sola consulta a disco y un solo commit.
+        results: List[Optional[Dict[str, Any]]] = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    results[i] = json.loads(self._memory[key])
+                else:
+                    missing.setdefault(key, []).append(i)
+            if missing and self._db is not None:
+                found = {}
+                wanted = list(missing)
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start:start + 500]
+                    marks = ",".join("?" for _ in chunk)
+                    found.update(self._db.execute(
+                        f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", chunk
+                    ).fetchall())
+                if found:
+                    now = time.time()
+                    self._db.executemany(f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                                         [(now, key) for key in found])
+                    self._db.commit()
+                for key, payload in found.items():
+                    self._remember(key, payload)
+                    for i in missing.pop(key):
+                        self._counters["disk_hits"] += 1
+                        results[i] = json.loads(payload)
+            self._counters["misses"] += sum(len(idx) for idx in missing.values())
+        return results
+
+    def put_many(self, items: List[tuple]):
+        # items: pares (key, value); un solo commit para todo el lote.
+        if not items:
+            return
+        payloads = [(key, json.dumps(value, ensure_ascii=False)) for key, value in items]
+        with self._lock:
+            for key, payload in payloads:
+                self._remember(key, payload)
+                self._counters["writes"] += 1
+            if self._db is None:
+                return
+            now = time.time()
+            for key, payload in payloads:
+                old = self._db.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, payload, len(payload), now),
+                )
+                self._disk_bytes += len(payload) - (old[0] if old else 0)
+            self._evict_disk()
+            self._db.commit()
+
+    def resolve(self, codes: List[str], compute: Callable[[List[str]], List[Dict[str, Any]]],
+                cacheable: Callable[[Dict[str, Any]], bool] = lambda r: "error" not in r,
+                extra: tuple = ()) -> List[Dict[str, Any]]:
+        keys = [self.key(code, *extra) for code in codes]
+        results = [self.get(key) for key in keys]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            computed = compute([codes[i] for i in pending])
+            for i, result in zip(pending, computed):
+                results[i] = result
+                if cacheable(result):
+                    self.put(keys[i], result)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+            stats["version"] = self.version
+            return stats
+
+    def _remember(self, key: str, payload: str):
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._db.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY accessed LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for key, size in rows:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                self._counters["evictions"] += 1
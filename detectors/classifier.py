@@ -1,18 +1,29 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
+from .encoder import CodeBERTEncoder, shared_encoder
+from .settings import BACKEND, BERT_BATCH_TOKENS as MAX_BATCH_TOKENS
+from typing import List, Optional
+import numpy as np
+
 
 class CodeBERTClassifier:
-    def __init__(self):
-        self.tokenizer = AutoTokenizer.from_pretrained("microsoft/codebert-base")
-        self.model = AutoModelForSequenceClassification.from_pretrained("microsoft/codebert-base")
-        self.model.eval()
+    def __init__(self, max_length: int = 512, max_batch_tokens: int = MAX_BATCH_TOKENS, backend: str = BACKEND,
+                 encoder: Optional[CodeBERTEncoder] = None):
+        # Con la configuración por defecto se comparte el encoder (y los pesos) con el RAG.
+        if encoder is None:
+            if backend == BACKEND and max_length == 512 and max_batch_tokens == MAX_BATCH_TOKENS:
+                encoder = shared_encoder.get()
+            else:
+                encoder = CodeBERTEncoder(max_length, max_batch_tokens, backend)
+        self.encoder = encoder
+        self.tokenizer = encoder.tokenizer
+        self.model = encoder.model
+        self.max_length = encoder.max_length
+        self.max_batch_tokens = encoder.max_batch_tokens
 
     def predict_proba(self, code: str) -> float:
-        try:
-            inputs = self.tokenizer(code, return_tensors="pt", truncation=True, max_length=512)
-            with torch.no_grad():
-                logits = self.model(**inputs).logits
-                prob = torch.softmax(logits, dim=1)[0][1].item()
-            return prob
-        except:
-            return 0.5
\ No newline at end of file
+        return self.predict_proba_batch([code])[0]
+
+    def predict_proba_batch(self, codes: List[str]) -> List[float]:
+        return self.encoder.encode(codes)[0]
+
+    def embed(self, codes: List[str]) -> np.ndarray:
+        return self.encoder.embed(codes)
@@ -0,0 +1,139 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+from .backends import load_model
+from .cache import content_hash
+from .scheduler import MicroBatchScheduler
+from .settings import BACKEND, BERT_BATCH_TOKENS as MAX_BATCH_TOKENS, MICROBATCH, MICROBATCH_TOKENS
+from utils.batching import length_buckets
+from utils.startup import LazyComponent
+
+EMBED_CACHE_ITEMS = int(os.getenv("SPECTRA_EMBED_CACHE_ITEMS", "2048"))
+
+
+def mean_pool(hidden: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    # Mismo pooling que SentenceTransformer (media de tokens con máscara): compatible con el índice RAG.
+    mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+    return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+
+
+class CodeBERTEncoder:
+    # Una sola pasada del backbone: de los mismos estados ocultos salen los logits del
+    # clasificador y el embedding medio que usa el RAG.
+    def __init__(self, max_length: int = 512, max_batch_tokens: int = MAX_BATCH_TOKENS, backend: str = BACKEND,
+                 cache_items: int = EMBED_CACHE_ITEMS, microbatch: bool = MICROBATCH):
+        self.tokenizer = AutoTokenizer.from_pretrained("microsoft/codebert-base")
+        self.model = load_model("microsoft/codebert-base", backend)
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.cache_items = cache_items
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+        # Falso con exportaciones ONNX antiguas (solo logits): se puede clasificar pero no embeber.
+        self.has_embeddings = True
+        self.scheduler = MicroBatchScheduler(
+            "codebert", self._encode_items, MICROBATCH_TOKENS or max_batch_tokens,
+        ) if microbatch else None
+
+    @property
+    def dim(self) -> int:
+        size = getattr(self.model, "hidden_size", None)
+        return size or getattr(getattr(self.model, "config", None), "hidden_size", 768)
+
+    def encode(self, codes: List[str]) -> Tuple[List[float], np.ndarray]:
+        try:
+            encoded = self.tokenizer(list(codes), truncation=True, max_length=self.max_length)["input_ids"]
+        except:
+            return [0.5] * len(codes), np.zeros((len(codes), self.dim), dtype=np.float32)
+        if self.scheduler is not None:
+            items = self.scheduler.run(encoded)
+            probs = [prob for prob, _ in items]
+            embeddings = np.stack([emb for _, emb in items]) if items else np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            probs, embeddings = self._encode_ids(encoded)
+        self._remember(codes, embeddings)
+        return probs, embeddings
+
+    def _encode_items(self, encoded: List[List[int]]) -> List[Tuple[float, np.ndarray]]:
+        probs, embeddings = self._encode_ids(encoded)
+        return list(zip(probs, embeddings))
+
+    def _encode_ids(self, encoded: List[List[int]]) -> Tuple[List[float], np.ndarray]:
+        probs = [0.5] * len(encoded)
+        embeddings = np.zeros((len(encoded), self.dim), dtype=np.float32)
+        for bucket in length_buckets([len(ids) for ids in encoded], self.max_batch_tokens):
+            try:
+                bucket_probs, bucket_emb = self._batch([encoded[i] for i in bucket])
+            except:
+                bucket_probs, bucket_emb = [], []
+                for i in bucket:
+                    prob, emb = self._single(encoded[i])
+                    bucket_probs.append(prob)
+                    bucket_emb.append(emb)
+            for idx, prob, emb in zip(bucket, bucket_probs, bucket_emb):
+                probs[idx] = prob
+                embeddings[idx] = emb
+        return probs, embeddings
+
+    def embed(self, codes: List[str]) -> np.ndarray:
+        # Reutiliza los embeddings calculados al clasificar el mismo código: sin segunda pasada.
+        keys = [content_hash(code) for code in codes]
+        out = np.zeros((len(codes), self.dim), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._embeddings:
+                    self._embeddings.move_to_end(key)
+                    out[i] = self._embeddings[key]
+                else:
+                    missing.append(i)
+        if missing:
+            _, computed = self.encode([codes[i] for i in missing])
+            if not self.has_embeddings:
+                raise RuntimeError("El modelo ONNX no expone 'sentence_embedding'; ejecuta: python -m detectors.backends export")
+            out[missing] = computed
+        return out
+
+    def _remember(self, codes: List[str], embeddings: np.ndarray):
+        if self.cache_items <= 0 or not self.has_embeddings:
+            return
+        with self._lock:
+            for code, emb in zip(codes, embeddings):
+                if not emb.any():
+                    # Fila de ceros = fallo al codificar (_single/_batch): no se guarda, embed() reintenta.
+                    continue
+                key = content_hash(code)
+                self._embeddings[key] = emb
+                self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.cache_items:
+                self._embeddings.popitem(last=False)
+
+    def _single(self, ids: List[int]) -> Tuple[float, np.ndarray]:
+        try:
+            probs, emb = self._batch([ids])
+            return probs[0], emb[0]
+        except:
+            return 0.5, np.zeros(self.dim, dtype=np.float32)
+
+    def _batch(self, batch_ids: List[List[int]]) -> Tuple[List[float], np.ndarray]:
+        inputs = self.tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt")
+        with torch.no_grad():
+            outputs = self.model(**inputs, output_hidden_states=True)
+            probs = torch.softmax(outputs.logits, dim=1)[:, 1]
+            embedding = getattr(outputs, "sentence_embedding", None)
+            if embedding is None:
+                hidden = getattr(outputs, "hidden_states", None)
+                if hidden is None:
+                    self.has_embeddings = False
+                    return probs.tolist(), np.zeros((len(batch_ids), self.dim), dtype=np.float32)
+                embedding = mean_pool(hidden[-1], inputs["attention_mask"])
+        return probs.tolist(), embedding.float().numpy()
+
+
+shared_encoder = LazyComponent("codebert_encoder", CodeBERTEncoder)
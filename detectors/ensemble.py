@@ -1,50 +1,344 @@
-from .perplexityScore import PerplexityDetector
 from .stylometryModel import StylometryDetector
-from .classifier import CodeBERTClassifier
-from utils.astUtils import get_ast_score
+from .cache import ResultCache, CACHE_ENABLED
+from .settings import (MODEL_VERSION, BACKEND, SLIDING_WINDOW, WINDOW_STRIDE, FEATURE_WORKERS,
+                       CASCADE, CASCADE_LOW, CASCADE_HIGH, CHUNKING, CHUNK_MIN_LINES, ENSEMBLE_WEIGHTS)
+from utils.features import extract_features, extract_features_batch
+from utils.chunker import split_units, original_line
+from utils.startup import LazyComponent
+from utils import metrics
+import hashlib
+import json
 import numpy as np
-from typing import Dict, Any
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+CHEAP_STAGES = ["ast", "stylometry"]
+FULL_STAGES = ["ast", "stylometry", "perplexity", "codebert"]
+
+# Orden de los componentes combinados por _combine (probabilidad IA de cada uno).
+COMPONENTS = ("perplexity", "ast", "codebert")
+DEFAULT_WEIGHTS = [0.4, 0.3, 0.3]
+DEFAULT_THRESHOLD = 0.5
+
+
+def load_weights(path: Path = ENSEMBLE_WEIGHTS) -> Dict[str, Any]:
+    # Pesos y umbral exportados por evaluate.py --fit; sin archivo se usan los valores fijos.
+    path = Path(path)
+    if not path.exists():
+        return {"weights": list(DEFAULT_WEIGHTS), "threshold": DEFAULT_THRESHOLD, "tag": None}
+    raw = path.read_bytes()
+    try:
+        data = json.loads(raw)
+        weights = [float(data["weights"][name]) for name in COMPONENTS]
+        threshold = float(data.get("threshold", DEFAULT_THRESHOLD))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Pesos del ensemble no válidos en {path}: {e}")
+    if min(weights) < 0 or sum(weights) <= 0 or not 0.0 < threshold < 1.0:
+        raise ValueError(f"Pesos del ensemble no válidos en {path}: pesos >= 0 y umbral en (0, 1)")
+    return {"weights": weights, "threshold": threshold, "tag": hashlib.sha256(raw).hexdigest()[:12]}
+
+
+def calibrate(prob: float, threshold: float = DEFAULT_THRESHOLD) -> float:
+    # Reescala por tramos para que el umbral ajustado caiga en 0.5: informes, agregados y cascada
+    # siguen comparando con 0.5 y aplican la decisión calibrada.
+    if threshold == 0.5:
+        return prob
+    if prob <= threshold:
+        return 0.5 * prob / threshold
+    return 0.5 + 0.5 * (prob - threshold) / (1.0 - threshold)
+
+
+def detector_version(cascade: bool = CASCADE, band: Tuple[float, float] = (CASCADE_LOW, CASCADE_HIGH),
+                     chunking: bool = CHUNKING, calibration: Optional[Dict[str, Any]] = None) -> str:
+    version = f"{MODEL_VERSION}|ppl-window={WINDOW_STRIDE if SLIDING_WINDOW else 0}|backend={BACKEND}"
+    if cascade:
+        version += f"|cascade={band[0]:g}-{band[1]:g}"
+    if chunking:
+        version += f"|chunks=functions-v2-{CHUNK_MIN_LINES}"
+    tag = (calibration or load_weights())["tag"]
+    if tag:
+        version += f"|weights={tag}"
+    return version
+
+
+def cheap_estimate(features: Dict[str, Any]) -> float:
+    # Probabilidad IA a partir de AST y estilometría (ambas puntúan 1.0 = humano). Si el AST falla
+    # (error de sintaxis) su score 0.0 no es una señal: queda fuera de la estimación.
+    stylometry_ai = 1.0 - features["stylometry"]["score"]
+    if "error" in features["ast"]:
+        return stylometry_ai
+    ast_ai = 1.0 - features["ast"].get("score", 0.0)
+    return 0.5 * ast_ai + 0.5 * stylometry_ai
+
+
+def _comp_meta(score: float) -> Dict[str, float]:
+    confidence = min(max(abs(score - 0.5) * 2.0, 0.0), 1.0)
+    bias = score - 0.5
+    return {"score": round(float(score), 3), "confidence": round(float(confidence), 3), "bias": round(float(bias), 3)}
+
+
+def _load_perplexity():
+    from .perplexityScore import PerplexityDetector
+    return PerplexityDetector()
+
+
+def _load_classifier():
+    from .classifier import CodeBERTClassifier
+    return CodeBERTClassifier()
 
 
 class EnsembleDetector:
-    def __init__(self):
-        self.perplexity = PerplexityDetector()
+    def __init__(self, cache: Optional[ResultCache] = None, use_cache: bool = CACHE_ENABLED,
+                 cascade: bool = CASCADE, band: Tuple[float, float] = (CASCADE_LOW, CASCADE_HIGH),
+                 chunking: bool = CHUNKING, calibration: Optional[Dict[str, Any]] = None):
+        # Los modelos se cargan en el primer uso (o en warmup), no al construir el detector.
+        self._perplexity = LazyComponent("perplexity", _load_perplexity)
+        self._classifier = LazyComponent("codebert", _load_classifier)
         self.stylometry = StylometryDetector()
-        self.classifier = CodeBERTClassifier()
+        self.cascade = cascade
+        self.band = band
+        self.chunking = chunking
+        self.calibration = calibration or load_weights()
+        self.version = detector_version(cascade, band, chunking, self.calibration)
+        self.cache = cache if cache is not None else (ResultCache(self.version) if use_cache else None)
+
+    @property
+    def perplexity(self):
+        return self._perplexity.get()
+
+    @property
+    def classifier(self):
+        return self._classifier.get()
+
+    @property
+    def ready(self) -> bool:
+        return self._perplexity.loaded and self._classifier.loaded
+
+    def warmup(self):
+        self._perplexity.get()
+        self._classifier.get()
+
+    def close(self):
+        # Cierra los planificadores de micro-batching de los modelos cargados (GPT-2 y el encoder
+        # compartido de CodeBERT); las entradas que sigan en cola reciben un error.
+        from .encoder import shared_encoder
+
+        schedulers = []
+        if self._perplexity.loaded:
+            schedulers.append(self._perplexity.get().scheduler)
+        if self._classifier.loaded:
+            schedulers.append(self._classifier.get().encoder.scheduler)
+        if shared_encoder.loaded:
+            schedulers.append(shared_encoder.get().scheduler)
+        for scheduler in schedulers:
+            if scheduler is not None:
+                scheduler.close()
 
     def predict(self, code: str) -> Dict[str, Any]:
-        try:
-            perp_score = self.perplexity.get_score(code)
-            ast_result = get_ast_score(code)
-            ast_score = ast_result.get("score", 0.0)
-            bert_prob = self.classifier.predict_proba(code)
-
-            weights = [0.4, 0.3, 0.3]
-            ai_probs = [
-                perp_score,
-                1.0 - ast_score,
-                bert_prob,
-            ]
-            final_prob = np.average(ai_probs, weights=weights)
-
-            def comp_meta(score: float):
-                confidence = min(max(abs(score - 0.5) * 2.0, 0.0), 1.0)
-                bias = score - 0.5
-                return {"score": round(float(score), 3), "confidence": round(float(confidence), 3), "bias": round(float(bias), 3)}
-
-            components = {
-                "perplexity": comp_meta(perp_score),
-                "ast": comp_meta(1.0 - ast_score),
-                "codebert": comp_meta(bert_prob),
-            }
+        return self.predict_batch([code])[0]
+
+    def predict_batch(self, codes: List[str]) -> List[Dict[str, Any]]:
+        if not codes:
+            return []
+        compute = self._predict_chunked if self.chunking else self._predict_uncached
+        if self.cache:
+            return self.cache.resolve(codes, compute)
+        return compute(codes)
 
-            return {
-                "ai_probability": round(float(final_prob), 3),
-                "components": components,
-                "explanation": self._explain(ai_probs, ast_result.get("features", {})),
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats() if self.cache else {"enabled": False}
+
+    def model_memory(self) -> Dict[str, int]:
+        from .backends import model_bytes
+
+        memory = {}
+        for name, component in (("gpt2", self._perplexity), ("codebert", self._classifier)):
+            if component.loaded:
+                memory[name] = model_bytes(component.get().model)
+        return memory
+
+    def component_scores(self, codes: List[str]) -> List[Dict[str, Any]]:
+        # Probabilidad IA de cada componente sin combinar ni redondear, más el vector de features:
+        # es lo que guarda el almacén de features para reajustar pesos sin volver a inferir.
+        features = extract_features_batch(codes, FEATURE_WORKERS)
+        perp_scores = self.perplexity.get_scores(codes)
+        bert_probs = self.classifier.predict_proba_batch(codes)
+        return [
+            {
+                "perplexity": float(perp),
+                "ast": 1.0 - features[i]["ast"].get("score", 0.0),
+                "codebert": float(bert),
+                "stylometry": 1.0 - features[i]["stylometry"]["score"],
+                "vector": [float(v) for v in features[i]["vector"]],
             }
+            for i, (perp, bert) in enumerate(zip(perp_scores, bert_probs))
+        ]
+
+    def _predict_uncached(self, codes: List[str]) -> List[Dict[str, Any]]:
+        # Las features baratas van primero: en modo cascada deciden qué archivos necesitan los transformers.
+        with metrics.timed("ast"):
+            features = extract_features_batch(codes, FEATURE_WORKERS)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(codes)
+        pending = []
+        for i, feats in enumerate(features):
+            estimate = cheap_estimate(feats)
+            # Sin AST la estimación barata se apoya solo en la estilometría: no basta para decidir.
+            if self.cascade and "error" not in feats["ast"] and not (self.band[0] <= estimate <= self.band[1]):
+                results[i] = self._early_exit(feats, estimate)
+            else:
+                pending.append(i)
+        if not pending:
+            return results
+
+        subset = [codes[i] for i in pending]
+        try:
+            with metrics.timed("perplexity"):
+                perp_results = self.perplexity.get_scores_detailed(subset)
+            with metrics.timed("codebert"):
+                bert_probs = self.classifier.predict_proba_batch(subset)
+        except Exception:
+            for i in pending:
+                results[i] = self._predict_single(codes[i], features[i])
+            return results
+
+        for i, perp, bert_prob in zip(pending, perp_results, bert_probs):
+            try:
+                results[i] = self._combine(perp["score"], features[i], bert_prob, perp.get("windows"))
+            except Exception as e:
+                results[i] = self._error(e)
+        return results
+
+    def _predict_chunked(self, codes: List[str]) -> List[Dict[str, Any]]:
+        # Todos los fragmentos de todos los archivos van juntos por el camino por lotes: cada token
+        # se puntúa una sola vez y los lotes por longitud se llenan con funciones de varios archivos.
+        units = [split_units(code, CHUNK_MIN_LINES) for code in codes]
+        flat = [unit["code"] for file_units in units for unit in file_units]
+        if self.cache:
+            scored = self.cache.resolve(flat, self._predict_uncached, extra=("chunk",))
+        else:
+            scored = self._predict_uncached(flat)
+
+        results = []
+        offset = 0
+        for file_units in units:
+            chunk_results = scored[offset:offset + len(file_units)]
+            offset += len(file_units)
+            try:
+                results.append(self._merge_chunks(file_units, chunk_results))
+            except Exception as e:
+                results.append(self._error(e))
+        return results
+
+    def _merge_chunks(self, units: List[Dict[str, Any]], chunk_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        functions = []
+        weights = []
+        probs = []
+        component_sums: Dict[str, float] = {}
+        component_weights: Dict[str, float] = {}
+        windows = []
+        stages: List[str] = []
+        for unit, res in zip(units, chunk_results):
+            entry = {k: unit[k] for k in ("name", "kind", "start_line", "end_line")}
+            if len(unit["ranges"]) > 1:
+                # Fragmento no contiguo (código suelto del módulo): tramos reales de líneas.
+                entry["ranges"] = unit["ranges"]
+            if "error" in res:
+                functions.append({**entry, "error": res["error"]})
+                continue
+            # Peso = longitud del fragmento sin espacios: las funciones largas pesan más.
+            weight = float(max(1, len("".join(unit["code"].split()))))
+            prob = float(res.get("ai_probability", 0.0))
+            functions.append({**entry, "ai_probability": round(prob, 3), "stages": res.get("stages", [])})
+            weights.append(weight)
+            probs.append(prob)
+            for name, comp in res.get("components", {}).items():
+                component_sums[name] = component_sums.get(name, 0.0) + weight * comp["score"]
+                component_weights[name] = component_weights.get(name, 0.0) + weight
+            for w in res.get("components", {}).get("perplexity", {}).get("windows", []):
+                windows.append({**w, "start_line": original_line(unit, w["start_line"]),
+                                "end_line": original_line(unit, w["end_line"])})
+            stages.extend(s for s in res.get("stages", []) if s not in stages)
+
+        if not weights:
+            raise ValueError(chunk_results[0].get("error", "sin fragmentos puntuables"))
+
+        components = {name: _comp_meta(total / component_weights[name]) for name, total in component_sums.items()}
+        if windows:
+            components.setdefault("perplexity", {})["windows"] = windows
+        final_prob = float(np.average(probs, weights=weights))
+        scored = [f for f in functions if "ai_probability" in f]
+        top = max(scored, key=lambda f: f["ai_probability"])
+        span = ", ".join(f"{a}-{b}" if a != b else str(a)
+                         for a, b in top.get("ranges", [[top["start_line"], top["end_line"]]]))
+        flagged = sum(1 for f in scored if f["ai_probability"] > 0.5)
+        return {
+            "ai_probability": round(final_prob, 3),
+            "components": components,
+            "explanation": (f"{flagged} de {len(scored)} fragmentos con probabilidad IA > 50%. "
+                            f"Más sospechoso: {top['name']} (líneas {span}, "
+                            f"{top['ai_probability']:.2f})."),
+            "functions": functions,
+            "stages": stages,
+        }
+
+    def _predict_single(self, code: str, features: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        try:
+            with metrics.timed("perplexity"):
+                perp = self.perplexity.get_scores_detailed([code])[0]
+            if features is None:
+                with metrics.timed("ast"):
+                    features = extract_features(code)
+            with metrics.timed("codebert"):
+                bert_prob = self.classifier.predict_proba(code)
+            return self._combine(perp["score"], features, bert_prob, perp.get("windows"))
         except Exception as e:
-            return {"ai_probability": 0.0, "error": str(e), "explanation": "Error en análisis de código."}
+            return self._error(e)
+
+    def _early_exit(self, features: Dict[str, Any], estimate: float) -> Dict[str, Any]:
+        ast_ai = 1.0 - features["ast"].get("score", 0.0)
+        stylometry_ai = 1.0 - features["stylometry"]["score"]
+        return {
+            "ai_probability": round(float(estimate), 3),
+            "components": {"ast": _comp_meta(ast_ai), "stylometry": _comp_meta(stylometry_ai)},
+            "explanation": self._explain_cheap(estimate, features["ast"].get("features", {})),
+            "features": [round(float(v), 4) for v in features["vector"]],
+            "stages": list(CHEAP_STAGES),
+            "cascade": "early_exit",
+        }
+
+    def _combine(self, perp_score: float, features: Dict[str, Any], bert_prob: float,
+                 perp_windows: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        ast_result = features["ast"]
+        ast_score = ast_result.get("score", 0.0)
+
+        ai_probs = [
+            perp_score,
+            1.0 - ast_score,
+            bert_prob,
+        ]
+        final_prob = calibrate(np.average(ai_probs, weights=self.calibration["weights"]),
+                               self.calibration["threshold"])
+
+        components = {
+            "perplexity": _comp_meta(perp_score),
+            "ast": _comp_meta(1.0 - ast_score),
+            "codebert": _comp_meta(bert_prob),
+        }
+        if perp_windows:
+            components["perplexity"]["windows"] = perp_windows
+
+        return {
+            "ai_probability": round(float(final_prob), 3),
+            "components": components,
+            "explanation": self._explain(ai_probs, ast_result.get("features", {})),
+            "features": [round(float(v), 4) for v in features["vector"]],
+            "stages": list(FULL_STAGES),
+            **({"cascade": "full"} if self.cascade else {}),
+        }
+
+    def _error(self, e: Exception) -> Dict[str, Any]:
+        return {"ai_probability": 0.0, "error": str(e), "explanation": "Error en análisis de código."}
 
     def _explain(self, probs: list, features: dict) -> str:
         perp, ast_ai, bert = probs
@@ -58,6 +352,11 @@ class EnsembleDetector:
             return "CodeBERT detecta patrones de entrenamiento en IA."
         return f"Ensemble: Perp={perp:.2f}, AST={ast_ai:.2f}, BERT={bert:.2f}. IA probable."
 
+    def _explain_cheap(self, estimate: float, features: dict) -> str:
+        if estimate < self.band[0]:
+            return f"AST y estilometría apuntan a autoría humana ({estimate:.2f}); modelos profundos omitidos."
+        return f"AST rígido (profundidad {features.get('depth', 0)}) y estilo uniforme ({estimate:.2f}); IA probable, modelos profundos omitidos."
+
     def detect_probability(self, code: str) -> float:
         res = self.predict(code)
         return float(res.get("ai_probability", 0.0))
@@ -67,12 +366,16 @@ class EnsembleDetector:
             res = code_or_res
         else:
             res = self.predict(code_or_res)
-        comps = res.get("components", {})
-        perp = comps.get("perplexity", {})
-        ast = comps.get("ast", {})
-        codebert = comps.get("codebert", {})
-        return (
-            f"Perplexity(score={perp.get('score',0):.3f},conf={perp.get('confidence',0):.3f},bias={perp.get('bias',0):.3f}); "
-            f"AST(score={ast.get('score',0):.3f},conf={ast.get('confidence',0):.3f},bias={ast.get('bias',0):.3f}); "
-            f"CodeBERT(score={codebert.get('score',0):.3f},conf={codebert.get('confidence',0):.3f},bias={codebert.get('bias',0):.3f})"
-        )
\ No newline at end of file
+        return format_attribution(res)
+
+
+def format_attribution(res: Dict[str, Any]) -> str:
+    comps = res.get("components", {})
+    perp = comps.get("perplexity", {})
+    ast = comps.get("ast", {})
+    codebert = comps.get("codebert", {})
+    return (
+        f"Perplexity(score={perp.get('score',0):.3f},conf={perp.get('confidence',0):.3f},bias={perp.get('bias',0):.3f}); "
+        f"AST(score={ast.get('score',0):.3f},conf={ast.get('confidence',0):.3f},bias={ast.get('bias',0):.3f}); "
+        f"CodeBERT(score={codebert.get('score',0):.3f},conf={codebert.get('confidence',0):.3f},bias={codebert.get('bias',0):.3f})"
+    )
@@ -0,0 +1,151 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+from .cache import ResultCache, CACHE_ENABLED
+from utils import metrics
+
+INFERENCE_WORKERS = int(os.getenv("SPECTRA_INFERENCE_WORKERS", "0"))
+TORCH_THREADS = int(os.getenv("SPECTRA_TORCH_THREADS", "0"))
+WARMUP_ROUNDS = 10
+
+_worker_detector = None
+
+
+def _init_worker(threads: int, calibration: Dict[str, Any]):
+    global _worker_detector
+    import torch
+    from .ensemble import EnsembleDetector
+
+    # Un hilo intra-op por núcleo asignado: N procesos no compiten por los mismos núcleos.
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    # Los pesos llegan del proceso principal: todos los workers usan la misma calibración (y versión).
+    _worker_detector = EnsembleDetector(use_cache=False, calibration=calibration)
+    # Los modelos se cargan aquí, antes de que el worker acepte su primera tarea.
+    _worker_detector.warmup()
+
+
+def _worker_predict_batch(codes: List[str]):
+    # Los tiempos por etapa medidos en el worker viajan con el resultado al proceso principal.
+    events = metrics.start_trace()
+    return _worker_detector.predict_batch(codes), events
+
+
+def _worker_ping(hold: float = 0.0) -> int:
+    # Retener el worker un momento obliga a que los demás pings vayan a otros procesos.
+    time.sleep(hold)
+    return os.getpid()
+
+
+class InferenceExecutor:
+    def __init__(self, workers: int = INFERENCE_WORKERS, threads: int = TORCH_THREADS, detector=None):
+        self.workers = workers
+        self.warming = False
+        self._pool_ready = False
+        self.pool = None
+        self.detector = None
+        self.cache = None
+        if workers > 0:
+            from .ensemble import detector_version, load_weights
+
+            threads = threads or max(1, (os.cpu_count() or 1) // workers)
+            calibration = load_weights()
+            self.version = detector_version(calibration=calibration)
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads, calibration),
+            )
+            # En modo proceso la caché vive en el proceso principal: los aciertos no cruzan procesos.
+            self.cache = ResultCache(self.version) if CACHE_ENABLED else None
+        else:
+            from .ensemble import EnsembleDetector
+
+            self.detector = detector or EnsembleDetector()
+            self.version = self.detector.version
+            self.cache = self.detector.cache
+
+    async def predict_batch(self, codes: List[str]) -> List[Dict[str, Any]]:
+        if not codes:
+            return []
+        if self.pool is None:
+            return await asyncio.to_thread(self.detector.predict_batch, codes)
+        if self.cache:
+            # La caché usa SQLite: lecturas y escrituras van a un hilo, una llamada por lote.
+            keys, results = await asyncio.to_thread(self._cache_lookup, codes)
+            pending = [i for i, r in enumerate(results) if r is None]
+            if pending:
+                computed = await self._dispatch([codes[i] for i in pending])
+                for i, result in zip(pending, computed):
+                    results[i] = result
+                await asyncio.to_thread(
+                    self.cache.put_many, [(keys[i], results[i]) for i in pending if "error" not in results[i]]
+                )
+            return results
+        return await self._dispatch(codes)
+
+    async def predict(self, code: str) -> Dict[str, Any]:
+        return (await self.predict_batch([code]))[0]
+
+    @property
+    def ready(self) -> bool:
+        return self.detector.ready if self.pool is None else self._pool_ready
+
+    async def warmup(self):
+        self.warming = True
+        try:
+            if self.pool is None:
+                await asyncio.to_thread(self.detector.warmup)
+            else:
+                # Un worker solo responde al ping tras cargar los modelos en su initializer. Se repiten
+                # rondas hasta que han contestado todos los procesos (pids distintos).
+                pids = set()
+                for _ in range(WARMUP_ROUNDS):
+                    pids.update(await asyncio.gather(
+                        *(asyncio.wrap_future(self.pool.submit(_worker_ping, 0.2)) for _ in range(self.workers))
+                    ))
+                    if len(pids) >= self.workers:
+                        self._pool_ready = True
+                        return
+                raise RuntimeError(f"Solo {len(pids)} de {self.workers} workers respondieron al warmup.")
+        finally:
+            self.warming = False
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats() if self.cache else {"enabled": False}
+
+    def memory(self) -> Dict[str, Dict[str, int]]:
+        if self.pool is None:
+            return {"models": self.detector.model_memory(), "workers": {}}
+        # Los modelos viven en los workers: se informa la memoria residente de cada proceso.
+        processes = getattr(self.pool, "_processes", None) or {}
+        return {"models": {}, "workers": {str(pid): metrics.resident_memory(str(pid)) for pid in processes}}
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            self.detector.close()
+
+    def _cache_lookup(self, codes: List[str]):
+        keys = [self.cache.key(code) for code in codes]
+        return keys, self.cache.get_many(keys)
+
+    async def _dispatch(self, codes: List[str]) -> List[Dict[str, Any]]:
+        # Reparte el lote entre procesos; cada uno puntúa su parte en paralelo.
+        size = math.ceil(len(codes) / self.workers)
+        shards = [codes[i:i + size] for i in range(0, len(codes), size)]
+        parts = await asyncio.gather(
+            *(asyncio.wrap_future(self.pool.submit(_worker_predict_batch, shard)) for shard in shards)
+        )
+        results = []
+        for part, events in parts:
+            metrics.record_events(events)
+            results.extend(part)
+        return results
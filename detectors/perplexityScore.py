@@ -1,21 +1,164 @@
 import torch
-from transformers import GPT2Tokenizer, GPT2LMHeadModel
+import torch.nn.functional as F
+from transformers import GPT2Tokenizer
+from .backends import load_model
+from .scheduler import MicroBatchScheduler
+from .settings import (BACKEND, PPL_BATCH_TOKENS as MAX_BATCH_TOKENS, SLIDING_WINDOW, WINDOW_STRIDE,
+                       MICROBATCH, MICROBATCH_TOKENS)
+from utils.batching import length_buckets
+from typing import Any, Dict, List
 import math
 
 
+def _ppl_score(mean_nll: float) -> float:
+    return min(math.exp(mean_nll) / 200.0, 1.0)
+
+
 class PerplexityDetector:
-    def __init__(self):
+    def __init__(self, max_length: int = 1024, max_batch_tokens: int = MAX_BATCH_TOKENS,
+                 sliding: bool = SLIDING_WINDOW, stride: int = WINDOW_STRIDE, backend: str = BACKEND,
+                 microbatch: bool = MICROBATCH):
         self.tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-        self.model = GPT2LMHeadModel.from_pretrained("gpt2")
-        self.model.eval()
+        self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Los textos largos se trocean en ventanas; evita el aviso de longitud al tokenizar completo.
+        self.tokenizer.model_max_length = int(1e9)
+        self.model = load_model("gpt2", backend)
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.sliding = sliding
+        self.stride = min(stride, max_length)
+        # Con micro-batching, los ids tokenizados de todas las peticiones pasan por un único planificador.
+        self.scheduler = MicroBatchScheduler(
+            "gpt2", self._score_ids, MICROBATCH_TOKENS or max_batch_tokens, cost=self._cost,
+        ) if microbatch else None
 
     def get_score(self, code: str) -> float:
+        return self.get_scores([code])[0]
+
+    def get_scores(self, codes: List[str]) -> List[float]:
+        return [r["score"] for r in self.get_scores_detailed(codes)]
+
+    def get_scores_detailed(self, codes: List[str]) -> List[Dict[str, Any]]:
+        try:
+            encoded = self.tokenizer(list(codes))["input_ids"]
+        except:
+            return [{"score": 0.5} for _ in codes]
+        if self.scheduler is not None:
+            return self.scheduler.run(encoded)
+        return self._score_ids(encoded)
+
+    def _cost(self, ids: List[int]) -> int:
+        return len(ids) if self.sliding else min(len(ids), self.max_length)
+
+    def _score_ids(self, encoded: List[List[int]]) -> List[Dict[str, Any]]:
+        encoded = list(encoded)
+        results = [{"score": 0.5} for _ in encoded]
+        short = []
+        for i, ids in enumerate(encoded):
+            if len(ids) > self.max_length and self.sliding:
+                results[i] = self._score_windows(ids)
+            else:
+                short.append(i)
+                encoded[i] = ids[:self.max_length]
+
+        for bucket in length_buckets([len(encoded[i]) for i in short], self.max_batch_tokens):
+            idxs = [short[b] for b in bucket]
+            try:
+                losses = self._batch_loss([encoded[i] for i in idxs])
+            except:
+                losses = [self._single_loss(encoded[i]) for i in idxs]
+            for idx, loss in zip(idxs, losses):
+                if loss is not None:
+                    results[idx] = {"score": _ppl_score(loss)}
+        return results
+
+    def score_long(self, code: str) -> Dict[str, Any]:
         try:
-            inputs = self.tokenizer(code, return_tensors="pt", truncation=True, max_length=1024)
-            with torch.no_grad():
-                outputs = self.model(**inputs, labels=inputs["input_ids"])
-                loss = outputs.loss
-            ppl = math.exp(loss.item())
-            return min(ppl / 200.0, 1.0)
+            ids = self.tokenizer(code)["input_ids"]
+            return self._score_windows(ids)
         except:
-            return 0.5
\ No newline at end of file
+            return {"score": 0.5, "windows": []}
+
+    def _score_windows(self, ids: List[int]) -> Dict[str, Any]:
+        # Ventanas de max_length con paso `stride`: cada token se puntúa una sola vez,
+        # reutilizando (max_length - stride) tokens previos como contexto. Coste lineal.
+        n = len(ids)
+        spans = []
+        prev_end = 0
+        for begin in range(0, n, self.stride):
+            end = min(begin + self.max_length, n)
+            spans.append((begin, end, max(prev_end, begin + 1)))
+            prev_end = end
+            if end == n:
+                break
+
+        line_of = []
+        line = 1
+        for tok in self.tokenizer.convert_ids_to_tokens(ids):
+            line_of.append(line)
+            line += tok.count("Ċ")
+
+        per_batch = max(1, self.max_batch_tokens // self.max_length)
+        total_nll = 0.0
+        total_count = 0
+        windows = []
+        for start in range(0, len(spans), per_batch):
+            batch = spans[start:start + per_batch]
+            try:
+                sums = self._window_nll(ids, batch)
+            except:
+                sums = [None] * len(batch)
+            for (begin, end, target_start), item in zip(batch, sums):
+                if item is None:
+                    continue
+                nll_sum, count = item
+                total_nll += nll_sum
+                total_count += count
+                windows.append({
+                    "start_line": line_of[target_start],
+                    "end_line": line_of[end - 1],
+                    "tokens": count,
+                    "score": round(_ppl_score(nll_sum / count), 3),
+                })
+
+        if not total_count:
+            return {"score": 0.5, "windows": windows}
+        return {"score": _ppl_score(total_nll / total_count), "windows": windows}
+
+    def _window_nll(self, ids: List[int], spans: list) -> list:
+        inputs = self.tokenizer.pad({"input_ids": [ids[b:e] for b, e, _ in spans]}, return_tensors="pt")
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+        labels = inputs["input_ids"][:, 1:]
+        mask = inputs["attention_mask"][:, 1:].clone()
+        positions = torch.arange(1, labels.shape[1] + 1)
+        for row, (begin, _, target_start) in enumerate(spans):
+            # Solo cuentan los tokens nuevos de la ventana; el resto es contexto.
+            mask[row] *= (positions + begin >= target_start).to(mask.dtype)
+        mask = mask.to(logits.dtype)
+        nll = F.cross_entropy(logits[:, :-1].transpose(1, 2), labels, reduction="none") * mask
+        counts = mask.sum(dim=1)
+        return [
+            (nll[i].sum().item(), int(counts[i].item())) if counts[i] > 0 else None
+            for i in range(len(spans))
+        ]
+
+    def _single_loss(self, ids: List[int]):
+        try:
+            return self._batch_loss([ids])[0]
+        except:
+            return None
+
+    def _batch_loss(self, batch_ids: List[List[int]]) -> list:
+        inputs = self.tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt")
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+        # Pérdida por token enmascarada: equivale a outputs.loss de cada muestra sin padding.
+        labels = inputs["input_ids"][:, 1:]
+        mask = inputs["attention_mask"][:, 1:].to(logits.dtype)
+        nll = F.cross_entropy(logits[:, :-1].transpose(1, 2), labels, reduction="none") * mask
+        counts = mask.sum(dim=1)
+        return [
+            (nll[i].sum() / counts[i]).item() if counts[i] > 0 else None
+            for i in range(len(batch_ids))
+        ]
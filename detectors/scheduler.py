@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+from .settings import MICROBATCH_WAIT_MS
+from utils import metrics
+
+
+class _Pending:
+    __slots__ = ("item", "cost", "future", "enqueued")
+
+    def __init__(self, item: Any, cost: int, enqueued: float):
+        self.item = item
+        self.cost = cost
+        self.future = Future()
+        self.enqueued = enqueued
+
+
+class MicroBatchScheduler:
+    # Un hilo por modelo recoge las entradas de todas las peticiones en curso y forma lotes que
+    # llenan el presupuesto de tokens, sin esperar más de max_wait_ms desde la entrada más antigua.
+    # Cada petición recibe sus resultados por futures; el modelo solo se ejecuta desde este hilo.
+    def __init__(self, name: str, fn: Callable[[List[Any]], Sequence[Any]], max_batch_tokens: int,
+                 cost: Callable[[Any], int] = len, max_wait_ms: float = MICROBATCH_WAIT_MS):
+        self.name = name
+        self.fn = fn
+        self.cost = cost
+        self.max_batch_tokens = max(1, int(max_batch_tokens))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Protege _closed frente a submit: tras el centinela de cierre no entra nada en la cola.
+        self._state_lock = threading.Lock()
+        self._closed = False
+        self._counters = {"batches": 0, "items": 0, "tokens": 0}
+
+    def submit(self, items: Sequence[Any]) -> List[Future]:
+        now = time.perf_counter()
+        pending = [_Pending(item, max(1, int(self.cost(item))), now) for item in items]
+        with self._state_lock:
+            if self._closed:
+                raise RuntimeError(f"Planificador '{self.name}' cerrado.")
+            self._start()
+            for p in pending:
+                self._queue.put(p)
+        return [p.future for p in pending]
+
+    def run(self, items: Sequence[Any]) -> List[Any]:
+        return [future.result() for future in self.submit(items)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["mean_fill"] = round(stats["tokens"] / (stats["batches"] * self.max_batch_tokens), 4) if stats["batches"] else 0.0
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        # El lote que ya se está ejecutando termina; todo lo demás (cola, lote en formación y el
+        # sobrante) recibe un error en su future en lugar de quedarse esperando.
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    thread = threading.Thread(target=self._loop, name=f"microbatch-{self.name}", daemon=True)
+                    thread.start()
+                    self._thread = thread
+
+    def _loop(self):
+        carry = None
+        pending: List[_Pending] = []
+        while not self._closed:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is None:
+                break
+            batch = [first]
+            tokens = first.cost
+            deadline = first.enqueued + self.max_wait
+            while tokens < self.max_batch_tokens:
+                # Pasado el plazo solo se recogen las entradas que ya esperan en la cola.
+                timeout = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    break
+                if tokens + nxt.cost > self.max_batch_tokens:
+                    carry = nxt
+                    break
+                batch.append(nxt)
+                tokens += nxt.cost
+            if self._closed:
+                pending = batch
+                break
+            self._dispatch(batch, tokens)
+        if carry is not None:
+            pending.append(carry)
+        self._fail_pending(pending)
+
+    def _fail_pending(self, pending: List[_Pending]):
+        error = RuntimeError(f"Planificador '{self.name}' cerrado.")
+        while True:
+            try:
+                p = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if p is not None:
+                pending.append(p)
+        for p in pending:
+            if not p.future.done():
+                p.future.set_exception(error)
+
+    def _dispatch(self, batch: List[_Pending], tokens: int):
+        start = time.perf_counter()
+        for p in batch:
+            metrics.BATCH_QUEUE_SECONDS.observe(start - p.enqueued, model=self.name)
+        metrics.BATCH_FILL_RATIO.observe(min(tokens / self.max_batch_tokens, 1.0), model=self.name)
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["items"] += len(batch)
+            self._counters["tokens"] += min(tokens, self.max_batch_tokens)
+        try:
+            results = list(self.fn([p.item for p in batch]))
+            if len(results) != len(batch):
+                raise RuntimeError(f"'{self.name}' devolvió {len(results)} resultados para {len(batch)} entradas.")
+        except Exception as e:
+            for p in batch:
+                p.future.set_exception(e)
+            return
+        for p, result in zip(batch, results):
+            p.future.set_result(result)
@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+# Configuración leída del entorno, sin dependencias pesadas: importar este módulo no carga torch.
+# Cambiar al actualizar pesos o modelos: invalida las entradas cacheadas.
+MODEL_VERSION = os.getenv("SPECTRA_MODEL_VERSION", "gpt2+codebert-base+ensemble-v2")
+
+BACKEND = os.getenv("SPECTRA_BACKEND", "torch")
+ONNX_DIR = Path(os.getenv("SPECTRA_ONNX_DIR", "data/models/onnx"))
+ONNX_THREADS = int(os.getenv("SPECTRA_ONNX_THREADS", "0"))
+
+PPL_BATCH_TOKENS = int(os.getenv("SPECTRA_PPL_BATCH_TOKENS", "4096"))
+SLIDING_WINDOW = os.getenv("SPECTRA_PPL_SLIDING", "1") != "0"
+WINDOW_STRIDE = int(os.getenv("SPECTRA_PPL_STRIDE", "512"))
+
+BERT_BATCH_TOKENS = int(os.getenv("SPECTRA_BERT_BATCH_TOKENS", "8192"))
+
+FEATURE_WORKERS = int(os.getenv("SPECTRA_FEATURE_WORKERS", "0"))
+
+# Cascada: AST + estilometría primero; GPT-2 y CodeBERT solo si la estimación barata cae en la banda.
+CASCADE = os.getenv("SPECTRA_CASCADE", "0") == "1"
+CASCADE_LOW = float(os.getenv("SPECTRA_CASCADE_LOW", "0.35"))
+CASCADE_HIGH = float(os.getenv("SPECTRA_CASCADE_HIGH", "0.65"))
+
+# Puntuación por función: cada archivo se divide en funciones/clases de nivel superior.
+CHUNKING = os.getenv("SPECTRA_CHUNKING", "0") == "1"
+CHUNK_MIN_LINES = int(os.getenv("SPECTRA_CHUNK_MIN_LINES", "3"))
+
+# Pesos y umbral del ensemble ajustados offline (python evaluate.py --store ... --fit --export).
+ENSEMBLE_WEIGHTS = Path(os.getenv("SPECTRA_ENSEMBLE_WEIGHTS", "data/models/ensemble_weights.json"))
+
+# Micro-batching entre peticiones: las entradas de todas las peticiones en curso se agrupan en lotes
+# por presupuesto de tokens (0 = el de cada modelo), esperando como máximo WAIT_MS por más entradas.
+MICROBATCH = os.getenv("SPECTRA_MICROBATCH", "0") == "1"
+MICROBATCH_TOKENS = int(os.getenv("SPECTRA_MICROBATCH_TOKENS", "0"))
+MICROBATCH_WAIT_MS = float(os.getenv("SPECTRA_MICROBATCH_WAIT_MS", "10"))
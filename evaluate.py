@@ -1,28 +1,204 @@
-from detectors.ensemble import EnsembleDetector
-from utils.zip_parser import extract_python_files
-from sklearn.metrics import classification_report, f1_score
-import sys
+from detectors.ensemble import (EnsembleDetector, cheap_estimate, load_weights,
+                                COMPONENTS, DEFAULT_WEIGHTS, DEFAULT_THRESHOLD)
+from detectors.settings import ENSEMBLE_WEIGHTS
+from utils.zip_parser import iter_python_files
+from utils.features import extract_features_batch
+from utils.feature_store import STORE_PATH, label_for, load_store
+from utils.batching import chunked
+from sklearn.metrics import accuracy_score, classification_report, f1_score
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import json
+import numpy as np
+
+THRESHOLD = 0.5
 
-detector = EnsembleDetector()
 
 def evaluate(zip_path: str):
-    files = extract_python_files(zip_path)
+    detector = EnsembleDetector()
     y_true = []
     y_pred = []
 
-    for f in files:
-        label = 1 if any(x in f["path"].lower() for x in ["gpt", "ai", "generated"]) else 0
-        prob = detector.detect_probability(f["content"])
-        pred = 1 if prob > 0.5 else 0
-        y_true.append(label)
-        y_pred.append(pred)
+    for chunk in chunked(iter_python_files(zip_path), 32):
+        predictions = detector.predict_batch([f["content"] for f in chunk])
+        for f, res in zip(chunk, predictions):
+            prob = float(res.get("ai_probability", 0.0))
+            y_true.append(label_for(f["path"]))
+            y_pred.append(1 if prob > THRESHOLD else 0)
 
     f1 = f1_score(y_true, y_pred)
     print(f"F1 Score: {f1:.4f}")
     print(classification_report(y_true, y_pred, target_names=["Humano", "IA"]))
 
+
+def calibrate_cascade(zip_path: str, widths: List[float], center: float = THRESHOLD) -> dict:
+    # Puntúa cada archivo una vez con la estimación barata y con el ensemble completo, y simula la
+    # cascada para cada anchura de banda: fuera de la banda se usa la estimación barata.
+    detector = EnsembleDetector(use_cache=False, cascade=False)
+    y_true, cheap, full = [], [], []
+    for chunk in chunked(iter_python_files(zip_path), 32):
+        codes = [f["content"] for f in chunk]
+        features = extract_features_batch(codes)
+        predictions = detector.predict_batch(codes)
+        for f, feats, res in zip(chunk, features, predictions):
+            y_true.append(label_for(f["path"]))
+            cheap.append(cheap_estimate(feats))
+            full.append(float(res.get("ai_probability", 0.0)))
+
+    full_pred = [1 if p > THRESHOLD else 0 for p in full]
+    report = {
+        "files": len(y_true),
+        "full": {"f1": round(f1_score(y_true, full_pred, zero_division=0), 4),
+                 "accuracy": round(accuracy_score(y_true, full_pred), 4)},
+        "bands": [],
+    }
+    for width in widths:
+        low, high = center - width / 2, center + width / 2
+        inside = [low <= c <= high for c in cheap]
+        probs = [f if use_full else c for f, c, use_full in zip(full, cheap, inside)]
+        pred = [1 if p > THRESHOLD else 0 for p in probs]
+        f1 = f1_score(y_true, pred, zero_division=0)
+        accuracy = accuracy_score(y_true, pred)
+        report["bands"].append({
+            "band": [round(low, 3), round(high, 3)],
+            "transformer_fraction": round(sum(inside) / len(inside), 4) if inside else 0.0,
+            "compute_saved": round(1.0 - sum(inside) / len(inside), 4) if inside else 0.0,
+            "f1": round(f1, 4),
+            "f1_loss": round(report["full"]["f1"] - f1, 4),
+            "accuracy": round(accuracy, 4),
+            "accuracy_loss": round(report["full"]["accuracy"] - accuracy, 4),
+            "agreement_with_full": round(sum(a == b for a, b in zip(pred, full_pred)) / len(pred), 4) if pred else 1.0,
+        })
+    return report
+
+
+def store_matrix(store: str = STORE_PATH, strict: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Columnas en el orden de COMPONENTS (probabilidad IA de cada componente), etiquetas y hashes.
+    table = load_store(store, strict)
+    X = np.column_stack([table.column(name).to_numpy() for name in COMPONENTS]).astype(np.float64)
+    y = table.column("label").to_numpy().astype(np.int64)
+    hashes = np.array(table.column("content_hash").to_pylist())
+    return X, y, hashes
+
+
+def combine(X: np.ndarray, weights: List[float], threshold: float = DEFAULT_THRESHOLD) -> np.ndarray:
+    # Misma combinación que EnsembleDetector._combine, vectorizada.
+    w = np.asarray(weights, dtype=np.float64)
+    raw = X @ (w / w.sum())
+    if threshold == 0.5:
+        return raw
+    return np.where(raw <= threshold, 0.5 * raw / threshold, 0.5 + 0.5 * (raw - threshold) / (1.0 - threshold))
+
+
+def score_offline(X: np.ndarray, y: np.ndarray, weights: List[float], threshold: float) -> Dict[str, Any]:
+    pred = (combine(X, weights, threshold) > THRESHOLD).astype(int)
+    return {
+        "files": int(len(y)),
+        "f1": round(f1_score(y, pred, zero_division=0), 4),
+        "accuracy": round(accuracy_score(y, pred), 4),
+        "report": classification_report(y, pred, labels=[0, 1], target_names=["Humano", "IA"], zero_division=0),
+    }
+
+
+def best_threshold(probs: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    # F1 de todos los cortes posibles con una ordenación y sumas acumuladas: O(n log n) por combinación.
+    order = np.argsort(-probs, kind="stable")
+    p, t = probs[order], y[order]
+    tp = np.cumsum(t)
+    fp = np.cumsum(1 - t)
+    fn = t.sum() - tp
+    f1 = 2 * tp / np.maximum(2 * tp + fp + fn, 1)
+    # Solo se puede cortar entre valores distintos.
+    distinct = np.append(p[1:] < p[:-1], True)
+    i = int(np.argmax(np.where(distinct, f1, -1.0)))
+    below = p[i + 1] if i + 1 < len(p) else 0.0
+    threshold = float(np.clip((p[i] + below) / 2, 0.01, 0.99))
+    return threshold, float(f1[i])
+
+
+def fit_weights(X: np.ndarray, y: np.ndarray, step: float = 0.05) -> Dict[str, Any]:
+    # Búsqueda en rejilla sobre el símplex de pesos; para cada combinación, el mejor umbral.
+    n = int(round(1 / step))
+    best = {"f1": -1.0}
+    for a in range(n + 1):
+        for b in range(n + 1 - a):
+            weights = [a / n, b / n, (n - a - b) / n]
+            threshold, f1 = best_threshold(X @ np.asarray(weights), y)
+            if f1 > best["f1"]:
+                best = {"weights": weights, "threshold": threshold, "f1": f1}
+    return best
+
+
+def fit_store(store: str = STORE_PATH, step: float = 0.05, holdout: float = 0.2, force: bool = False) -> Dict[str, Any]:
+    # No se ajusta sobre filas de otros modelos (o mezcladas) salvo con force.
+    # El hash de contenido decide la partición: determinista y sin fugas entre duplicados.
+    X, y, hashes = store_matrix(store, strict=not force)
+    test = np.array([int(h[:8], 16) % 1000 < holdout * 1000 for h in hashes], dtype=bool)
+    split = bool(test.any() and (~test).any())
+    train = ~test if split else np.ones(len(y), dtype=bool)
+    best = fit_weights(X[train], y[train], step)
+    result = {
+        "weights": {name: round(w, 4) for name, w in zip(COMPONENTS, best["weights"])},
+        "threshold": round(best["threshold"], 4),
+        "train_files": int(train.sum()),
+        "train_f1": round(best["f1"], 4),
+    }
+    if split:
+        fitted = score_offline(X[test], y[test], best["weights"], best["threshold"])
+        default = score_offline(X[test], y[test], DEFAULT_WEIGHTS, DEFAULT_THRESHOLD)
+        result.update({"holdout_files": int(test.sum()), "holdout_f1": fitted["f1"],
+                       "holdout_f1_default": default["f1"]})
+    return result
+
+
+def export_weights(fit: Dict[str, Any], path: Path = ENSEMBLE_WEIGHTS, store: Optional[str] = None) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"weights": fit["weights"], "threshold": fit["threshold"],
+               "fitted_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "metrics": {k: v for k, v in fit.items() if k not in ("weights", "threshold")}}
+    if store:
+        payload["store"] = str(store)
+    path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    load_weights(path)
+    return path
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Uso: python evaluate.py <archivo_zip>")
+    parser = argparse.ArgumentParser(description="Evalúa el ensemble sobre un ZIP etiquetado por ruta (gpt/ai/generated = IA)")
+    parser.add_argument("zip_path", nargs="?", help="ZIP con archivos .py")
+    parser.add_argument("--cascade-bands", default=None,
+                        help="Anchuras de banda de incertidumbre a calibrar, p. ej. 0.1,0.2,0.3,0.5")
+    parser.add_argument("--cascade-center", type=float, default=THRESHOLD)
+    parser.add_argument("--store", nargs="?", const=STORE_PATH, default=None,
+                        help="Evalúa sin inferencia sobre el almacén Parquet de utils.feature_store")
+    parser.add_argument("--weights", default=str(ENSEMBLE_WEIGHTS), help="Pesos/umbral a evaluar con --store")
+    parser.add_argument("--fit", action="store_true", help="Ajusta pesos y umbral sobre el almacén")
+    parser.add_argument("--step", type=float, default=0.05, help="Paso de la rejilla de pesos")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fracción reservada para validar el ajuste")
+    parser.add_argument("--export", nargs="?", const=str(ENSEMBLE_WEIGHTS), default=None,
+                        help="Guarda los pesos ajustados (por defecto en SPECTRA_ENSEMBLE_WEIGHTS)")
+    parser.add_argument("--force", action="store_true",
+                        help="Ajusta aunque el almacén sea de otra versión de modelo o mezcle versiones")
+    args = parser.parse_args()
+
+    if args.store and args.fit:
+        fit = fit_store(args.store, args.step, args.holdout, args.force)
+        print(json.dumps(fit, indent=2))
+        if args.export:
+            print(f"[OK] Pesos exportados a {export_weights(fit, args.export, args.store)}")
+    elif args.store:
+        calibration = load_weights(args.weights)
+        X, y, _ = store_matrix(args.store)
+        result = score_offline(X, y, calibration["weights"], calibration["threshold"])
+        print(f"F1 Score: {result['f1']:.4f}")
+        print(result["report"])
+    elif not args.zip_path:
+        parser.error("indica un ZIP o --store")
+    elif args.cascade_bands:
+        bands = [float(w) for w in args.cascade_bands.split(",") if w.strip()]
+        print(json.dumps(calibrate_cascade(args.zip_path, bands, args.cascade_center), indent=2))
     else:
-        evaluate(sys.argv[1])
\ No newline at end of file
+        evaluate(args.zip_path)
@@ -0,0 +1,155 @@
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional
+from utils.batching import chunked
+from utils.manifest import Manifest, RepoAggregates
+from utils import dedup
+from detectors.cache import content_hash
+from detectors.ensemble import format_attribution
+from collections import deque
+import asyncio
+import os
+
+FILE_BATCH = int(os.getenv("SPECTRA_FILE_BATCH", "32"))
+
+
+def hotspot(windows) -> str:
+    if not windows:
+        return ""
+    top = max(windows, key=lambda w: w["score"])
+    return f"líneas {top['start_line']}-{top['end_line']} ({top['score']:.3f})"
+
+
+def build_row(path: str, res: Dict[str, Any], attribution: str, explanation: str,
+              digest: str = "") -> Dict[str, Any]:
+    comps = res.get("components", {})
+    return {
+        "file": path,
+        "ai_probability": round(res.get("ai_probability", 0.0) * 100, 2),
+        "perplexity_score": comps.get("perplexity", {}).get("score", 0.0),
+        "ast_score": comps.get("ast", {}).get("score", 0.0),
+        "codebert_score": comps.get("codebert", {}).get("score", 0.0),
+        "perplexity_hotspot": hotspot(comps.get("perplexity", {}).get("windows")),
+        "stages": ",".join(res.get("stages", [])),
+        "functions": [
+            {k: f.get(k) for k in ("name", "start_line", "end_line", "ai_probability")}
+            for f in res.get("functions", [])
+        ],
+        "attribution": attribution,
+        "explanation": explanation,
+        "content_hash": digest,
+    }
+
+
+async def analyze_files(files: Iterable[Dict[str, str]], executor, explainer,
+                        on_progress: Optional[Callable[[int], None]] = None,
+                        near_duplicates: Optional[dedup.NearDuplicateIndex] = None) -> AsyncIterator[Dict[str, Any]]:
+    if near_duplicates is None and dedup.DEDUP_ENABLED:
+        near_duplicates = dedup.near_duplicates.get()
+    # La versión la fija el executor al cargar los pesos: dedup reutiliza solo filas de esa misma versión.
+    upload = near_duplicates.upload(executor.version) if near_duplicates is not None else None
+    done = 0
+    chunks = chunked(files, FILE_BATCH)
+    while True:
+        # Lectura perezosa: el siguiente lote del ZIP se lee fuera del event loop.
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        # Con dedup solo se puntúa un representante por grupo de casi duplicados (en toda la subida);
+        # el resto hereda sus puntuaciones.
+        plan = await asyncio.to_thread(upload.plan, chunk) if upload is not None else None
+        pending = [i for i in range(len(chunk)) if plan is None or plan[i]["match"] is None]
+        rows: Dict[int, Dict[str, Any]] = {}
+        if pending:
+            subset = [chunk[i] for i in pending]
+            predictions = await executor.predict_batch([f["content"] for f in subset])
+            attributions = [format_attribution(res) for res in predictions]
+            explanations = await explainer.explain_many([
+                (f["content"], res.get("ai_probability", 0.0), attribution)
+                for f, res, attribution in zip(subset, predictions, attributions)
+            ])
+            for i, res, attribution, explanation in zip(pending, predictions, attributions, explanations):
+                py_file = chunk[i]
+                if plan is not None:
+                    digest = plan[i]["content_hash"]
+                else:
+                    digest = py_file.get("content_hash") or content_hash(py_file["content"])
+                rows[i] = build_row(py_file["path"], res, attribution, explanation, digest)
+        ordered = upload.resolve(chunk, plan, rows) if upload is not None else [rows[i] for i in range(len(chunk))]
+
+        for row in ordered:
+            yield row
+            done += 1
+            if on_progress:
+                on_progress(done)
+
+    if upload is not None:
+        # El corpus persistente se actualiza una vez planificada la subida completa.
+        await asyncio.to_thread(upload.record)
+
+
+class IncrementalRun:
+    def __init__(self, base: Manifest, version: str):
+        self.version = version
+        if base.version and base.version != self.version:
+            # Puntuaciones de otra versión del detector: no se pueden reutilizar.
+            base = Manifest()
+        self.base = base
+        self.aggregates = RepoAggregates.from_dict(base.aggregates.to_dict())
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.changes = {"added": 0, "modified": 0, "unchanged": 0, "moved": 0, "removed": 0}
+        self._carried = deque()
+
+    def _changed_files(self, files: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        for f in files:
+            digest = content_hash(f["content"])
+            status, previous = self.base.match(f["path"], digest)
+            if status in ("unchanged", "moved"):
+                self._carried.append({**previous, "status": status})
+            else:
+                yield {**f, "content_hash": digest, "status": status}
+
+    def _record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        status = row["status"]
+        self.changes[status] += 1
+        self.rows[row["file"]] = row
+        if status != "unchanged":
+            previous = self.base.rows.get(row["file"])
+            if previous is not None:
+                self.aggregates.remove(previous)
+            self.aggregates.add(row)
+        return row
+
+    async def run(self, files: Iterable[Dict[str, str]], executor, explainer) -> AsyncIterator[Dict[str, Any]]:
+        # Solo los archivos nuevos o modificados pasan por los modelos; el resto se arrastra del manifiesto.
+        statuses = {}
+
+        def changed():
+            for f in self._changed_files(files):
+                statuses[f["path"]] = f["status"]
+                yield f
+
+        async for row in analyze_files(changed(), executor, explainer):
+            while self._carried:
+                yield self._record(self._carried.popleft())
+            yield self._record({**row, "status": statuses.pop(row["file"], "added")})
+        while self._carried:
+            yield self._record(self._carried.popleft())
+
+        for path, row in self.base.rows.items():
+            if path not in self.rows:
+                self.changes["removed"] += 1
+                self.aggregates.remove(row)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"version": self.version, "changes": dict(self.changes), "aggregates": self.aggregates.to_dict()}
+
+    def manifest(self) -> Dict[str, Any]:
+        return {**Manifest(self.rows, self.version, self.aggregates.to_dict()).to_dict(), "changes": dict(self.changes)}
+
+
+def empty_result() -> Dict[str, Any]:
+    return {
+        "file": "(ningún .py encontrado)",
+        "ai_probability": 0.0,
+        "attribution": "",
+        "explanation": "No se encontraron archivos .py en el ZIP o el ZIP está corrupto."
+    }
@@ -0,0 +1,206 @@
+import argparse
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ANN_DIR = Path(os.getenv("RAG_ANN_DIR", "data/rag_db/ann"))
+NPROBE = int(os.getenv("RAG_ANN_NPROBE", "8"))
+
+
+def export_from_chroma(collection, out_dir: Path = ANN_DIR, page: int = 2048) -> int:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    total = collection.count()
+    matrix = None
+    offsets = []
+    row = 0
+    with open(out_dir / "records.jsonl", "wb") as records:
+        for start in range(0, total, page):
+            chunk = collection.get(limit=page, offset=start, include=["embeddings", "documents", "metadatas"])
+            embeddings = np.asarray(chunk["embeddings"], dtype=np.float32)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(out_dir / "embeddings.npy", mode="w+",
+                                                   dtype=np.float32, shape=(total, embeddings.shape[1]))
+            matrix[row:row + len(embeddings)] = embeddings
+            for doc_id, doc, meta in zip(chunk["ids"], chunk["documents"], chunk["metadatas"]):
+                offsets.append(records.tell())
+                records.write(json.dumps({"id": doc_id, "document": doc, **(meta or {})}, ensure_ascii=False).encode("utf-8") + b"\n")
+            row += len(embeddings)
+    if matrix is not None:
+        matrix.flush()
+    np.save(out_dir / "records_offsets.npy", np.asarray(offsets, dtype=np.int64))
+    return row
+
+
+def _sq_dists(queries: np.ndarray, points: np.ndarray, point_norms: np.ndarray) -> np.ndarray:
+    # Distancia L2 al cuadrado, la misma que usa Chroma por defecto.
+    q_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+    return np.maximum(q_norms - 2.0 * queries @ points.T + point_norms[None, :], 0.0)
+
+
+def build_ivf(out_dir: Path = ANN_DIR, nlist: Optional[int] = None, iters: int = 15,
+              sample: int = 50_000, chunk: int = 16_384, seed: int = 0) -> int:
+    matrix = np.load(out_dir / "embeddings.npy", mmap_mode="r")
+    n = matrix.shape[0]
+    nlist = nlist or max(1, min(n, int(4 * math.sqrt(n))))
+    rng = np.random.default_rng(seed)
+    train = np.asarray(matrix[np.sort(rng.choice(n, size=min(n, sample), replace=False))])
+
+    centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _sq_dists(train, centroids, np.einsum("ij,ij->i", centroids, centroids)).argmin(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=nlist)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assign = np.empty(n, dtype=np.int32)
+    norms = np.empty(n, dtype=np.float32)
+    for start in range(0, n, chunk):
+        block = np.asarray(matrix[start:start + chunk])
+        assign[start:start + len(block)] = _sq_dists(block, centroids, c_norms).argmin(axis=1)
+        norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+
+    order = np.argsort(assign, kind="stable").astype(np.int64)
+    list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assign, minlength=nlist), out=list_offsets[1:])
+    np.save(out_dir / "centroids.npy", centroids.astype(np.float32))
+    np.save(out_dir / "list_order.npy", order)
+    np.save(out_dir / "list_offsets.npy", list_offsets)
+    np.save(out_dir / "norms.npy", norms)
+    return nlist
+
+
+class AnnIndex:
+    def __init__(self, index_dir: Path = ANN_DIR):
+        self.dir = Path(index_dir)
+        self.matrix = np.load(self.dir / "embeddings.npy", mmap_mode="r")
+        self.norms = np.load(self.dir / "norms.npy", mmap_mode="r")
+        self.centroids = np.load(self.dir / "centroids.npy")
+        self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.order = np.load(self.dir / "list_order.npy", mmap_mode="r")
+        self.list_offsets = np.load(self.dir / "list_offsets.npy")
+        self.record_offsets = np.load(self.dir / "records_offsets.npy", mmap_mode="r")
+        self._records = open(self.dir / "records.jsonl", "rb")
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search_ids(self, queries: np.ndarray, k: int = 3, nprobe: int = NPROBE):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        probes = np.argsort(_sq_dists(queries, self.centroids, self.centroid_norms), axis=1)[:, :nprobe]
+        all_rows, all_dists = [], []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([self.order[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+            if len(rows) == 0:
+                all_rows.append(np.empty(0, dtype=np.int64))
+                all_dists.append(np.empty(0, dtype=np.float32))
+                continue
+            rows.sort()  # acceso secuencial al mmap
+            dists = _sq_dists(query[None, :], np.asarray(self.matrix[rows]), np.asarray(self.norms[rows]))[0]
+            top = np.argsort(dists)[:k]
+            all_rows.append(rows[top])
+            all_dists.append(dists[top])
+        return all_rows, all_dists
+
+    def exact_ids(self, queries: np.ndarray, k: int = 3, chunk: int = 65_536):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_i = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), chunk):
+            block = np.asarray(self.matrix[start:start + chunk])
+            d = _sq_dists(queries, block, np.asarray(self.norms[start:start + chunk]))
+            cand_d = np.concatenate([best_d, d], axis=1)
+            cand_i = np.concatenate([best_i, np.broadcast_to(np.arange(start, start + len(block)), d.shape)], axis=1)
+            top = np.argsort(cand_d, axis=1)[:, :k]
+            best_d = np.take_along_axis(cand_d, top, axis=1)
+            best_i = np.take_along_axis(cand_i, top, axis=1)
+        return list(best_i), list(best_d)
+
+    def record(self, row: int) -> Dict:
+        self._records.seek(int(self.record_offsets[row]))
+        return json.loads(self._records.readline())
+
+    def search(self, queries: np.ndarray, k: int = 3, nprobe: int = NPROBE) -> List[List[Dict]]:
+        rows, dists = self.search_ids(queries, k, nprobe)
+        return [
+            [{**self.record(r), "distance": float(d)} for r, d in zip(q_rows, q_dists)]
+            for q_rows, q_dists in zip(rows, dists)
+        ]
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    arr = np.asarray(values) * 1000.0
+    return {"mean_ms": round(float(arr.mean()), 3), "p50_ms": round(float(np.percentile(arr, 50)), 3),
+            "p95_ms": round(float(np.percentile(arr, 95)), 3)}
+
+
+def benchmark(index: AnnIndex, collection=None, queries: int = 200, k: int = 3,
+              nprobe: int = NPROBE, noise: float = 0.05, seed: int = 0) -> Dict:
+    # Consultas: vectores del índice con ruido gaussiano; la verdad de referencia es la búsqueda exacta.
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=min(queries, len(index)), replace=False)
+    base = np.asarray(index.matrix[np.sort(rows)])
+    q = base + rng.normal(0.0, noise * float(np.abs(base).mean()), size=base.shape).astype(np.float32)
+
+    truth, _ = index.exact_ids(q, k)
+    truth_ids = [{index.record(r)["id"] for r in t} for t in truth]
+
+    report = {"index_size": len(index), "queries": len(q), "k": k, "nprobe": nprobe}
+    latencies = []
+    ann_rows = []
+    for vec in q:
+        start = time.perf_counter()
+        found, _ = index.search_ids(vec, k, nprobe)
+        latencies.append(time.perf_counter() - start)
+        ann_rows.append(found[0])
+    start = time.perf_counter()
+    index.search_ids(q, k, nprobe)
+    batch_s = time.perf_counter() - start
+    recall = np.mean([len(t & {index.record(r)["id"] for r in f}) / k for t, f in zip(truth_ids, ann_rows)])
+    report["ann"] = {"recall_at_k": round(float(recall), 4), **_percentiles(latencies),
+                     "batch_ms_per_query": round(batch_s * 1000.0 / len(q), 3)}
+
+    if collection is not None:
+        latencies = []
+        hits = []
+        for vec, t in zip(q, truth_ids):
+            start = time.perf_counter()
+            res = collection.query(query_embeddings=[vec.tolist()], n_results=k, include=["distances"])
+            latencies.append(time.perf_counter() - start)
+            hits.append(len(t & set(res["ids"][0])) / k)
+        report["chroma"] = {"recall_at_k": round(float(np.mean(hits)), 4), **_percentiles(latencies)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice ANN (IVF sobre NumPy mmap) para el RAG")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Exporta los embeddings de Chroma y construye el índice IVF")
+    build.add_argument("--nlist", type=int, default=None)
+    bench = sub.add_parser("bench", help="Compara recall@k y latencia frente a Chroma")
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--k", type=int, default=3)
+    bench.add_argument("--nprobe", type=int, default=NPROBE)
+    bench.add_argument("--no-chroma", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from rag.query_rag import collection
+
+        rows = export_from_chroma(collection.get())
+        nlist = build_ivf(nlist=args.nlist)
+        print(f"[OK] {rows} vectores, {nlist} listas IVF en {ANN_DIR}")
+    else:
+        chroma = None
+        if not args.no_chroma:
+            from rag.query_rag import collection
+
+            chroma = collection.get()
+        print(json.dumps(benchmark(AnnIndex(), chroma, args.queries, args.k, args.nprobe), indent=2))
@@ -1,23 +1,26 @@
 import os
+import io
+import sys
 import json
+import gzip
+import hashlib
+import argparse
 import zipfile
-import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
-import chromadb
-from chromadb.utils import embedding_functions
+from typing import Dict, Iterator, Optional, Tuple
 import requests
 from tqdm import tqdm
-import pandas as pd
 
 DATA_DIR = Path("data/rag_db")
-DATA_DIR.mkdir(exist_ok=True)
 CHROMA_PATH = DATA_DIR / "chroma"
-CHROMA_PATH.mkdir(exist_ok=True)
-
-embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="microsoft/codebert-base")
-client = chromadb.PersistentClient(path=str(CHROMA_PATH))
-collection = client.get_or_create_collection(name="python_ai_code_knowledge", embedding_function=embedding_fn)
+DOWNLOAD_DIR = DATA_DIR / "downloads"
+CHECKPOINT_PATH = DATA_DIR / "checkpoint.json"
+COLLECTION_NAME = "python_ai_code_knowledge"
+BATCH_SIZE = int(os.getenv("RAG_BATCH_SIZE", "256"))
+WORKERS = int(os.getenv("RAG_WORKERS", "2"))
+SOURCES_DIR = os.getenv("RAG_SOURCES_DIR", "")
 
 DATASETS = {
     "MBPP": {
@@ -47,103 +50,214 @@ DATASETS = {
 }
 
 
+def get_collection():
+    import chromadb
+    from detectors.encoder import shared_encoder
+
+    CHROMA_PATH.mkdir(parents=True, exist_ok=True)
+    # El encoder CodeBERT compartido (pooling medio, igual que SentenceTransformer) embebe los
+    # documentos; la colección no carga una segunda copia del modelo.
+    encoder = shared_encoder.get()
+
+    def embedding_fn(docs):
+        return encoder.embed(docs).tolist()
+
+    client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+    collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=None)
+    return collection, embedding_fn
+
+
 def download_file(url: str, dest: Path):
     if dest.exists():
         print(f"[SKIP] {dest.name}")
         return
     print(f"[DOWNLOAD] {url}")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    partial = dest.with_suffix(dest.suffix + ".part")
     response = requests.get(url, stream=True)
     response.raise_for_status()
-    with open(dest, "wb") as f:
+    with open(partial, "wb") as f:
         for chunk in tqdm(response.iter_content(8192), desc="Downloading"):
             f.write(chunk)
+    partial.rename(dest)
     print(f"[OK] Saved {dest}")
 
 
-def process_jsonl(url: str, label: str) -> List[Dict]:
-    dest = DATA_DIR / "temp.jsonl"
-    download_file(url, dest)
-    docs = []
-    with open(dest, "r", encoding="utf-8") as f:
+def resolve_source(name: str, info: Dict, overrides: Dict[str, str]) -> Tuple[Path, bool]:
+    # Devuelve la ruta del dataset y si es un archivo local (que nunca se borra).
+    if name in overrides:
+        return Path(overrides[name]), True
+    if SOURCES_DIR:
+        local = Path(SOURCES_DIR) / f"{name}.{info['format']}"
+        if local.exists():
+            return local, True
+    dest = DOWNLOAD_DIR / f"{name}.{info['format']}"
+    download_file(info["url"], dest)
+    return dest, False
+
+
+def iter_jsonl(path: Path) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
         for line_num, line in enumerate(f):
             try:
                 data = json.loads(line)
-                code = data.get("code", "") or data.get("text", "")
-                if code and "def " in code and len(code) > 50:
-                    docs.append({"content": code[:3000], "label": label, "source": f"mbpp_{line_num}"})
             except:
                 continue
-    os.unlink(dest)
-    return docs
+            code = data.get("code", "") or data.get("text", "")
+            if code and "def " in code and len(code) > 50:
+                yield {"content": code[:3000], "source": f"mbpp_{line_num}"}
 
 
-def process_json(url: str, label: str) -> List[Dict]:
-    dest = DATA_DIR / "temp.json"
-    download_file(url, dest)
-    docs = []
-    with open(dest, "r", encoding="utf-8") as f:
+def iter_json(path: Path, url: str) -> Iterator[Dict]:
+    # Un array JSON no admite lectura incremental con la librería estándar; se recorre al vuelo.
+    with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
-        for i, item in enumerate(data):
-            code = item.get("code", "") or item.get("solution", "")
-            if code and len(code) > 50:
-                docs.append({"content": code[:3000], "label": label, "source": f"{Path(url).stem}_{i}"})
-    os.unlink(dest)
-    return docs
-
-
-def process_zip(url: str, label: str) -> List[Dict]:
-    dest_zip = DATA_DIR / "temp.zip"
-    download_file(url, dest_zip)
-    docs = []
-    with zipfile.ZipFile(dest_zip, "r") as z:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            z.extractall(tmpdir)
-            tmp_path = Path(tmpdir)
-            for jsonl_file in tmp_path.rglob("*.jsonl"):
-                with open(jsonl_file, "r", encoding="utf-8") as f:
-                    for line_num, line in enumerate(f):
-                        try:
-                            data = json.loads(line)
-                            code = data.get("code", "")
-                            if code and len(code) > 100:
-                                docs.append({
-                                    "content": code[:3000],
-                                    "label": label,
-                                    "source": str(jsonl_file.relative_to(tmp_path)) + f"_{line_num}",
-                                })
-                        except:
-                            continue
-    os.unlink(dest_zip)
-    return docs
-
-
-def build_rag():
+    for i, item in enumerate(data):
+        code = item.get("code", "") or item.get("solution", "")
+        if code and len(code) > 50:
+            yield {"content": code[:3000], "source": f"{Path(url).stem}_{i}"}
+
+
+def iter_zip(path: Path) -> Iterator[Dict]:
+    with zipfile.ZipFile(path, "r") as z:
+        for info in z.infolist():
+            name = info.filename
+            if not (name.endswith(".jsonl") or name.endswith(".jsonl.gz")):
+                continue
+            with z.open(info) as raw:
+                stream = gzip.open(raw, "rt", encoding="utf-8") if name.endswith(".gz") \
+                    else io.TextIOWrapper(raw, encoding="utf-8")
+                for line_num, line in enumerate(stream):
+                    try:
+                        data = json.loads(line)
+                    except:
+                        continue
+                    code = data.get("code", "")
+                    if code and len(code) > 100:
+                        yield {"content": code[:3000], "source": f"{name}_{line_num}"}
+
+
+def iter_dataset(path: Path, info: Dict) -> Iterator[Dict]:
+    if info["format"] == "jsonl":
+        return iter_jsonl(path)
+    if info["format"] == "json":
+        return iter_json(path, info["url"])
+    if info["format"] == "zip":
+        return iter_zip(path)
+    return iter(())
+
+
+def doc_id(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", errors="ignore")).hexdigest()[:32]
+
+
+def load_checkpoint() -> Dict:
+    if CHECKPOINT_PATH.exists():
+        return json.loads(CHECKPOINT_PATH.read_text())
+    return {}
+
+
+def save_checkpoint(checkpoint: Dict):
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2))
+    tmp.replace(CHECKPOINT_PATH)
+
+
+def iter_batches(docs: Iterator[Dict], start: int, batch_size: int) -> Iterator[Tuple[int, list]]:
+    # Agrupa documentos saltando los ya indexados; cada lote lleva el offset en que termina.
+    batch = []
+    seen = set()
+    offset = 0
+    for offset, doc in enumerate(docs, start=1):
+        if offset <= start:
+            continue
+        key = doc_id(doc["content"])
+        if key in seen:
+            continue
+        seen.add(key)
+        batch.append((key, doc))
+        if len(batch) >= batch_size:
+            yield offset, batch
+            batch = []
+            seen = set()
+    if batch:
+        yield offset, batch
+
+
+def index_dataset(name: str, info: Dict, path: Path, collection, embedding_fn, checkpoint: Dict,
+                  batch_size: int, workers: int) -> int:
+    state = checkpoint.setdefault(name, {"offset": 0, "done": False})
+    if state["done"]:
+        print(f"   [SKIP] ya indexado ({state['offset']} registros)\n")
+        return 0
+    if state["offset"]:
+        print(f"   Reanudando desde el registro {state['offset']}")
+
+    indexed = 0
+    pending = deque()
+    progress = tqdm(desc="Indexando", unit="docs")
+
+    def flush_one():
+        nonlocal indexed
+        offset, batch, future = pending.popleft()
+        embeddings = future.result()
+        collection.upsert(
+            ids=[key for key, _ in batch],
+            embeddings=embeddings,
+            documents=[doc["content"] for _, doc in batch],
+            metadatas=[
+                {"label": info["label"], "source": doc["source"], "paper": info["paper"], "dataset": name}
+                for _, doc in batch
+            ],
+        )
+        # El checkpoint solo avanza en orden, tras persistir el lote.
+        state["offset"] = offset
+        save_checkpoint(checkpoint)
+        indexed += len(batch)
+        progress.update(len(batch))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for offset, batch in iter_batches(iter_dataset(path, info), state["offset"], batch_size):
+                future = pool.submit(embedding_fn, [doc["content"] for _, doc in batch])
+                pending.append((offset, batch, future))
+                if len(pending) >= max(1, workers) * 2:
+                    flush_one()
+            while pending:
+                flush_one()
+    finally:
+        progress.close()
+
+    state["done"] = True
+    save_checkpoint(checkpoint)
+    return indexed
+
+
+def build_rag(overrides: Optional[Dict[str, str]] = None, only: Optional[list] = None,
+              batch_size: int = BATCH_SIZE, workers: int = WORKERS, keep_downloads: bool = False):
     print("Construyendo RAG con datasets Python de GitHub/HF...\n")
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    collection, embedding_fn = get_collection()
+    checkpoint = load_checkpoint()
+    overrides = overrides or {}
     total_docs = 0
     for name, info in DATASETS.items():
+        if only and name not in only:
+            continue
         print(f"Procesando: {name} ({info['paper']})")
         try:
-            if info["format"] == "jsonl":
-                docs = process_jsonl(info["url"], info["label"])
-            elif info["format"] == "json":
-                docs = process_json(info["url"], info["label"])
-            elif info["format"] == "zip":
-                docs = process_zip(info["url"], info["label"])
-            else:
-                docs = []
-
-            if docs:
-                print(f"   {len(docs)} docs extraídos")
-                for i, doc in enumerate(tqdm(docs, desc="Indexando")):
-                    collection.add(
-                        ids=[f"{name}_{i}"],
-                        documents=[doc["content"]],
-                        metadatas=[{"label": doc["label"], "source": doc["source"], "paper": info["paper"]}],
-                    )
-                total_docs += len(docs)
-                print(f"   Indexados en ChromaDB\n")
+            if checkpoint.get(name, {}).get("done"):
+                print(f"   [SKIP] ya indexado\n")
+                continue
+            path, is_local = resolve_source(name, info, overrides)
+            count = index_dataset(name, info, path, collection, embedding_fn, checkpoint, batch_size, workers)
+            total_docs += count
+            if count:
+                print(f"   {count} docs indexados en ChromaDB\n")
             else:
                 print(f"   No docs encontrados\n")
+            if not is_local and not keep_downloads:
+                path.unlink(missing_ok=True)
         except Exception as e:
             print(f"   [ERROR] {e}\n")
 
@@ -151,4 +265,22 @@ def build_rag():
 
 
 if __name__ == "__main__":
-    build_rag()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Construye la base RAG (ChromaDB) con datasets Python")
+    parser.add_argument("--source", action="append", default=[], metavar="NOMBRE=RUTA",
+                        help="Usa un archivo local para el dataset indicado (modo offline)")
+    parser.add_argument("--only", action="append", help="Indexa solo estos datasets")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--keep-downloads", action="store_true")
+    parser.add_argument("--reset", action="store_true", help="Ignora el checkpoint y vuelve a indexar todo")
+    args = parser.parse_args()
+
+    if args.reset:
+        CHECKPOINT_PATH.unlink(missing_ok=True)
+    sources = {}
+    for item in args.source:
+        if "=" not in item:
+            sys.exit(f"--source espera NOMBRE=RUTA, recibido: {item}")
+        key, value = item.split("=", 1)
+        sources[key] = value
+    build_rag(sources, args.only, args.batch_size, args.workers, args.keep_downloads)
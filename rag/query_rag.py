@@ -1,29 +1,73 @@
-import chromadb
-from chromadb.utils import embedding_functions
+from utils.startup import LazyComponent
+from typing import Dict, List, Optional
+import numpy as np
+import os
 
-client = chromadb.PersistentClient(path="data/rag_db/chroma")
-embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="microsoft/codebert-base")
-collection = client.get_collection(name="python_ai_code_knowledge", embedding_function=embedding_fn)
+CHROMA_PATH = "data/rag_db/chroma"
+RAG_ENGINE = os.getenv("RAG_ENGINE", "chroma")  # chroma | ann
 
-def query_rag(code: str, n_results: int = 3) -> str:
-    results = collection.query(
-        query_texts=[code[:1000]],
+
+def _load_collection():
+    # chromadb solo se importa en la primera consulta. Sin función de embedding propia: las
+    # consultas llegan ya embebidas por el encoder CodeBERT compartido con el clasificador.
+    import chromadb
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return client.get_collection(name="python_ai_code_knowledge", embedding_function=None)
+
+
+def _load_ann():
+    from rag.ann_index import AnnIndex
+    return AnnIndex()
+
+
+collection = LazyComponent("rag", _load_collection)
+ann_index = LazyComponent("rag_ann", _load_ann)
+
+
+def embed_queries(codes: List[str]) -> np.ndarray:
+    # Mismo encoder (y mismos pesos) que el clasificador: si el código ya se clasificó, su
+    # embedding sale de la caché del encoder sin una segunda pasada.
+    from detectors.encoder import shared_encoder
+    return shared_encoder.get().embed(codes)
+
+
+def query_rag_batch(codes: List[str], n_results: int = 3, engine: str = RAG_ENGINE,
+                    embeddings: Optional[np.ndarray] = None) -> List[List[Dict]]:
+    if not codes:
+        return []
+    if embeddings is None:
+        embeddings = embed_queries(codes)
+    if engine == "ann":
+        return ann_index.get().search(embeddings, n_results)
+
+    results = collection.get().query(
+        query_embeddings=np.asarray(embeddings, dtype=np.float32).tolist(),
         n_results=n_results,
         include=["documents", "metadatas", "distances"]
     )
-    
+    return [
+        [{"id": i, "document": doc, "distance": dist, **(meta or {})}
+         for i, doc, meta, dist in zip(ids, docs, metas, dists)]
+        for ids, docs, metas, dists in zip(
+            results["ids"], results["documents"], results["metadatas"], results["distances"]
+        )
+    ]
+
+
+def format_context(records: List[Dict]) -> str:
     context = ""
-    for i, (doc, meta, dist) in enumerate(zip(
-        results["documents"][0],
-        results["metadatas"][0],
-        results["distances"][0]
-    )):
+    for i, rec in enumerate(records):
         context += f"""
-=== EJEMPLO {i+1} (Distancia: {dist:.4f}) ===
-Fuente: {meta['source']}
-Etiqueta: {meta['label']}
-Dataset: {meta['dataset']} ({meta['paper']})
+=== EJEMPLO {i+1} (Distancia: {rec['distance']:.4f}) ===
+Fuente: {rec.get('source', '')}
+Etiqueta: {rec.get('label', '')}
+Dataset: {rec.get('dataset', 'desconocido')} ({rec.get('paper', '')})
 Código:
-{doc}
+{rec.get('document', '')}
 """
-    return context.strip()
\ No newline at end of file
+    return context.strip()
+
+
+def query_rag(code: str, n_results: int = 3) -> str:
+    return format_context(query_rag_batch([code], n_results)[0])
@@ -0,0 +1,29 @@
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+
+class FakeExecutor:
+    # Sustituye a InferenceExecutor sin modelos: la probabilidad depende solo del contenido.
+    def __init__(self, version: str = "test-v1"):
+        self.version = version
+        self.scored: List[str] = []
+
+    async def predict_batch(self, codes: List[str]) -> List[Dict[str, Any]]:
+        self.scored.extend(codes)
+        return [{"ai_probability": (len(code) % 10) / 10, "components": {}, "stages": ["ast"]} for code in codes]
+
+
+class FakeExplainer:
+    async def explain_many(self, items: List[Tuple[str, float, str]]) -> List[str]:
+        return [f"explicación {len(code)}" for code, _, _ in items]
+
+
+@pytest.fixture
+def executor():
+    return FakeExecutor()
+
+
+@pytest.fixture
+def explainer():
+    return FakeExplainer()
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+from agent import SKIPPED_EXPLANATION, ExplanationStage, TokenBucket
+from detectors.cache import ResultCache
+
+
+class StubRateLimit(Exception):
+    pass
+
+
+class StubClient:
+    # Imita client.chat.completions.create de AsyncOpenAI; falla las primeras `failures` llamadas.
+    def __init__(self, failures: int = 0, error: type = StubRateLimit, delay: float = 0.0):
+        self.failures = failures
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.failures:
+                raise self.error("límite")
+            message = SimpleNamespace(content=f"  Explicación {self.calls}.  ")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def retryable(monkeypatch):
+    # Los errores reintentables son los de openai; con el cliente simulado, StubRateLimit.
+    monkeypatch.setattr(agent, "_retryable_errors", lambda: (StubRateLimit,))
+
+
+def _stage(client, **kwargs):
+    kwargs = {"rate": 0, "retries": 0, "use_cache": False, **kwargs}
+    return ExplanationStage(client=client, **kwargs)
+
+
+def test_below_threshold_skips_the_client():
+    client = StubClient()
+    stage = _stage(client, threshold=0.5)
+    assert asyncio.run(stage.explain("x = 1", 0.2, "-")) == SKIPPED_EXPLANATION
+    assert asyncio.run(stage.explain("x = 1", 0.8, "-")) == "Explicación 1."
+    assert client.calls == 1
+
+
+def test_retries_retryable_errors():
+    client = StubClient(failures=1)
+    assert asyncio.run(_stage(client, retries=1).explain("x = 1", 0.9, "-")) == "Explicación 2."
+    assert client.calls == 2
+
+    client = StubClient(failures=5)
+    text = asyncio.run(_stage(client, retries=1).explain("x = 1", 0.9, "-"))
+    assert text.startswith("Error con OpenAI") and client.calls == 2
+
+
+def test_other_errors_are_not_retried():
+    client = StubClient(failures=1, error=ValueError)
+    text = asyncio.run(_stage(client, retries=3).explain("x = 1", 0.9, "-"))
+    assert text == "Error con OpenAI: límite" and client.calls == 1
+
+
+def test_concurrency_and_rate_limit():
+    client = StubClient(delay=0.01)
+    stage = _stage(client, concurrency=2)
+    texts = asyncio.run(stage.explain_many([(f"x = {i}", 0.9, "-") for i in range(6)]))
+    assert len(texts) == 6 and client.max_in_flight == 2
+
+    bucket = TokenBucket(rate=20.0, capacity=1)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    asyncio.run(take(3))
+    # La primera ficha está disponible; las otras dos esperan 1/20 s cada una.
+    assert time.monotonic() - start >= 0.09
+
+
+def test_cache_reuses_explanation_per_probability_bucket():
+    client = StubClient()
+    stage = _stage(client)
+    stage.cache = ResultCache("explain-test", path=None, table="explanations")
+
+    async def run():
+        first = await stage.explain("x = 1", 0.81, "-")
+        again = await stage.explain("x = 1", 0.79, "-")
+        other = await stage.explain("x = 1", 0.55, "-")
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first == again == "Explicación 1."
+    assert other == "Explicación 2." and client.calls == 2
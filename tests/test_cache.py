@@ -0,0 +1,89 @@
+from detectors.cache import ResultCache, content_hash
+
+
+def _cache(tmp_path, **kwargs):
+    return ResultCache("v1", str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def test_key_ignores_trailing_whitespace_and_line_endings(tmp_path):
+    cache = _cache(tmp_path)
+    assert content_hash("x = 1  \r\ny = 2\n\n") == content_hash("x = 1\ny = 2")
+    assert cache.key("x = 1") == cache.key("x = 1\n")
+    assert cache.key("x = 1") != cache.key("x = 1", 0.5)
+    assert cache.key("x = 1") != ResultCache("v2", None).key("x = 1")
+
+
+def test_counters_and_hit_rate(tmp_path):
+    cache = _cache(tmp_path)
+    key = cache.key("a")
+    assert cache.get(key) is None
+    cache.put(key, {"score": 1})
+    assert cache.get(key) == {"score": 1}
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"], stats["writes"]) == (1, 0, 1, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["version"] == "v1"
+
+
+def test_memory_lru_eviction_falls_back_to_disk(tmp_path):
+    cache = _cache(tmp_path, max_memory_items=2)
+    keys = [cache.key(c) for c in "abc"]
+    for i, key in enumerate(keys):
+        cache.put(key, {"i": i})
+    assert cache.stats()["memory_items"] == 2
+    # "a" salió de memoria (LRU) pero sigue en disco.
+    assert cache.get(keys[0]) == {"i": 0}
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get(keys[0]) == {"i": 0}
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_memory_only_cache_forgets_evicted_items():
+    cache = ResultCache("v1", None, max_memory_items=1)
+    cache.put(cache.key("a"), {"i": 0})
+    cache.put(cache.key("b"), {"i": 1})
+    assert cache.get(cache.key("a")) is None
+    assert cache.get(cache.key("b")) == {"i": 1}
+
+
+def test_disk_eviction_keeps_size_under_limit(tmp_path):
+    cache = _cache(tmp_path, max_memory_items=1, max_disk_bytes=100)
+    for i in range(10):
+        cache.put(cache.key(str(i)), {"payload": "x" * 20, "i": i})
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 100
+    assert stats["evictions"] > 0
+    # Se expulsan primero los de acceso más antiguo.
+    assert cache.get(cache.key("0")) is None
+    assert cache.get(cache.key("9")) == {"payload": "x" * 20, "i": 9}
+
+
+def test_disk_contents_survive_restart(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put(cache.key("a"), {"i": 0})
+    reopened = _cache(tmp_path)
+    assert reopened.get(reopened.key("a")) == {"i": 0}
+    assert reopened.stats()["disk_bytes"] == cache.stats()["disk_bytes"]
+
+
+def test_resolve_computes_only_misses_and_skips_errors(tmp_path):
+    cache = _cache(tmp_path)
+    calls = []
+
+    def compute(codes):
+        calls.append(list(codes))
+        return [{"error": "fallo"} if code == "bad" else {"len": len(code)} for code in codes]
+
+    assert cache.resolve(["aa", "bad"], compute) == [{"len": 2}, {"error": "fallo"}]
+    assert cache.resolve(["aa", "bad", "ccc"], compute) == [{"len": 2}, {"error": "fallo"}, {"len": 3}]
+    assert calls == [["aa", "bad"], ["bad", "ccc"]]
+
+
+def test_get_many_matches_get(tmp_path):
+    cache = _cache(tmp_path, max_memory_items=1)
+    cache.put_many([(cache.key("a"), {"i": 0}), (cache.key("b"), {"i": 1})])
+    keys = [cache.key("a"), cache.key("b"), cache.key("z")]
+    assert cache.get_many(keys) == [{"i": 0}, {"i": 1}, None]
+    stats = cache.stats()
+    assert stats["writes"] == 2 and stats["misses"] == 1
+    assert stats["memory_hits"] + stats["disk_hits"] == 2
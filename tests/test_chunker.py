@@ -0,0 +1,10 @@
+from utils.chunker import split_units
+
+
+def test_form_feed_does_not_shift_function_lines():
+    code = "import os\n\x0c\ndef f(x):\n    y = x + 1\n    return y\n\nVALUE = 1\r\nOTHER = 2\n"
+    units = {u["name"]: u for u in split_units(code)}
+    f = units["f"]
+    assert (f["start_line"], f["end_line"]) == (3, 5)
+    assert f["code"].startswith("def f(x):")
+    assert units["<module>"]["lines"] == [1, 7, 8]
@@ -0,0 +1,163 @@
+import asyncio
+
+from pipeline import analyze_files
+from utils import dedup
+from utils.dedup import NearDuplicateIndex, cluster_report, propagate, signature, similarity
+
+ORIGINAL = '''
+def merge_intervals(intervals):
+    # Ordena por inicio y fusiona solapados
+    intervals = sorted(intervals, key=lambda item: item[0])
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+'''
+# Mismo código con otros nombres, otro comentario y otro literal: los tokens normalizados coinciden.
+RENAMED = ORIGINAL.replace("intervals", "ranges").replace("merged", "out").replace("# Ordena", "# Otro comentario")
+OTHER = '''
+class Counter:
+    def __init__(self, start=0):
+        self.value = start
+        self.history = []
+
+    def increment(self, step=1):
+        self.history.append(self.value)
+        self.value += step
+        return self.value
+
+    def undo(self):
+        if self.history:
+            self.value = self.history.pop()
+        return self.value
+'''
+
+
+def _files(*items):
+    return [{"path": path, "content": content} for path, content in items]
+
+
+def _collect(agen):
+    async def run():
+        return [row async for row in agen]
+    return asyncio.run(run())
+
+
+def test_signature_normalizes_names_and_skips_tiny_files():
+    assert signature("x = 1\n") is None
+    a, b, c = signature(ORIGINAL), signature(RENAMED), signature(OTHER)
+    assert similarity(a, b) == 1.0
+    assert similarity(a, c) < 0.5
+    assert len(dedup.band_keys(a)) == dedup.BANDS
+
+
+def test_plan_groups_near_duplicates_within_upload():
+    index = NearDuplicateIndex(path=None)
+    files = _files(("a.py", ORIGINAL), ("b.py", RENAMED), ("c.py", OTHER), ("d.py", "x = 1\n"))
+    plan = index.plan(files, "v1")
+    assert plan[0]["match"] is None and plan[2]["match"] is None and plan[3]["match"] is None
+    assert plan[1]["match"]["source"] == "upload"
+    assert plan[1]["match"]["index"] == 0
+    stats = index.stats()
+    assert (stats["upload_hits"], stats["scored"], stats["skipped"]) == (1, 2, 1)
+
+
+def test_only_representatives_are_scored(executor, explainer):
+    index = NearDuplicateIndex(path=None)
+    files = _files(("a.py", ORIGINAL), ("b.py", RENAMED), ("c.py", OTHER))
+    rows = _collect(analyze_files(files, executor, explainer, near_duplicates=index))
+    assert executor.scored == [ORIGINAL, OTHER]
+    assert [r["file"] for r in rows] == ["a.py", "b.py", "c.py"]
+    assert rows[1]["ai_probability"] == rows[0]["ai_probability"]
+    assert rows[1]["duplicate_of"]["file"] == "a.py"
+    assert rows[1]["explanation"].startswith("Casi duplicado de a.py")
+
+
+def test_corpus_match_copies_scores_only(executor, explainer):
+    index = NearDuplicateIndex(path=None)
+    first = _collect(analyze_files(_files(("secret/a.py", ORIGINAL)), executor, explainer, near_duplicates=index))
+    executor.scored.clear()
+    rows = _collect(analyze_files(_files(("mine/b.py", RENAMED)), executor, explainer, near_duplicates=index))
+
+    assert executor.scored == []
+    row = rows[0]
+    assert row["file"] == "mine/b.py"
+    assert row["ai_probability"] == first[0]["ai_probability"]
+    assert row["duplicate_of"]["source"] == "corpus"
+    assert "file" not in row["duplicate_of"]
+    assert row["duplicate_of"]["content_hash"] == first[0]["content_hash"]
+    assert "secret" not in str(row)
+    assert row["explanation"] != first[0]["explanation"]
+    assert index.stats()["corpus_hits"] == 1
+
+
+def test_corpus_ignores_other_detector_versions():
+    index = NearDuplicateIndex(path=None)
+    files = _files(("a.py", ORIGINAL))
+    plan = index.plan(files, "v1")
+    index.record(files, plan, [{"file": "a.py", "ai_probability": 10.0}], "v1")
+    assert index.plan(_files(("b.py", RENAMED)), "v1")[0]["match"]["source"] == "corpus"
+    assert index.plan(_files(("b.py", RENAMED)), "v2")[0]["match"] is None
+
+
+def test_propagate_within_upload_copies_scores_only():
+    row = {"file": "a.py", "ai_probability": 70.0, "explanation": "Texto.", "functions": [{"name": "f"}],
+           "perplexity_hotspot": "líneas 3-9", "status": "added", "content_hash": "h1"}
+    match = {"source": "upload", "index": 0, "path": "a.py", "content_hash": "h1", "similarity": 0.91}
+    out = propagate(row, "b.py", "h2", match)
+    assert out["file"] == "b.py" and out["content_hash"] == "h2"
+    assert out["ai_probability"] == 70.0
+    assert "functions" not in out and "perplexity_hotspot" not in out and "status" not in out
+    assert out["explanation"].startswith("Casi duplicado de a.py")
+    assert out["duplicate_of"] == {"file": "a.py", "content_hash": "h1", "similarity": 0.91, "source": "upload"}
+
+
+def test_upload_duplicates_span_file_batches(executor, explainer, monkeypatch):
+    import pipeline
+
+    # Un lote por archivo: el original (a.py) y su copia (b.py) quedan en lotes distintos.
+    monkeypatch.setattr(pipeline, "FILE_BATCH", 1)
+    index = NearDuplicateIndex(path=None)
+    files = _files(("a.py", ORIGINAL), ("c.py", OTHER), ("b.py", RENAMED))
+    rows = _collect(analyze_files(files, executor, explainer, near_duplicates=index))
+    assert executor.scored == [ORIGINAL, OTHER]
+    assert rows[2]["duplicate_of"]["source"] == "upload"
+    assert rows[2]["duplicate_of"]["file"] == "a.py"
+    assert rows[2]["ai_probability"] == rows[0]["ai_probability"]
+    assert (index.stats()["upload_hits"], index.stats()["corpus_hits"]) == (1, 0)
+
+
+def test_propagate_from_corpus_drops_foreign_fields():
+    row = {"file": "otro/a.py", "ai_probability": 70.0, "perplexity_score": 0.9, "explanation": "Secreto.",
+           "functions": [{"name": "f"}], "perplexity_hotspot": "líneas 1-9", "content_hash": "h1"}
+    match = {"source": "corpus", "content_hash": "h1", "similarity": 0.9, "row": row}
+    out = propagate(row, "b.py", "h2", match)
+    assert set(out) <= set(dedup.SCORE_FIELDS) | {"file", "explanation", "duplicate_of", "content_hash"}
+    assert out["ai_probability"] == 70.0 and out["perplexity_score"] == 0.9
+    assert "Secreto" not in out["explanation"]
+    assert out["duplicate_of"] == {"content_hash": "h1", "similarity": 0.9, "source": "corpus"}
+
+
+def test_corpus_eviction_keeps_newest():
+    index = NearDuplicateIndex(path=None, max_items=1)
+    for name, code in (("a.py", ORIGINAL), ("c.py", OTHER)):
+        files = _files((name, code))
+        index.record(files, index.plan(files, "v1"), [{"file": name, "ai_probability": 1.0}], "v1")
+    stats = index.stats()
+    assert stats["corpus_items"] == 1 and stats["evictions"] == 1
+    assert index.plan(_files(("b.py", RENAMED)), "v1")[0]["match"] is None
+
+
+def test_cluster_report_hides_corpus_paths():
+    index = NearDuplicateIndex(path=None)
+    files = _files(("secret/a.py", ORIGINAL))
+    index.record(files, index.plan(files, "v1"), [{"file": "secret/a.py"}], "v1")
+    report = cluster_report(_files(("x.py", ORIGINAL), ("y.py", RENAMED), ("z.py", OTHER)), index)
+    assert (report["files"], report["unique"], report["duplicates"]) == (3, 2, 1)
+    top = report["clusters"][0]
+    assert top["representative"] == "x.py" and top["size"] == 2
+    assert top["members"] == [{"file": "y.py", "similarity": 1.0}]
+    assert top["corpus"] and "secret" not in str(report)
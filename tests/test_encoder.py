@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from detectors.encoder import CodeBERTEncoder
+
+
+class StubTokenizer:
+    def __call__(self, codes, truncation=True, max_length=512):
+        return {"input_ids": [[1] * len(code) for code in codes]}
+
+
+class FlakyEncoder(CodeBERTEncoder):
+    # Sin modelo: la primera pasada falla, las siguientes devuelven embeddings no nulos.
+    def __init__(self):
+        self.tokenizer = StubTokenizer()
+        self.model = None
+        self.max_length = 512
+        self.max_batch_tokens = 4096
+        self.cache_items = 16
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+        self.has_embeddings = True
+        self.scheduler = None
+        self.calls = 0
+
+    @property
+    def dim(self):
+        return 4
+
+    def _batch(self, batch_ids):
+        self.calls += 1
+        if self.calls <= 2:
+            raise RuntimeError("fallo")
+        return [0.7] * len(batch_ids), np.ones((len(batch_ids), self.dim), dtype=np.float32)
+
+
+def test_failed_encode_is_not_cached():
+    encoder = FlakyEncoder()
+    probs, embeddings = encoder.encode(["x = 1"])
+    assert probs == [0.5] and not embeddings.any()
+    assert len(encoder._embeddings) == 0
+
+    assert encoder.embed(["x = 1"]).all()
+    assert len(encoder._embeddings) == 1
+    calls = encoder.calls
+    assert encoder.embed(["x = 1"]).all()
+    assert encoder.calls == calls
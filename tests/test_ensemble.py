@@ -0,0 +1,35 @@
+from detectors.ensemble import EnsembleDetector, cheap_estimate
+from utils.startup import LazyComponent
+
+BROKEN = "def f(:\n    return 1\n"
+
+
+class StubPerplexity:
+    def __init__(self):
+        self.seen = []
+
+    def get_scores_detailed(self, codes):
+        self.seen.extend(codes)
+        return [{"score": 0.4} for _ in codes]
+
+
+class StubClassifier:
+    def predict_proba_batch(self, codes):
+        return [0.4 for _ in codes]
+
+
+def test_cheap_estimate_ignores_ast_syntax_error():
+    features = {"ast": {"error": "syntax_error", "score": 0.0}, "stylometry": {"score": 0.9}}
+    assert abs(cheap_estimate(features) - 0.1) < 1e-9
+    features["ast"] = {"score": 0.8}
+    assert abs(cheap_estimate(features) - 0.15) < 1e-9
+
+
+def test_cascade_sends_unparsable_files_to_full_path():
+    detector = EnsembleDetector(use_cache=False, cascade=True, band=(0.49, 0.51))
+    perplexity = StubPerplexity()
+    detector._perplexity = LazyComponent("perplexity", lambda: perplexity)
+    detector._classifier = LazyComponent("codebert", StubClassifier)
+    result = detector.predict(BROKEN)
+    assert perplexity.seen == [BROKEN]
+    assert result.get("cascade") != "early_exit"
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+from pipeline import IncrementalRun, analyze_files
+from utils.manifest import Manifest, RepoAggregates, load_manifest
+
+V1 = {"a.py": "x = 1\n", "b.py": "def f():\n    return 2\n", "c.py": "print('c')\n", "d.py": "import os\n"}
+# a: igual, b: modificado, c -> e: movido, d: eliminado, n: nuevo.
+V2 = {"a.py": "x = 1\n", "b.py": "def f():\n    return 33\n", "e.py": "print('c')\n", "n.py": "y = [i for i in range(3)]\n"}
+
+
+def _files(tree):
+    return [{"path": path, "content": content} for path, content in tree.items()]
+
+
+def _collect(agen):
+    async def run():
+        return [row async for row in agen]
+    return asyncio.run(run())
+
+
+def _incremental(base, tree, executor, explainer, version="test"):
+    run = IncrementalRun(base, version)
+    rows = _collect(run.run(_files(tree), executor, explainer))
+    return run, rows
+
+
+def test_first_run_scores_everything(executor, explainer):
+    run, rows = _incremental(Manifest(), V1, executor, explainer)
+    assert sorted(r["file"] for r in rows) == sorted(V1)
+    assert {r["status"] for r in rows} == {"added"}
+    assert run.changes["added"] == 4
+    assert len(executor.scored) == 4
+    assert run.aggregates.to_dict() == RepoAggregates.from_rows(rows).to_dict()
+
+
+def test_diff_against_manifest_rescoring_only_changes(executor, explainer):
+    first, _ = _incremental(Manifest(), V1, executor, explainer)
+    base = load_manifest(json.dumps(first.manifest()).encode("utf-8"))
+    executor.scored.clear()
+
+    run, rows = _incremental(base, V2, executor, explainer)
+    statuses = {r["file"]: r["status"] for r in rows}
+    assert statuses == {"a.py": "unchanged", "b.py": "modified", "e.py": "moved", "n.py": "added"}
+    # c.py ya no existe: cuenta como eliminado aunque su contenido reaparezca en e.py.
+    assert run.changes == {"added": 1, "modified": 1, "unchanged": 1, "moved": 1, "removed": 2}
+    assert sorted(executor.scored) == sorted([V2["b.py"], V2["n.py"]])
+
+
+def test_incremental_aggregates_match_full_run(executor, explainer):
+    first, _ = _incremental(Manifest(), V1, executor, explainer)
+    base = load_manifest(json.dumps(first.manifest()).encode("utf-8"))
+    incremental, _ = _incremental(base, V2, executor, explainer)
+    full, _ = _incremental(Manifest(), V2, executor, explainer)
+
+    got, want = incremental.aggregates.to_dict(), full.aggregates.to_dict()
+    assert got["files"] == want["files"] == len(V2)
+    assert got["ai_files"] == want["ai_files"]
+    assert got["histogram"] == want["histogram"]
+    assert abs(got["probability_sum"] - want["probability_sum"]) < 1e-6
+
+
+def test_other_detector_version_discards_base(executor, explainer):
+    first, _ = _incremental(Manifest(), V1, executor, explainer, version="old")
+    base = load_manifest(json.dumps(first.manifest()).encode("utf-8"))
+    executor.scored.clear()
+    run, rows = _incremental(base, V1, executor, explainer, version="new")
+    assert {r["status"] for r in rows} == {"added"}
+    assert len(executor.scored) == len(V1)
+
+
+def test_ndjson_report_works_as_base(executor, explainer):
+    rows = _collect(analyze_files(_files(V1), executor, explainer))
+    base = load_manifest("\n".join(json.dumps(r) for r in rows).encode("utf-8"))
+    executor.scored.clear()
+    run, _ = _incremental(base, V1, executor, explainer)
+    assert run.changes["unchanged"] == len(V1)
+    assert executor.scored == []
+
+
+def test_aggregates_remove_is_inverse_of_add():
+    rows = [{"content_hash": str(i), "ai_probability": p} for i, p in enumerate([10.0, 55.0, 99.9])]
+    aggregates = RepoAggregates.from_rows(rows)
+    assert aggregates.to_dict()["ai_files"] == 2
+    aggregates.remove(rows[1])
+    assert aggregates.to_dict() == RepoAggregates.from_rows([rows[0], rows[2]]).to_dict()
@@ -0,0 +1,75 @@
+import io
+import zipfile
+
+import pytest
+
+from utils.job_queue import JobQueue, QueueFullError
+
+
+def _zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for path, content in files.items():
+            z.writestr(path, content)
+    buf.seek(0)
+    return buf
+
+
+def test_submit_claim_and_finish(tmp_path):
+    jobs = JobQueue(str(tmp_path), max_pending=4)
+    first = jobs.submit(_zip({"a.py": "x = 1\n"}), "a.zip")
+    second = jobs.submit(_zip({"b.py": "y = 2\n"}), "b.zip")
+    assert jobs.zip_path(first).exists()
+    assert jobs.get(first)["status"] == "queued" and jobs.get(first)["filename"] == "a.zip"
+    assert (jobs.depth(), jobs.depth_pending()) == (2, 2)
+
+    # FIFO por fecha de alta.
+    assert jobs.claim() == first
+    assert jobs.get(first)["status"] == "running"
+    assert (jobs.depth(), jobs.depth_pending()) == (1, 2)
+
+    jobs.set_total(first, 3)
+    jobs.add_results(first, 0, [{"file": "a.py"}, {"file": "b.py"}])
+    jobs.add_result(first, 2, {"file": "c.py"})
+    assert (jobs.get(first)["total"], jobs.get(first)["done"]) == (3, 3)
+    jobs.finish(first)
+    assert jobs.get(first)["status"] == "done"
+    assert not jobs.zip_path(first).exists()
+    assert [r["file"] for r in jobs.results(first)] == ["a.py", "b.py", "c.py"]
+
+    assert jobs.claim() == second
+    jobs.fail(second, "ZIP corrupto")
+    assert jobs.get(second)["status"] == "failed" and jobs.get(second)["error"] == "ZIP corrupto"
+    assert jobs.claim() is None
+    assert jobs.get("no-existe") is None
+
+
+def test_queue_full_rejects_without_leaving_files(tmp_path):
+    jobs = JobQueue(str(tmp_path), max_pending=1)
+    jobs.submit(_zip({"a.py": "x = 1\n"}))
+    with pytest.raises(QueueFullError):
+        jobs.submit(_zip({"b.py": "y = 2\n"}))
+    assert len(list(tmp_path.glob("*.zip"))) == 1
+
+
+def test_recover_requeues_running_jobs(tmp_path):
+    jobs = JobQueue(str(tmp_path))
+    job_id = jobs.submit(_zip({"a.py": "x = 1\n"}))
+    jobs.claim()
+    jobs.add_results(job_id, 0, [{"file": "a.py"}])
+
+    # Reinicio: otra instancia sobre el mismo directorio.
+    restarted = JobQueue(str(tmp_path))
+    assert restarted.recover() == 1
+    job = restarted.get(job_id)
+    assert (job["status"], job["done"]) == ("queued", 0)
+    assert restarted.results(job_id) == []
+    assert restarted.claim() == job_id
+
+
+
+def test_iter_results_pages_in_order(tmp_path):
+    jobs = JobQueue(str(tmp_path))
+    job_id = jobs.submit(_zip({"a.py": "x = 1\n"}))
+    jobs.add_results(job_id, 0, [{"i": i} for i in range(7)])
+    assert [r["i"] for r in jobs.iter_results(job_id, page=3)] == list(range(7))
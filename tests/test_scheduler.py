@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from detectors.scheduler import MicroBatchScheduler
+
+
+def _echo(batches):
+    def fn(items):
+        batches.append(list(items))
+        return [item.upper() for item in items]
+    return fn
+
+
+def test_batches_fill_token_budget():
+    batches = []
+    scheduler = MicroBatchScheduler("test", _echo(batches), max_batch_tokens=10, max_wait_ms=50)
+    try:
+        futures = scheduler.submit(["aaa", "bbb", "ccc", "dddd"])
+        assert [f.result(timeout=5) for f in futures] == ["AAA", "BBB", "CCC", "DDDD"]
+    finally:
+        scheduler.close()
+    # 3 + 3 + 3 caben en 10; "dddd" no cabe y pasa al siguiente lote.
+    assert batches == [["aaa", "bbb", "ccc"], ["dddd"]]
+    stats = scheduler.stats()
+    assert stats["batches"] == 2 and stats["items"] == 4 and stats["tokens"] == 13
+
+
+def test_concurrent_requests_share_batches():
+    batches = []
+    scheduler = MicroBatchScheduler("test", _echo(batches), max_batch_tokens=1000, max_wait_ms=200)
+    results = {}
+
+    def request(i):
+        results[i] = scheduler.run([f"r{i}-a", f"r{i}-b"])
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+    finally:
+        scheduler.close()
+    assert results == {i: [f"R{i}-A", f"R{i}-B"] for i in range(8)}
+    assert len(batches) < 8
+    assert sum(len(b) for b in batches) == 16
+
+
+def test_oversized_item_runs_alone():
+    batches = []
+    scheduler = MicroBatchScheduler("test", _echo(batches), max_batch_tokens=4, max_wait_ms=20)
+    try:
+        assert scheduler.run(["x" * 10, "y"]) == ["X" * 10, "Y"]
+    finally:
+        scheduler.close()
+    assert batches == [["x" * 10], ["y"]]
+
+
+def test_partial_batch_dispatched_after_max_wait():
+    scheduler = MicroBatchScheduler("test", _echo([]), max_batch_tokens=1000, max_wait_ms=20)
+    try:
+        start = time.perf_counter()
+        assert scheduler.run(["a"]) == ["A"]
+        assert time.perf_counter() - start < 2.0
+    finally:
+        scheduler.close()
+
+
+def test_error_reaches_every_future_in_batch():
+    calls = []
+
+    def fn(items):
+        calls.append(list(items))
+        if "boom" in items:
+            raise ValueError("fallo del modelo")
+        return items
+
+    scheduler = MicroBatchScheduler("test", fn, max_batch_tokens=100, max_wait_ms=50)
+    try:
+        futures = scheduler.submit(["ok", "boom"])
+        for f in futures:
+            with pytest.raises(ValueError, match="fallo del modelo"):
+                f.result(timeout=5)
+        # El hilo sigue vivo tras un error.
+        assert scheduler.run(["again"]) == ["again"]
+    finally:
+        scheduler.close()
+
+
+def test_result_count_mismatch_is_an_error():
+    scheduler = MicroBatchScheduler("test", lambda items: items[:1], max_batch_tokens=100, max_wait_ms=50)
+    try:
+        futures = scheduler.submit(["a", "b"])
+        for f in futures:
+            with pytest.raises(RuntimeError, match="2 entradas"):
+                f.result(timeout=5)
+    finally:
+        scheduler.close()
+
+
+def test_close_fails_queued_futures():
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn(items):
+        started.set()
+        release.wait(timeout=5)
+        return items
+
+    # "aaaa" llena el presupuesto y se ejecuta sola; las demás quedan en cola detrás.
+    scheduler = MicroBatchScheduler("test", fn, max_batch_tokens=4, max_wait_ms=1)
+    running = scheduler.submit(["aaaa"])
+    assert started.wait(timeout=5)
+    queued = scheduler.submit(["bb", "cc", "ddd"])
+    closer = threading.Thread(target=scheduler.close)
+    closer.start()
+    while not scheduler._closed:
+        time.sleep(0.001)
+    release.set()
+    closer.join(timeout=5)
+
+    assert running[0].result(timeout=5) == "aaaa"
+    for f in queued:
+        with pytest.raises(RuntimeError, match="cerrado"):
+            f.result(timeout=5)
+    with pytest.raises(RuntimeError, match="cerrado"):
+        scheduler.submit(["late"])
+
+
+def test_close_without_thread_is_noop():
+    scheduler = MicroBatchScheduler("test", lambda items: items, max_batch_tokens=10)
+    scheduler.close()
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(["a"])
@@ -1,52 +1,58 @@
 import ast
+import io
+import keyword
 import math
-from typing import Dict, Any
+import re
+import tokenize
+from typing import Dict, Any, Callable, List, Optional
+
+_SKIP_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER}
+_FALLBACK_RE = re.compile(r"[A-Za-z_]\w*|\d+|\S")
 
-def get_ast_score(code: str) -> Dict[str, Any]:
-    try:
-        tree = ast.parse(code)
-    except:
-        return {"error": "syntax_error", "score": 0.0}
 
-    class ASTVisitor(ast.NodeVisitor):
-        def __init__(self):
-            self.depth = 0
-            self.max_depth = 0
-            self.node_count = 0
-            self.function_count = 0
-            self.loop_count = 0
-            self.branch_count = 0
-            self.node_types = {}
+def walk_tree(tree: ast.AST, on_node: Optional[Callable[[ast.AST], None]] = None) -> Dict[str, Any]:
+    # Recorrido iterativo con pila explícita: no depende del límite de recursión de Python.
+    stats = {
+        "max_depth": 0,
+        "node_count": 0,
+        "function_count": 0,
+        "loop_count": 0,
+        "branch_count": 0,
+        "node_types": {},
+    }
+    node_types = stats["node_types"]
+    stack = [(tree, 1)]
+    while stack:
+        node, depth = stack.pop()
+        stats["node_count"] += 1
+        if depth > stats["max_depth"]:
+            stats["max_depth"] = depth
 
-        def visit(self, node):
-            self.node_count += 1
-            self.depth += 1
-            self.max_depth = max(self.max_depth, self.depth)
-            
-            node_type = type(node).__name__
-            self.node_types[node_type] = self.node_types.get(node_type, 0) + 1
+        node_type = type(node).__name__
+        node_types[node_type] = node_types.get(node_type, 0) + 1
 
-            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                self.function_count += 1
-            elif isinstance(node, (ast.For, ast.While, ast.AsyncFor)):
-                self.loop_count += 1
-            elif isinstance(node, ast.If):
-                self.branch_count += 1
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            stats["function_count"] += 1
+        elif isinstance(node, (ast.For, ast.While, ast.AsyncFor)):
+            stats["loop_count"] += 1
+        elif isinstance(node, ast.If):
+            stats["branch_count"] += 1
 
-            self.generic_visit(node)
-            self.depth -= 1
+        if on_node is not None:
+            on_node(node)
+        stack.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+    return stats
 
-    visitor = ASTVisitor()
-    visitor.visit(tree)
 
-    if visitor.node_count == 0:
+def score_from_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    if stats["node_count"] == 0:
         return {"score": 0.0, "features": {}}
-    avg_depth = visitor.max_depth
-    complexity = (visitor.loop_count + visitor.branch_count) / max(1, visitor.function_count)
+    avg_depth = stats["max_depth"]
+    complexity = (stats["loop_count"] + stats["branch_count"]) / max(1, stats["function_count"])
     entropy = 0.0
-    if visitor.node_types:
-        total = sum(visitor.node_types.values())
-        entropy = -sum((count/total) * math.log(count/total + 1e-10) for count in visitor.node_types.values())
+    if stats["node_types"]:
+        total = sum(stats["node_types"].values())
+        entropy = -sum((count/total) * math.log(count/total + 1e-10) for count in stats["node_types"].values())
     score = 0.0
     score += min(avg_depth / 10.0, 1.0) * 0.3
     score += min(complexity, 3.0) / 3.0 * 0.4
@@ -58,7 +64,44 @@ def get_ast_score(code: str) -> Dict[str, Any]:
             "depth": avg_depth,
             "complexity": round(complexity, 2),
             "entropy": round(entropy, 3),
-            "nodes": visitor.node_count,
-            "functions": visitor.function_count
+            "nodes": stats["node_count"],
+            "functions": stats["function_count"]
         }
-    }
\ No newline at end of file
+    }
+
+
+def get_ast_score(code: str) -> Dict[str, Any]:
+    try:
+        tree = ast.parse(code)
+    except:
+        return {"error": "syntax_error", "score": 0.0}
+    return score_from_stats(walk_tree(tree))
+
+
+def normalized_tokens(code: str) -> List[str]:
+    # Tokens con identificadores, literales y comentarios normalizados: renombrar variables,
+    # cambiar cadenas o comentar no altera la secuencia. Palabras clave y operadores se conservan.
+    tokens = []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type in _SKIP_TOKENS:
+                continue
+            if tok.type == tokenize.NAME:
+                tokens.append(tok.string if keyword.iskeyword(tok.string) else "ID")
+            elif tok.type == tokenize.STRING or tok.type == getattr(tokenize, "FSTRING_START", -1):
+                tokens.append("STR")
+            elif tok.type in (getattr(tokenize, "FSTRING_MIDDLE", -1), getattr(tokenize, "FSTRING_END", -1)):
+                continue
+            elif tok.type == tokenize.NUMBER:
+                tokens.append("NUM")
+            elif tok.type == tokenize.NEWLINE:
+                tokens.append("NEWLINE")
+            elif tok.type in (tokenize.INDENT, tokenize.DEDENT):
+                tokens.append(tokenize.tok_name[tok.type])
+            else:
+                tokens.append(tok.string)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Código que no tokeniza: aproximación por regex con la misma normalización de nombres.
+        tokens = ["ID" if (t[0].isalpha() or t[0] == "_") and not keyword.iskeyword(t) else
+                  ("NUM" if t.isdigit() else t) for t in _FALLBACK_RE.findall(code)]
+    return tokens
@@ -0,0 +1,33 @@
+from typing import Iterable, Iterator, List, Sequence
+
+
+def length_buckets(lengths: Sequence[int], max_batch_tokens: int, max_batch_size: int = 64) -> List[List[int]]:
+    # Ordena por longitud y agrupa de forma que (longitud máxima * tamaño) no supere
+    # el presupuesto de tokens: lotes grandes para textos cortos, pequeños para largos.
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    current_max = 0
+    for idx in order:
+        length = max(int(lengths[idx]), 1)
+        new_max = max(current_max, length)
+        if current and (new_max * (len(current) + 1) > max_batch_tokens or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+            new_max = length
+        current.append(idx)
+        current_max = new_max
+    if current:
+        batches.append(current)
+    return batches
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
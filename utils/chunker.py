@@ -0,0 +1,64 @@
+import ast
+import re
+from typing import Any, Dict, List, Tuple
+
+MODULE_CHUNK = "<module>"
+
+# Los mismos saltos de línea que cuenta ast (lineno); str.splitlines también corta en \x0c, \x1c-\x1e,
+# \x85, \u2028 y \u2029 y desplazaría los rangos.
+_LINE = re.compile(r".*?(?:\r\n|\r|\n)|.+$", re.S)
+
+
+def split_units(code: str, min_lines: int = 1) -> List[Dict[str, Any]]:
+    # Funciones y clases de nivel superior (con sus decoradores); el resto del módulo
+    # (imports, constantes, código suelto) forma un único fragmento "<module>". Cada fragmento lleva
+    # en "lines" el número de línea original de cada una de sus líneas: el de módulo no es contiguo.
+    lines = _LINE.findall(code)
+    try:
+        tree = ast.parse(code)
+    except:
+        return [_unit(MODULE_CHUNK, "module", list(range(1, len(lines) + 1)), code)]
+
+    units = []
+    covered = [False] * len(lines)
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        end = node.end_lineno or node.lineno
+        if end - start + 1 < min_lines:
+            continue
+        kind = "class" if isinstance(node, ast.ClassDef) else "function"
+        units.append(_unit(node.name, kind, list(range(start, end + 1)), "".join(lines[start - 1:end])))
+        for i in range(start - 1, end):
+            covered[i] = True
+
+    rest = [i for i, line in enumerate(lines) if not covered[i] and line.strip()]
+    if rest:
+        module_code = "".join(lines[i] for i in rest)
+        units.insert(0, _unit(MODULE_CHUNK, "module", [i + 1 for i in rest], module_code))
+    return units or [_unit(MODULE_CHUNK, "module", list(range(1, len(lines) + 1)), code)]
+
+
+def original_line(unit: Dict[str, Any], line: int) -> int:
+    # Línea (1-based) dentro del fragmento -> línea del archivo original.
+    line_map = unit["lines"]
+    if not line_map:
+        return line
+    return line_map[min(max(line, 1), len(line_map)) - 1]
+
+
+def line_ranges(line_map: List[int]) -> List[Tuple[int, int]]:
+    ranges = []
+    for line in line_map:
+        if ranges and line == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], line)
+        else:
+            ranges.append((line, line))
+    return ranges
+
+
+def _unit(name: str, kind: str, line_map: List[int], code: str) -> Dict[str, Any]:
+    start, end = (line_map[0], line_map[-1]) if line_map else (1, 1)
+    return {"name": name, "kind": kind, "start_line": start, "end_line": end,
+            "ranges": [list(r) for r in line_ranges(line_map)], "lines": line_map, "code": code}
@@ -0,0 +1,356 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.astUtils import normalized_tokens
+from utils.startup import LazyComponent
+
+DEDUP_ENABLED = os.getenv("SPECTRA_DEDUP", "0") == "1"
+DEDUP_PATH = os.getenv("SPECTRA_DEDUP_PATH", "data/cache/dedup.sqlite")
+DEDUP_THRESHOLD = float(os.getenv("SPECTRA_DEDUP_THRESHOLD", "0.85"))
+NUM_PERM = int(os.getenv("SPECTRA_DEDUP_PERMUTATIONS", "128"))
+BANDS = int(os.getenv("SPECTRA_DEDUP_BANDS", "16"))
+SHINGLE = int(os.getenv("SPECTRA_DEDUP_SHINGLE", "5"))
+MIN_TOKENS = int(os.getenv("SPECTRA_DEDUP_MIN_TOKENS", "30"))
+MAX_ITEMS = int(os.getenv("SPECTRA_DEDUP_MAX_ITEMS", "200000"))
+
+# Lo único que hereda un casi duplicado de su original (de la misma subida o del corpus).
+SCORE_FIELDS = ("ai_probability", "perplexity_score", "ast_score", "codebert_score", "stages", "attribution")
+
+# Permutaciones (a·x + b) mod p con semilla fija: las firmas guardadas siguen siendo válidas entre
+# reinicios y procesos. Con p < 2^31 el producto cabe en uint64.
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+_ROWS = max(1, NUM_PERM // BANDS)
+_CONFIG = f"perm={NUM_PERM}|bands={BANDS}|shingle={SHINGLE}|tokens=v1"
+
+
+def signature(code: str) -> Optional[np.ndarray]:
+    # MinHash de los shingles de tokens normalizados; None si el archivo es demasiado corto
+    # (todos los __init__.py y archivos de 3 líneas se parecen y no conviene agruparlos).
+    tokens = normalized_tokens(code)
+    if len(tokens) < max(MIN_TOKENS, SHINGLE):
+        return None
+    shingles = {" ".join(tokens[i:i + SHINGLE]) for i in range(len(tokens) - SHINGLE + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    ) % _PRIME
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    # Fracción de mínimos iguales: estimación de la similitud de Jaccard entre shingles.
+    return float(np.mean(a == b))
+
+
+def band_keys(sig: np.ndarray) -> List[str]:
+    return [hashlib.blake2b(sig[i * _ROWS:(i + 1) * _ROWS].tobytes(), digest_size=8).hexdigest()
+            for i in range(BANDS)]
+
+
+class LocalIndex:
+    # LSH en memoria para una subida: solo se indexan los representantes de cada grupo.
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._buckets: Dict[Tuple[int, str], List[Any]] = {}
+        self._signatures: Dict[Any, np.ndarray] = {}
+
+    def add(self, key: Any, sig: np.ndarray):
+        self._signatures[key] = sig
+        for band, bucket in enumerate(band_keys(sig)):
+            self._buckets.setdefault((band, bucket), []).append(key)
+
+    def best(self, sig: np.ndarray) -> Optional[Tuple[Any, float]]:
+        candidates = set()
+        for band, bucket in enumerate(band_keys(sig)):
+            candidates.update(self._buckets.get((band, bucket), ()))
+        scored = [(key, similarity(sig, self._signatures[key])) for key in candidates]
+        scored = [item for item in scored if item[1] >= self.threshold]
+        return max(scored, key=lambda item: item[1]) if scored else None
+
+
+class NearDuplicateIndex:
+    def __init__(self, path: Optional[str] = DEDUP_PATH, threshold: float = DEDUP_THRESHOLD,
+                 max_items: int = MAX_ITEMS):
+        self.threshold = threshold
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._counters = {"upload_hits": 0, "corpus_hits": 0, "scored": 0, "skipped": 0, "evictions": 0}
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS dedup_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS dedup_items (content_hash TEXT PRIMARY KEY, path TEXT NOT NULL,"
+            " signature BLOB NOT NULL, version TEXT NOT NULL, row TEXT NOT NULL, seen REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS dedup_bands (band INTEGER NOT NULL, key TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS dedup_bands_key ON dedup_bands(band, key);"
+            "CREATE INDEX IF NOT EXISTS dedup_bands_hash ON dedup_bands(content_hash);"
+            "CREATE INDEX IF NOT EXISTS dedup_items_seen ON dedup_items(seen);"
+            "CREATE TABLE IF NOT EXISTS dedup_members (content_hash TEXT PRIMARY KEY, path TEXT NOT NULL,"
+            " representative TEXT NOT NULL, similarity REAL NOT NULL, seen REAL NOT NULL);"
+        )
+        row = self._db.execute("SELECT value FROM dedup_meta WHERE key = 'config'").fetchone()
+        if row is None or row[0] != _CONFIG:
+            # Firmas calculadas con otros parámetros no son comparables: se descarta el corpus.
+            self._db.executescript("DELETE FROM dedup_items; DELETE FROM dedup_bands; DELETE FROM dedup_members;")
+            self._db.execute("INSERT OR REPLACE INTO dedup_meta (key, value) VALUES ('config', ?)", (_CONFIG,))
+        self._db.commit()
+
+    def matches(self, sig: np.ndarray, limit: int = 1, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        threshold = self.threshold if threshold is None else threshold
+        keys = band_keys(sig)
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(keys):
+                candidates.update(h for (h,) in self._db.execute(
+                    "SELECT content_hash FROM dedup_bands WHERE band = ? AND key = ?", (band, key)))
+            found = []
+            for digest in candidates:
+                item = self._db.execute(
+                    "SELECT path, signature, version, row FROM dedup_items WHERE content_hash = ?", (digest,)
+                ).fetchone()
+                if item is None:
+                    continue
+                sim = similarity(sig, np.frombuffer(item[1], dtype=np.uint32))
+                if sim >= threshold:
+                    found.append({"content_hash": digest, "path": item[0], "version": item[2],
+                                  "row": item[3], "similarity": sim})
+        found.sort(key=lambda m: m["similarity"], reverse=True)
+        return found[:limit]
+
+    def upload(self, version: str) -> "UploadDedup":
+        return UploadDedup(self, version)
+
+    def plan(self, files: List[Dict[str, str]], version: str) -> List[Dict[str, Any]]:
+        return self.upload(version).plan(files)
+
+    def record(self, files: List[Dict[str, str]], entries: List[Dict[str, Any]],
+               rows: List[Dict[str, Any]], version: str):
+        now = time.time()
+        with self._lock:
+            for f, entry, row in zip(files, entries, rows):
+                digest = entry["content_hash"]
+                if entry["signature"] is None:
+                    continue
+                if entry["match"] is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO dedup_members (content_hash, path, representative, similarity, seen) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (digest, f["path"], entry["match"]["content_hash"], entry["match"]["similarity"], now),
+                    )
+                    self._db.execute("UPDATE dedup_items SET seen = ? WHERE content_hash = ?",
+                                     (now, entry["match"]["content_hash"]))
+                    continue
+                stored = {k: v for k, v in row.items() if k not in ("status", "duplicate_of")}
+                self._db.execute(
+                    "INSERT OR REPLACE INTO dedup_items (content_hash, path, signature, version, row, seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, f["path"], entry["signature"].tobytes(), version,
+                     json.dumps(stored, ensure_ascii=False), now),
+                )
+                self._db.execute("DELETE FROM dedup_bands WHERE content_hash = ?", (digest,))
+                self._db.executemany(
+                    "INSERT INTO dedup_bands (band, key, content_hash) VALUES (?, ?, ?)",
+                    [(band, key, digest) for band, key in enumerate(band_keys(entry["signature"]))],
+                )
+            self._evict()
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["corpus_items"] = self._db.execute("SELECT COUNT(*) FROM dedup_items").fetchone()[0]
+            stats["corpus_members"] = self._db.execute("SELECT COUNT(*) FROM dedup_members").fetchone()[0]
+        hits = stats["upload_hits"] + stats["corpus_hits"]
+        lookups = hits + stats["scored"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["threshold"] = self.threshold
+        return stats
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _evict(self):
+        excess = self._db.execute("SELECT COUNT(*) FROM dedup_items").fetchone()[0] - self.max_items
+        if excess <= 0:
+            return
+        old = [h for (h,) in self._db.execute(
+            "SELECT content_hash FROM dedup_items ORDER BY seen LIMIT ?", (excess,))]
+        for digest in old:
+            self._db.execute("DELETE FROM dedup_items WHERE content_hash = ?", (digest,))
+            self._db.execute("DELETE FROM dedup_bands WHERE content_hash = ?", (digest,))
+            self._db.execute("DELETE FROM dedup_members WHERE representative = ?", (digest,))
+        self._counters["evictions"] += len(old)
+
+
+near_duplicates = LazyComponent("dedup", NearDuplicateIndex)
+
+
+class UploadDedup:
+    # Estado de una subida completa: un único LSH local con los representantes de toda la subida
+    # (no por lote), de modo que un duplicado en un lote posterior sigue apuntando a su original.
+    # El corpus persistente solo se actualiza al final, con la subida ya planificada entera.
+    def __init__(self, index: "NearDuplicateIndex", version: str):
+        self.index = index
+        self.version = version
+        self.local = LocalIndex(index.threshold)
+        self._representatives: Dict[int, Dict[str, Any]] = {}
+        self._pending: List[Tuple[Dict[str, str], Dict[str, Any], Dict[str, Any]]] = []
+        self._seq = 0
+
+    def plan(self, files: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        # Para cada archivo: puntuarlo o heredar la puntuación de un casi duplicado, primero de la propia
+        # subida y si no del corpus persistente (solo si se puntuó con la misma versión del detector).
+        from detectors.cache import content_hash
+
+        entries = []
+        for f in files:
+            seq = self._seq
+            self._seq += 1
+            digest = f.get("content_hash") or content_hash(f["content"])
+            sig = signature(f["content"])
+            entry = {"seq": seq, "content_hash": digest, "signature": sig, "match": None}
+            entries.append(entry)
+            if sig is None:
+                self.index._count("skipped")
+                continue
+            in_upload = self.local.best(sig)
+            if in_upload is not None:
+                j, sim = in_upload
+                rep = self._representatives[j]
+                entry["match"] = {"source": "upload", "index": j, "path": rep["path"],
+                                  "content_hash": rep["content_hash"], "similarity": sim}
+                self.index._count("upload_hits")
+                continue
+            stored = [m for m in self.index.matches(sig, limit=10) if m["version"] == self.version]
+            if stored:
+                best = stored[0]
+                entry["match"] = {"source": "corpus", "content_hash": best["content_hash"],
+                                  "similarity": best["similarity"], "row": json.loads(best["row"])}
+                self.index._count("corpus_hits")
+            else:
+                self.local.add(seq, sig)
+                self._representatives[seq] = {"path": f["path"], "content_hash": digest, "row": None}
+                self.index._count("scored")
+        return entries
+
+    def resolve(self, files: List[Dict[str, str]], entries: List[Dict[str, Any]],
+                scored: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # scored: filas puntuadas de este lote por posición. En orden, el representante siempre llega
+        # antes que sus duplicados, así que su fila ya está disponible al propagar.
+        rows = []
+        for i, (f, entry) in enumerate(zip(files, entries)):
+            match = entry["match"]
+            if match is None:
+                row = scored[i]
+                if entry["seq"] in self._representatives:
+                    self._representatives[entry["seq"]]["row"] = row
+            else:
+                source = match["row"] if match["source"] == "corpus" else self._representatives[match["index"]]["row"]
+                row = propagate(source, f["path"], entry["content_hash"], match)
+            rows.append(row)
+            # Para el corpus solo hace falta la fila de los representantes.
+            self._pending.append(({"path": f["path"]}, entry, row if match is None else None))
+        return rows
+
+    def record(self):
+        if self._pending:
+            files, entries, rows = (list(x) for x in zip(*self._pending))
+            self.index.record(files, entries, rows, self.version)
+        self._pending = []
+
+
+def propagate(row: Dict[str, Any], path: str, digest: str, match: Dict[str, Any]) -> Dict[str, Any]:
+    # Solo las puntuaciones del archivo: funciones, hotspot y explicación se refieren a las líneas y al
+    # contenido del original, que no coinciden con los del casi duplicado. De otra subida (corpus)
+    # tampoco se expone su ruta.
+    sim = round(match["similarity"], 3)
+    duplicate_of = {"content_hash": match["content_hash"], "similarity": sim, "source": match["source"]}
+    if match["source"] == "upload":
+        duplicate_of = {"file": match["path"], **duplicate_of}
+        explanation = f"Casi duplicado de {match['path']} (similitud {sim:.2f})."
+    else:
+        explanation = f"Casi duplicado de un archivo analizado anteriormente (similitud {sim:.2f})."
+    return {
+        "file": path,
+        **{k: row[k] for k in SCORE_FIELDS if k in row},
+        "explanation": explanation,
+        "duplicate_of": duplicate_of,
+        "content_hash": digest,
+    }
+
+
+def cluster_report(files: Iterable[Dict[str, str]], index: Optional[NearDuplicateIndex] = None,
+                   threshold: float = DEDUP_THRESHOLD) -> Dict[str, Any]:
+    # Informe tipo plagio: grupos de casi duplicados dentro de la subida, cada uno con su
+    # representante, la similitud de cada miembro y las coincidencias en el corpus persistente.
+    local = LocalIndex(threshold)
+    clusters: List[Dict[str, Any]] = []
+    total = skipped = 0
+    for f in files:
+        total += 1
+        sig = signature(f["content"])
+        if sig is None:
+            skipped += 1
+            continue
+        best = local.best(sig)
+        if best is not None:
+            cluster = clusters[best[0]]
+            cluster["members"].append({"file": f["path"], "similarity": round(best[1], 3)})
+            continue
+        local.add(len(clusters), sig)
+        corpus = index.matches(sig, limit=5, threshold=threshold) if index is not None else []
+        clusters.append({
+            "representative": f["path"],
+            "members": [],
+            # Coincidencias de otras subidas: sin su ruta.
+            "corpus": [{"content_hash": m["content_hash"], "similarity": round(m["similarity"], 3)} for m in corpus],
+        })
+
+    groups = [c for c in clusters if c["members"] or c["corpus"]]
+    for c in groups:
+        c["size"] = len(c["members"]) + 1
+    groups.sort(key=lambda c: (c["size"], len(c["corpus"])), reverse=True)
+    return {
+        "threshold": threshold,
+        "files": total,
+        "unique": len(clusters) + skipped,
+        "duplicates": total - len(clusters) - skipped,
+        "too_short": skipped,
+        "clusters": groups,
+    }
+
+
+if __name__ == "__main__":
+    from utils.zip_parser import iter_python_files
+
+    parser = argparse.ArgumentParser(description="Casi duplicados con MinHash/LSH sobre tokens normalizados")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Grupos de casi duplicados de un ZIP (y coincidencias en el corpus)")
+    report.add_argument("zip_path")
+    report.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    report.add_argument("--no-corpus", action="store_true", help="No consulta el corpus persistente")
+    sub.add_parser("stats", help="Tamaño del corpus persistente")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        index = None if args.no_corpus else NearDuplicateIndex(threshold=args.threshold)
+        print(json.dumps(cluster_report(iter_python_files(args.zip_path), index, args.threshold),
+                         indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(NearDuplicateIndex().stats(), indent=2))
@@ -0,0 +1,168 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.batching import chunked
+from utils.features import FEATURE_NAMES
+from utils.zip_parser import iter_python_files
+
+STORE_PATH = os.getenv("SPECTRA_FEATURE_STORE", "data/features/store.parquet")
+STORE_WORKERS = int(os.getenv("SPECTRA_FEATURE_STORE_WORKERS", "0"))
+STORE_BATCH = int(os.getenv("SPECTRA_FEATURE_STORE_BATCH", "32"))
+
+SCORE_COLUMNS = ("perplexity", "ast", "codebert", "stylometry")
+
+_worker_detector = None
+
+
+def label_for(path: str) -> int:
+    return 1 if any(x in path.lower() for x in ["gpt", "ai", "generated"]) else 0
+
+
+def schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [("dataset", pa.string()), ("path", pa.string()), ("content_hash", pa.string()), ("label", pa.int8()),
+         ("model_version", pa.string())]
+        + [(name, pa.float64()) for name in SCORE_COLUMNS]
+        + [(f"f_{name}", pa.float64()) for name in FEATURE_NAMES]
+    )
+
+
+def store_version(version: Optional[str] = None) -> str:
+    # Los pesos del ensemble no cambian las puntuaciones por componente: no forman parte de la versión.
+    if version is None:
+        from detectors.ensemble import detector_version
+
+        version = detector_version(False, chunking=False, calibration={"tag": None})
+    return version.split("|weights=")[0]
+
+
+def _init_worker(threads: int):
+    global _worker_detector
+    from detectors.ensemble import EnsembleDetector
+
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    # Sin caché, cascada ni fragmentos: el almacén guarda la puntuación completa de cada archivo.
+    _worker_detector = EnsembleDetector(use_cache=False, cascade=False, chunking=False)
+
+
+def score_zip(zip_path: str, batch_size: int = STORE_BATCH) -> List[Dict[str, Any]]:
+    from detectors.cache import content_hash
+
+    # La etiqueta sale solo de la ruta dentro del ZIP, con la misma regla que evaluate.py: el nombre
+    # del ZIP no cuenta (un dataset "daily_tasks" no debe marcar todo como IA).
+    dataset = Path(zip_path).stem
+    version = store_version()
+    rows = []
+    for chunk in chunked(iter_python_files(zip_path), batch_size):
+        codes = [f["content"] for f in chunk]
+        for f, code, scores in zip(chunk, codes, _worker_detector.component_scores(codes)):
+            row = {
+                "dataset": dataset,
+                "path": f["path"],
+                "content_hash": content_hash(code),
+                "label": label_for(f["path"]),
+                "model_version": version,
+            }
+            row.update({name: scores[name] for name in SCORE_COLUMNS})
+            row.update({f"f_{name}": value for name, value in zip(FEATURE_NAMES, scores["vector"])})
+            rows.append(row)
+    return rows
+
+
+def build_store(source: str, out: str = STORE_PATH, workers: int = STORE_WORKERS, threads: int = 0) -> Dict[str, Any]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    src = Path(source)
+    zips = [str(src)] if src.is_file() else sorted(str(p) for p in src.glob("*.zip"))
+    if not zips:
+        raise FileNotFoundError(f"No hay archivos .zip en {source}")
+
+    out_path = Path(out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp")
+    # La versión del detector viaja en los metadatos: un almacén de otros modelos no debe mezclarse.
+    store_schema = schema().with_metadata({"model_version": store_version()})
+    summary = {"zips": len(zips), "files": 0, "errors": []}
+
+    with pq.ParquetWriter(str(tmp_path), store_schema) as writer:
+        def write(name: str, rows: List[Dict[str, Any]]):
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=store_schema))
+            summary["files"] += len(rows)
+            print(f"[OK] {Path(name).name}: {len(rows)} archivos")
+
+        if workers > 0:
+            # Un ZIP por tarea; cada proceso carga los modelos una vez en su initializer.
+            threads = threads or max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(threads,)) as pool:
+                futures = {pool.submit(score_zip, z): z for z in zips}
+                for future in as_completed(futures):
+                    try:
+                        write(futures[future], future.result())
+                    except Exception as e:
+                        summary["errors"].append(futures[future])
+                        print(f"[ERROR] {Path(futures[future]).name}: {e}")
+        else:
+            _init_worker(threads)
+            for z in zips:
+                try:
+                    write(z, score_zip(z))
+                except Exception as e:
+                    summary["errors"].append(z)
+                    print(f"[ERROR] {Path(z).name}: {e}")
+
+    os.replace(tmp_path, out_path)
+    summary["path"] = str(out_path)
+    return summary
+
+
+def store_versions(table) -> List[str]:
+    if "model_version" in table.column_names:
+        return sorted(set(table.column("model_version").to_pylist()))
+    meta = (table.schema.metadata or {}).get(b"model_version")
+    return [store_version(meta.decode("utf-8"))] if meta else []
+
+
+def load_store(path: str = STORE_PATH, strict: bool = False):
+    # Comprueba que todas las filas vienen de los mismos modelos que el detector actual. Con strict
+    # (ajuste de pesos) una mezcla o una versión distinta es un error; si no, solo un aviso.
+    import pyarrow.parquet as pq
+
+    if not Path(path).exists():
+        raise FileNotFoundError(f"No existe {path}; ejecuta: python -m utils.feature_store <directorio_zips>")
+    table = pq.read_table(path)
+    versions = store_versions(table)
+    current = store_version()
+    problem = None
+    if len(versions) > 1:
+        problem = f"{path} mezcla filas de {len(versions)} versiones de modelo: {', '.join(versions)}"
+    elif versions != [current]:
+        problem = f"{path} es de la versión '{versions[0] if versions else 'desconocida'}', el detector es '{current}'"
+    if problem and strict:
+        raise ValueError(problem + " (regenera el almacén o usa --force)")
+    if problem:
+        print(f"[WARN] {problem}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extrae puntuaciones y features de ZIPs etiquetados a Parquet")
+    parser.add_argument("source", help="Directorio con ZIPs etiquetados (o un único ZIP)")
+    parser.add_argument("--out", default=STORE_PATH)
+    parser.add_argument("--workers", type=int, default=STORE_WORKERS, help="Procesos en paralelo (0 = en este proceso)")
+    parser.add_argument("--threads", type=int, default=0, help="Hilos de torch por proceso (0 = núcleos / workers)")
+    args = parser.parse_args()
+
+    result = build_store(args.source, args.out, args.workers, args.threads)
+    print(f"[OK] {result['files']} archivos de {result['zips']} ZIPs -> {result['path']}")
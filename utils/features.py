@@ -0,0 +1,146 @@
+import ast
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.astUtils import walk_tree, score_from_stats
+from utils.patcher import VULNERABILITIES, line_offsets, scan
+
+FEATURE_NAMES = (
+    "ast_score", "depth", "complexity", "entropy", "nodes", "functions", "loops", "branches",
+    "stylometry_score", "comment_ratio", "avg_line_len", "avg_name_len", "lines", "vulnerabilities",
+)
+
+# Llamadas peligrosas reconocidas en el AST, con el mismo texto de aviso que utils.patcher.
+_VULN_CALLS = {
+    "eval": VULNERABILITIES[0][1],
+    "os.system": VULNERABILITIES[1][1],
+    "subprocess.call": VULNERABILITIES[2][1],
+    "pickle.loads": VULNERABILITIES[3][1],
+    "input": VULNERABILITIES[4][1],
+}
+# Por debajo de este volumen de código (bytes) el pool no compensa el coste de IPC: se extrae en serie.
+POOL_MIN_BYTES = int(os.getenv("SPECTRA_FEATURE_POOL_MIN_BYTES", "1000000"))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+_NAME_RE = re.compile(r"def (\w+)\(|(\w+) =")
+
+
+def _call_name(func: ast.AST) -> str:
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+        return f"{func.value.id}.{func.attr}"
+    return ""
+
+
+def stylometry_score(lines: List[str], names: List[str]) -> Dict[str, float]:
+    if not lines:
+        return {"score": 0.5, "comment_ratio": 0.0, "avg_line_len": 0.0, "avg_name_len": 0.0}
+    comment_ratio = sum(1 for l in lines if l.startswith("#")) / len(lines)
+    avg_line_len = sum(len(l) for l in lines) / len(lines)
+    avg_name_len = sum(len(n) for n in names) / max(1, len(names))
+
+    score = 0.0
+    score += comment_ratio * 0.4
+    score += min(avg_line_len / 80.0, 1.0) * 0.3
+    score += min(avg_name_len / 8.0, 1.0) * 0.3
+    return {
+        "score": round(1.0 - score, 3),
+        "comment_ratio": round(comment_ratio, 3),
+        "avg_line_len": round(avg_line_len, 2),
+        "avg_name_len": round(avg_name_len, 2),
+    }
+
+
+def extract_features(code: str) -> Dict[str, Any]:
+    offsets = line_offsets(code)
+    lines = [l.strip() for l in code.splitlines() if l.strip()]
+    names: List[str] = []
+    vulns: List[Dict[str, Any]] = []
+
+    try:
+        tree = ast.parse(code)
+    except:
+        tree = None
+
+    if tree is not None:
+        def on_node(node: ast.AST):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                names.append(node.name)
+            elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                names.append(node.id)
+            elif isinstance(node, ast.Call):
+                warning = _VULN_CALLS.get(_call_name(node.func))
+                if warning:
+                    vulns.append({"line": node.lineno, "warning": warning})
+
+        # Un único recorrido alimenta AST, estilometría y vulnerabilidades.
+        stats = walk_tree(tree, on_node)
+        ast_result = score_from_stats(stats)
+        vulns.sort(key=lambda v: v["line"])
+    else:
+        stats = {"loop_count": 0, "branch_count": 0}
+        ast_result = {"error": "syntax_error", "score": 0.0}
+        names = [a or b for a, b in _NAME_RE.findall(code)]
+        vulns = [{"line": line, "warning": warning} for _, _, warning, line in scan(code, offsets)]
+
+    stylometry = stylometry_score(lines, names)
+    ast_features = ast_result.get("features", {})
+    vector = np.array([
+        ast_result.get("score", 0.0),
+        ast_features.get("depth", 0),
+        ast_features.get("complexity", 0.0),
+        ast_features.get("entropy", 0.0),
+        ast_features.get("nodes", 0),
+        ast_features.get("functions", 0),
+        stats["loop_count"],
+        stats["branch_count"],
+        stylometry["score"],
+        stylometry["comment_ratio"],
+        stylometry["avg_line_len"],
+        stylometry["avg_name_len"],
+        len(offsets),
+        len(vulns),
+    ], dtype=np.float32)
+
+    return {"ast": ast_result, "stylometry": stylometry, "vulnerabilities": vulns, "vector": vector}
+
+
+def extract_features_batch(codes: List[str], workers: Optional[int] = None, chunksize: int = 16) -> List[Dict[str, Any]]:
+    if (not workers or workers <= 1 or len(codes) < 2 * chunksize
+            or sum(len(code) for code in codes) < POOL_MIN_BYTES):
+        return [extract_features(code) for code in codes]
+    return list(_get_pool(workers).map(extract_features, codes, chunksize=chunksize))
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    # Un único pool perezoso y de larga vida (spawn: no hereda hilos ni modelos del proceso padre).
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+JOB_DIR = os.getenv("SPECTRA_JOB_DIR", "data/jobs")
+JOB_QUEUE_MAX = int(os.getenv("SPECTRA_JOB_QUEUE_MAX", "16"))
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class JobQueue:
+    def __init__(self, job_dir: str = JOB_DIR, max_pending: int = JOB_QUEUE_MAX):
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.job_dir / "jobs.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT,
+                total INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                row TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+        """)
+        self._db.commit()
+
+    def zip_path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.zip"
+
+    def submit(self, upload: BinaryIO, filename: str = "") -> str:
+        if self.depth_pending() >= self.max_pending:
+            raise QueueFullError("Cola de análisis llena, inténtalo más tarde.")
+        # La copia del ZIP se hace fuera del lock: no bloquea el resto de operaciones de la cola.
+        job_id = uuid.uuid4().hex
+        with open(self.zip_path(job_id), "wb") as dest:
+            shutil.copyfileobj(upload, dest)
+        with self._lock:
+            if self._count("queued", "running") >= self.max_pending:
+                self.zip_path(job_id).unlink(missing_ok=True)
+                raise QueueFullError("Cola de análisis llena, inténtalo más tarde.")
+            now = time.time()
+            self._db.execute(
+                "INSERT INTO jobs (id, status, filename, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, filename, now, now),
+            )
+            self._db.commit()
+            return job_id
+
+    def recover(self) -> int:
+        # Los trabajos que estaban en curso al reiniciar vuelven a la cola desde cero.
+        with self._lock:
+            ids = [r[0] for r in self._db.execute("SELECT id FROM jobs WHERE status = 'running'")]
+            for job_id in ids:
+                self._db.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', done = 0, updated = ? WHERE id = ?", (time.time(), job_id)
+                )
+            self._db.commit()
+            return len(ids)
+
+    def claim(self) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            self._db.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (time.time(), row[0]))
+            self._db.commit()
+            return row[0]
+
+    def set_total(self, job_id: str, total: int):
+        self._update(job_id, total=total)
+
+    def add_result(self, job_id: str, seq: int, row: Dict[str, Any]):
+        self.add_results(job_id, seq, [row])
+
+    def add_results(self, job_id: str, start: int, rows: List[Dict[str, Any]]):
+        # Un solo commit por lote de filas.
+        if not rows:
+            return
+        payload = [(job_id, start + i, json.dumps(row, ensure_ascii=False)) for i, row in enumerate(rows)]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO job_results (job_id, seq, row) VALUES (?, ?, ?)", payload)
+            self._db.execute("UPDATE jobs SET done = ?, updated = ? WHERE id = ?",
+                             (start + len(rows), time.time(), job_id))
+            self._db.commit()
+
+    def finish(self, job_id: str):
+        self._update(job_id, status="done")
+        self.zip_path(job_id).unlink(missing_ok=True)
+
+    def fail(self, job_id: str, error: str):
+        self._update(job_id, status="failed", error=error)
+        self.zip_path(job_id).unlink(missing_ok=True)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, filename, total, done, error, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        keys = ["job_id", "status", "filename", "total", "done", "error", "created", "updated"]
+        return dict(zip(keys, row))
+
+    def results(self, job_id: str) -> List[Dict[str, Any]]:
+        return list(self.iter_results(job_id))
+
+    def iter_results(self, job_id: str, page: int = 500) -> Iterator[Dict[str, Any]]:
+        # Paginado por seq: memoria constante aunque el trabajo tenga miles de archivos.
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT seq, row FROM job_results WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (job_id, last, page),
+                ).fetchall()
+            for seq, row in rows:
+                yield json.loads(row)
+            if len(rows) < page:
+                return
+            last = rows[-1][0]
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._count("queued")
+
+    def depth_pending(self) -> int:
+        with self._lock:
+            return self._count("queued", "running")
+
+    def _count(self, *statuses: str) -> int:
+        marks = ",".join("?" for _ in statuses)
+        return self._db.execute(f"SELECT COUNT(*) FROM jobs WHERE status IN ({marks})", statuses).fetchone()[0]
+
+    def _update(self, job_id: str, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
@@ -0,0 +1,102 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+AI_THRESHOLD = 50.0  # ai_probability de los informes está en porcentaje
+HISTOGRAM_BINS = 10
+
+
+class RepoAggregates:
+    # Solo sumas y conteos: quitar y añadir filas es O(1), sin recorrer el repositorio completo.
+    def __init__(self, files: int = 0, probability_sum: float = 0.0, ai_files: int = 0,
+                 histogram: Optional[List[int]] = None):
+        self.files = files
+        self.probability_sum = probability_sum
+        self.ai_files = ai_files
+        self.histogram = list(histogram or [0] * HISTOGRAM_BINS)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RepoAggregates":
+        return cls(data.get("files", 0), data.get("probability_sum", 0.0), data.get("ai_files", 0), data.get("histogram"))
+
+    @classmethod
+    def from_rows(cls, rows) -> "RepoAggregates":
+        aggregates = cls()
+        for row in rows:
+            aggregates.add(row)
+        return aggregates
+
+    def add(self, row: Dict[str, Any], sign: int = 1):
+        if not row.get("content_hash"):
+            return
+        prob = float(row.get("ai_probability", 0.0))
+        self.files += sign
+        self.probability_sum += sign * prob
+        if prob >= AI_THRESHOLD:
+            self.ai_files += sign
+        self.histogram[min(int(prob // (100 / HISTOGRAM_BINS)), HISTOGRAM_BINS - 1)] += sign
+
+    def remove(self, row: Dict[str, Any]):
+        self.add(row, -1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "ai_files": self.ai_files,
+            "ai_ratio": round(self.ai_files / self.files, 4) if self.files else 0.0,
+            "mean_ai_probability": round(self.probability_sum / self.files, 2) if self.files else 0.0,
+            "probability_sum": round(self.probability_sum, 4),
+            "histogram": self.histogram,
+        }
+
+
+class Manifest:
+    def __init__(self, rows: Optional[Dict[str, Dict[str, Any]]] = None, version: Optional[str] = None,
+                 aggregates: Optional[Dict[str, Any]] = None):
+        self.rows = rows or {}
+        self.version = version
+        self.aggregates = RepoAggregates.from_dict(aggregates) if aggregates else RepoAggregates.from_rows(self.rows.values())
+        self._by_hash = {}
+        for path, row in self.rows.items():
+            if row.get("content_hash"):
+                self._by_hash.setdefault(row["content_hash"], path)
+
+    def match(self, path: str, digest: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        previous = self.rows.get(path)
+        if previous is not None and previous.get("content_hash") == digest:
+            return "unchanged", previous
+        if digest in self._by_hash:
+            # Mismo contenido en otra ruta (movido o copiado): se reutiliza la puntuación.
+            return "moved", {**self.rows[self._by_hash[digest]], "file": path}
+        return ("modified" if previous is not None else "added"), previous
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "aggregates": self.aggregates.to_dict(),
+            "files": {path: {"hash": row.get("content_hash"), "row": row} for path, row in self.rows.items()},
+        }
+
+
+def load_manifest(data: bytes) -> Manifest:
+    # Acepta el manifiesto JSON ({"version", "files": {ruta: {"hash", "row"}}}) o un informe NDJSON previo.
+    text = data.decode("utf-8-sig", errors="ignore").strip()
+    if not text:
+        return Manifest()
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        parsed = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if isinstance(parsed, dict) and "files" in parsed:
+        rows = {}
+        for path, entry in parsed["files"].items():
+            row = dict(entry.get("row") or {})
+            row.setdefault("file", path)
+            row.setdefault("content_hash", entry.get("hash"))
+            rows[path] = row
+        return Manifest(rows, parsed.get("version"), parsed.get("aggregates"))
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    if not isinstance(parsed, list):
+        raise ValueError("Manifiesto base no reconocido.")
+    return Manifest({row["file"]: row for row in parsed if isinstance(row, dict) and row.get("file") and row.get("content_hash")})
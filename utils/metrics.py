@@ -0,0 +1,211 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Formato de exposición de texto de Prometheus, sin dependencias externas.
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_ALWAYS = os.getenv("SPECTRA_TRACE", "0") == "1"
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], None]] = []
+_trace: contextvars.ContextVar = contextvars.ContextVar("spectra_trace", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def _label_str(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value) -> List[str]:
+        return [f"{self.name}{self._label_str(key)} {_fmt(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels):
+        # Para contadores que viven en otro objeto (p. ej. la caché) y se reflejan al exportar.
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def _samples(self, key, state) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._label_str(key, ('le', _fmt(bound)))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {_fmt(state['sum'])}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {state['count']}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("spectra_stage_seconds", "Latencia por etapa del análisis (segundos).", ["stage"])
+FILES_TOTAL = Counter("spectra_files_processed_total", "Archivos .py leídos de los ZIP.")
+BYTES_TOTAL = Counter("spectra_bytes_processed_total", "Bytes de código Python leídos de los ZIP.")
+QUEUE_DEPTH = Gauge("spectra_queue_depth", "Trabajos en cola pendientes de procesar.")
+CACHE_EVENTS = Counter("spectra_cache_events_total", "Consultas a caché por resultado.", ["cache", "event"])
+CACHE_HIT_RATIO = Gauge("spectra_cache_hit_ratio", "Proporción de aciertos de caché.", ["cache"])
+MODEL_MEMORY = Gauge("spectra_model_memory_bytes", "Memoria de los pesos de cada modelo cargado.", ["model"])
+PROCESS_MEMORY = Gauge("spectra_resident_memory_bytes", "Memoria residente por proceso.", ["process"])
+BATCH_FILL_RATIO = Histogram("spectra_batch_fill_ratio", "Tokens de cada micro-lote sobre su presupuesto.", ["model"],
+                             buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+BATCH_QUEUE_SECONDS = Histogram("spectra_batch_queue_seconds", "Espera de cada entrada en la cola de micro-batching.",
+                                ["model"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0))
+
+
+def register_collector(fn: Callable[[], None]):
+    # Se llama antes de cada exportación para refrescar valores que viven en otros objetos.
+    _collectors.append(fn)
+
+
+def resident_memory(pid: str = "self") -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid != "self":
+            return 0
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def observe_cache(name: str, stats: Dict):
+    if not stats.get("enabled", True):
+        return
+    for event in ("memory_hits", "disk_hits", "misses", "writes", "evictions"):
+        CACHE_EVENTS.set_total(stats.get(event, 0), cache=name, event=event)
+    CACHE_HIT_RATIO.set(stats.get("hit_rate", 0.0), cache=name)
+
+
+def render() -> str:
+    for fn in _collectors:
+        try:
+            fn()
+        except Exception as e:
+            print(f"[ERROR] métricas: {e}")
+    PROCESS_MEMORY.set(resident_memory(), process="main")
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def start_trace() -> List[Tuple[str, float]]:
+    # La lista se comparte con los hilos de asyncio.to_thread, que copian el contexto.
+    events: List[Tuple[str, float]] = []
+    _trace.set(events)
+    return events
+
+
+def current_trace() -> Optional[List[Tuple[str, float]]]:
+    return _trace.get()
+
+
+def record(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    events = _trace.get()
+    if events is not None:
+        events.append((stage, seconds))
+
+
+def record_events(events: List[Tuple[str, float]]):
+    # Tiempos medidos en un proceso worker y devueltos al proceso principal.
+    for stage, seconds in events:
+        record(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def stage_timings(events: List[Tuple[str, float]]) -> Dict[str, float]:
+    # Milisegundos acumulados por etapa, en orden de primera aparición.
+    totals: Dict[str, float] = {}
+    for stage, seconds in events:
+        totals[stage] = totals.get(stage, 0.0) + seconds * 1000.0
+    return {stage: round(ms, 1) for stage, ms in totals.items()}
+
+
+def server_timing(events: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in stage_timings(events).items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000.0:.1f}")
+    return ", ".join(parts)
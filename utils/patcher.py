@@ -1,4 +1,5 @@
 import re
+from bisect import bisect_right
 from typing import List, Tuple
 
 VULNERABILITIES = [
@@ -9,20 +10,41 @@ VULNERABILITIES = [
     (r'input\s*\(', "input() - potential code injection")
 ]
 
+# Una sola pasada: todas las expresiones en una alternancia con grupos con nombre.
+_COMBINED = re.compile("|".join(f"(?P<v{i}>{pattern})" for i, (pattern, _) in enumerate(VULNERABILITIES)))
+
+
+def line_offsets(code: str) -> List[int]:
+    offsets = [0]
+    pos = code.find("\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = code.find("\n", pos + 1)
+    return offsets
+
+
+def line_at(offsets: List[int], pos: int) -> int:
+    return bisect_right(offsets, pos)
+
+
+def scan(code: str, offsets: List[int] = None) -> List[Tuple[int, int, str, int]]:
+    offsets = offsets or line_offsets(code)
+    found = []
+    for match in _COMBINED.finditer(code):
+        warning = VULNERABILITIES[int(match.lastgroup[1:])][1]
+        start, end = match.span()
+        found.append((start, end, warning, line_at(offsets, start)))
+    return found
+
+
 def apply_patch(code: str) -> Tuple[str, List[str]]:
-    patched_code = code
+    parts = []
     issues = []
-    
-    for pattern, warning in VULNERABILITIES:
-        matches = re.finditer(pattern, code)
-        for match in matches:
-            start, end = match.span()
-            issues.append(f"{warning} at line ~{code[:start].count(chr(10))+1}")
-            patched_code = (
-                patched_code[:start] +
-                f"# SECURE PATCH: {warning}\n# " +
-                patched_code[start:end] +
-                patched_code[end:]
-            )
-    
-    return patched_code, issues
\ No newline at end of file
+    last = 0
+    for start, end, warning, line in scan(code):
+        issues.append(f"{warning} at line ~{line}")
+        parts.append(code[last:start])
+        parts.append(f"# SECURE PATCH: {warning}\n# " + code[start:end])
+        last = end
+    parts.append(code[last:])
+    return "".join(parts), issues
@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, Iterator, AsyncIterator, Optional, Tuple, Type
+from utils import metrics
+
+COLUMNS = [
+    "file", "ai_probability", "perplexity_score", "ast_score", "codebert_score",
+    "perplexity_hotspot", "stages", "functions", "attribution", "explanation", "duplicate_of",
+    "status", "content_hash",
+]
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+STREAMING_FORMATS = ("csv", "ndjson", "sse")
+FILENAMES = {"xlsx": "resultados.xlsx", "csv": "resultados.csv"}
+XLSX_SPOOL_BYTES = int(os.getenv("SPECTRA_XLSX_SPOOL_BYTES", str(8 * 1024 * 1024)))
+CHUNK_BYTES = 64 * 1024
+
+
+def default_format() -> str:
+    try:
+        import openpyxl  # noqa: F401
+        return "xlsx"
+    except ImportError:
+        return "csv"
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False) if value else ""
+    return value
+
+
+def _cells(row: Dict[str, Any]) -> list:
+    return [_cell(row.get(column, "")) for column in COLUMNS]
+
+
+def _csv_line(values: list) -> str:
+    # Comillas y escapes del módulo csv: comas, comillas y saltos de línea en las explicaciones.
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+
+def _header(fmt: str) -> str:
+    return _csv_line(COLUMNS) if fmt == "csv" else ""
+
+
+def _encode(fmt: str, row: Dict[str, Any], seq: int) -> str:
+    if fmt == "csv":
+        return _csv_line(_cells(row))
+    data = json.dumps(row, ensure_ascii=False)
+    if fmt == "sse":
+        return f"id: {seq}\nevent: result\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def _footer(fmt: str, count: int, summary: Optional[Dict[str, Any]] = None) -> str:
+    if fmt == "sse":
+        return f"event: done\ndata: {json.dumps({'files': count, **(summary or {})}, ensure_ascii=False)}\n\n"
+    if fmt == "ndjson" and summary:
+        return json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+    return ""
+
+
+def _error(fmt: str, message: str) -> str:
+    # La respuesta ya empezó: el error se comunica dentro del propio flujo.
+    data = json.dumps({"error": message}, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: error\ndata: {data}\n\n"
+    if fmt == "ndjson":
+        return data + "\n"
+    return ""
+
+
+def iter_report(rows: Iterable[Dict[str, Any]], fmt: str, empty: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    yield _header(fmt).encode("utf-8")
+    count = 0
+    for row in rows:
+        yield _encode(fmt, row, count).encode("utf-8")
+        count += 1
+    if count == 0 and empty:
+        yield _encode(fmt, empty, 0).encode("utf-8")
+    yield _footer(fmt, count).encode("utf-8")
+
+
+async def stream_report(rows: AsyncIterable[Dict[str, Any]], fmt: str, empty: Optional[Dict[str, Any]] = None,
+                        errors: Tuple[Type[Exception], ...] = (),
+                        summary: Optional[Callable[[], Dict[str, Any]]] = None) -> AsyncIterator[bytes]:
+    # Cada fila se envía en cuanto se puntúa; nada se acumula en memoria ni en disco.
+    yield _header(fmt).encode("utf-8")
+    count = 0
+    try:
+        async for row in rows:
+            yield _encode(fmt, row, count).encode("utf-8")
+            count += 1
+    except errors as e:
+        yield _error(fmt, str(e)).encode("utf-8")
+        return
+    if count == 0 and empty:
+        yield _encode(fmt, empty, 0).encode("utf-8")
+    yield _footer(fmt, count, summary() if summary else None).encode("utf-8")
+
+
+class XlsxReport:
+    def __init__(self):
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        # Modo write-only: las filas se serializan al añadirse en lugar de quedarse en memoria.
+        self._illegal = ILLEGAL_CHARACTERS_RE
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("resultados")
+        self.sheet.append(COLUMNS)
+        self.rows = 0
+
+    def append(self, row: Dict[str, Any]):
+        self.sheet.append([self._illegal.sub("", v) if isinstance(v, str) else v for v in _cells(row)])
+        self.rows += 1
+
+    def add_summary(self, summary: Dict[str, Any]):
+        sheet = self.workbook.create_sheet("resumen")
+        for key, value in summary.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    sheet.append([f"{key}.{sub_key}", json.dumps(sub_value) if isinstance(sub_value, list) else sub_value])
+            else:
+                sheet.append([key, value])
+
+    def finish(self) -> bytes:
+        with metrics.timed("report"):
+            buf = io.BytesIO()
+            self.workbook.save(buf)
+            return buf.getvalue()
+
+    def finish_file(self):
+        # openpyxl solo genera el ZIP en save(): el libro entero se ensambla antes de enviar el primer
+        # byte, así que no es memoria constante. Se escribe a un temporal (en memoria hasta
+        # XLSX_SPOOL_BYTES, en disco a partir de ahí) que luego se envía por trozos.
+        with metrics.timed("report"):
+            f = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES)
+            try:
+                self.workbook.save(f)
+            except Exception:
+                f.close()
+                raise
+            f.seek(0)
+            return f
+
+
+def iter_file(f, chunk_size: int = CHUNK_BYTES) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+def write_report(results: Iterable[Dict[str, Any]], fmt: Optional[str] = None) -> Tuple[bytes, str, str]:
+    fmt = fmt or default_format()
+    start = time.perf_counter()
+    if fmt == "xlsx":
+        report = XlsxReport()
+        for row in results:
+            report.append(row)
+        body = report.finish()
+    else:
+        body = b"".join(iter_report(results, fmt))
+        metrics.record("report", time.perf_counter() - start)
+    return body, FORMATS[fmt], FILENAMES.get(fmt, f"resultados.{fmt}")
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+IMPORT_BUDGET_S = float(os.getenv("SPECTRA_IMPORT_BUDGET_S", "2.0"))
+WARMUP_BUDGET_S = float(os.getenv("SPECTRA_WARMUP_BUDGET_S", "60.0"))
+
+_registry: Dict[str, "LazyComponent"] = {}
+_marks: Dict[str, float] = {}
+
+
+class LazyComponent:
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._value = None
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    start = time.perf_counter()
+                    try:
+                        self._value = self.factory()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.load_seconds = round(time.perf_counter() - start, 3)
+                    self.error = None
+        return self._value
+
+
+def mark(name: str, seconds: float):
+    _marks[name] = round(seconds, 3)
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "timings": dict(_marks),
+        "components": {
+            name: {"loaded": comp.loaded, "load_seconds": comp.load_seconds, "error": comp.error}
+            for name, comp in _registry.items()
+        },
+    }
+
+
+def measure_import(module: str = "api") -> float:
+    # Proceso limpio: mide el coste real de importar el módulo sin cachés de este intérprete.
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_warmup() -> float:
+    from detectors.ensemble import EnsembleDetector
+
+    start = time.perf_counter()
+    EnsembleDetector(use_cache=False).warmup()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de importación y arranque")
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--skip-warmup", action="store_true")
+    args = parser.parse_args()
+
+    report = {"import_s": round(measure_import(args.module), 3), "import_budget_s": IMPORT_BUDGET_S}
+    if not args.skip_warmup:
+        report["warmup_s"] = round(measure_warmup(), 3)
+        report["warmup_budget_s"] = WARMUP_BUDGET_S
+    report["ok"] = report["import_s"] <= IMPORT_BUDGET_S and report.get("warmup_s", 0.0) <= WARMUP_BUDGET_S
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
@@ -1,24 +1,90 @@
 import zipfile
-from pathlib import Path
-from typing import List, Dict
-import tempfile
+from pathlib import PurePosixPath
+from typing import List, Dict, Iterator, BinaryIO, Union
+from utils import metrics
 import os
+import time
 
-def extract_python_files(zip_path: str) -> List[Dict[str, str]]:
-    files = []
+MAX_MEMBERS = int(os.getenv("SPECTRA_ZIP_MAX_MEMBERS", "100000"))
+MAX_FILE_BYTES = int(os.getenv("SPECTRA_ZIP_MAX_FILE_BYTES", "10000000"))
+MAX_TOTAL_BYTES = int(os.getenv("SPECTRA_ZIP_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+MAX_COMPRESSION_RATIO = int(os.getenv("SPECTRA_ZIP_MAX_RATIO", "200"))
+SKIP_DIRS = {"node_modules", "__MACOSX", ".git"}
+
+
+class ZipLimitError(ValueError):
+    pass
+
+
+def _is_candidate(info: zipfile.ZipInfo) -> bool:
+    if info.is_dir() or not info.filename.endswith(".py"):
+        return False
+    return not any(part in SKIP_DIRS for part in PurePosixPath(info.filename).parts)
+
+
+def check_zip(source: Union[str, BinaryIO], max_members: int = MAX_MEMBERS,
+              max_total_bytes: int = MAX_TOTAL_BYTES):
+    # Validación previa sobre el índice del ZIP, antes de empezar a responder en streaming.
+    # Los tamaños declarados pueden mentir: iter_python_files vuelve a comprobarlos al leer.
+    try:
+        with zipfile.ZipFile(source, 'r') as z:
+            infos = z.infolist()
+    except zipfile.BadZipFile:
+        return
+    if len(infos) > max_members:
+        raise ZipLimitError(f"El ZIP contiene {len(infos)} entradas (máximo {max_members}).")
+    total = sum(info.file_size for info in infos if _is_candidate(info) and info.file_size < MAX_FILE_BYTES)
+    if total > max_total_bytes:
+        raise ZipLimitError(f"El contenido Python descomprimido supera {max_total_bytes} bytes.")
+
+
+def iter_python_files(source: Union[str, BinaryIO],
+                      max_members: int = MAX_MEMBERS,
+                      max_file_bytes: int = MAX_FILE_BYTES,
+                      max_total_bytes: int = MAX_TOTAL_BYTES) -> Iterator[Dict[str, str]]:
+    try:
+        archive = zipfile.ZipFile(source, 'r')
+    except zipfile.BadZipFile:
+        return
+
+    with archive as z:
+        infos = z.infolist()
+        if len(infos) > max_members:
+            raise ZipLimitError(f"El ZIP contiene {len(infos)} entradas (máximo {max_members}).")
+
+        total = 0
+        for info in infos:
+            if not _is_candidate(info) or info.file_size >= max_file_bytes:
+                continue
+            if (info.file_size > 1024 * 1024 and info.compress_size
+                    and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO):
+                raise ZipLimitError(f"Ratio de compresión sospechoso en {info.filename}.")
+            start = time.perf_counter()
+            try:
+                with z.open(info) as fh:
+                    # El tamaño declarado puede mentir: nunca leer más del límite.
+                    data = fh.read(max_file_bytes)
+            except Exception:
+                continue
+            if len(data) >= max_file_bytes:
+                continue
+            total += len(data)
+            if total > max_total_bytes:
+                raise ZipLimitError(f"El contenido Python descomprimido supera {max_total_bytes} bytes.")
+            content = data.decode("utf-8", errors="ignore")
+            metrics.record("zip", time.perf_counter() - start)
+            metrics.FILES_TOTAL.inc()
+            metrics.BYTES_TOTAL.inc(len(data))
+            yield {"path": info.filename.lstrip("/"), "content": content}
+
+
+def count_python_files(source: Union[str, BinaryIO]) -> int:
     try:
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                z.extractall(tmpdir)
-                tmp_path = Path(tmpdir)
-                for py_file in tmp_path.rglob("*.py"):
-                    if py_file.is_file() and py_file.stat().st_size < 10_000_000:
-                        try:
-                            content = py_file.read_text(encoding="utf-8", errors="ignore")
-                            rel_path = str(py_file.relative_to(tmp_path))
-                            files.append({"path": rel_path, "content": content})
-                        except:
-                            continue
+        with zipfile.ZipFile(source, 'r') as z:
+            return sum(1 for info in z.infolist() if _is_candidate(info) and info.file_size < MAX_FILE_BYTES)
     except zipfile.BadZipFile:
-        pass
-    return files
\ No newline at end of file
+        return 0
+
+
+def extract_python_files(zip_path: str) -> List[Dict[str, str]]:
+    return list(iter_python_files(zip_path))